@@ -0,0 +1,214 @@
+"""
+Per-user artifact store
+Keeps the last generated flashcards, exam and study text for each
+user and browser session. Backed either by the artifacts table (works
+across workers and nodes) or by a sharded directory on local disk.
+"""
+import hashlib
+import json
+import os
+import random
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import session
+from flask_login import current_user
+
+from models import db, Artifact
+
+
+class DatabaseArtifactBackend:
+    """Artifacts stored as rows in the artifacts table"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def _row(self, user_id, session_key, name):
+        return Artifact.query.filter_by(
+            user_id=user_id, session_key=session_key, name=name
+        ).first()
+
+    def write(self, user_id, session_key, name, payload):
+        now = datetime.utcnow()
+        row = self._row(user_id, session_key, name)
+        if row is None:
+            row = Artifact(user_id=user_id, session_key=session_key,
+                           name=name, version=0)
+            db.session.add(row)
+        row.payload = payload
+        row.version = (row.version or 0) + 1
+        row.updated_at = now
+        row.expires_at = now + self.ttl
+        db.session.commit()
+
+    def version(self, user_id, session_key, name):
+        row = db.session.query(Artifact.version, Artifact.expires_at).filter_by(
+            user_id=user_id, session_key=session_key, name=name
+        ).first()
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None
+        return row.version
+
+    def read(self, user_id, session_key, name):
+        row = self._row(user_id, session_key, name)
+        if row is None or row.expires_at <= datetime.utcnow():
+            return None, None
+        return row.version, row.payload
+
+    def delete_user(self, user_id):
+        Artifact.query.filter_by(user_id=user_id).delete()
+        db.session.commit()
+
+    def purge_expired(self):
+        deleted = Artifact.query.filter(
+            Artifact.expires_at <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
+
+
+class DiskArtifactBackend:
+    """Artifacts stored as files under root/<shard>/<user_id>/<session>/"""
+
+    def __init__(self, ttl, root='/tmp/artifacts'):
+        self.ttl = ttl
+        self.root = root
+
+    def _user_dir(self, user_id):
+        shard = hashlib.sha1(str(user_id).encode()).hexdigest()[:2]
+        return os.path.join(self.root, shard, str(user_id))
+
+    def _path(self, user_id, session_key, name):
+        return os.path.join(self._user_dir(user_id), session_key, f'{name}.json')
+
+    def write(self, user_id, session_key, name, payload):
+        path = self._path(user_id, session_key, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def version(self, user_id, session_key, name):
+        try:
+            stat = os.stat(self._path(user_id, session_key, name))
+        except FileNotFoundError:
+            return None
+        if stat.st_mtime + self.ttl.total_seconds() <= time.time():
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read(self, user_id, session_key, name):
+        version = self.version(user_id, session_key, name)
+        if version is None:
+            return None, None
+        try:
+            with open(self._path(user_id, session_key, name), 'r',
+                      encoding='utf-8') as f:
+                return version, f.read()
+        except FileNotFoundError:
+            return None, None
+
+    def delete_user(self, user_id):
+        shutil.rmtree(self._user_dir(user_id), ignore_errors=True)
+
+    def purge_expired(self):
+        deleted = 0
+        cutoff = time.time() - self.ttl.total_seconds()
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    if os.path.getmtime(path) <= cutoff:
+                        os.remove(path)
+                        deleted += 1
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+
+class ArtifactStore:
+    """Keyed store scoped to the current user and browser session"""
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.max_cached = 128
+        self.purge_probability = 0.01
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        ttl = timedelta(seconds=app.config.get('ARTIFACT_TTL', 24 * 3600))
+        backend = app.config.get('ARTIFACT_BACKEND', 'database')
+        if backend == 'disk':
+            self.backend = DiskArtifactBackend(
+                ttl, app.config.get('ARTIFACT_DIR', '/tmp/artifacts')
+            )
+        elif backend == 'database':
+            self.backend = DatabaseArtifactBackend(ttl)
+        else:
+            raise ValueError(f"Unknown ARTIFACT_BACKEND: {backend}")
+        self.max_cached = app.config.get('ARTIFACT_CACHE_SIZE', 128)
+
+    @staticmethod
+    def current_scope():
+        """(user_id, session_key) for the logged-in user's browser session"""
+        session_key = session.get('artifact_session')
+        if not session_key:
+            session_key = secrets.token_hex(16)
+            session['artifact_session'] = session_key
+        return current_user.id, session_key
+
+    def put(self, name, value, scope=None):
+        user_id, session_key = scope or self.current_scope()
+        self.backend.write(user_id, session_key, name, json.dumps(value))
+        with self._lock:
+            self._cache.pop((user_id, session_key, name), None)
+        # Expired artifacts are ignored on read; physically remove them now and then
+        if random.random() < self.purge_probability:
+            try:
+                self.purge_expired()
+            except Exception as e:
+                print(f"Artifact purge error: {e}")
+
+    def get(self, name, default=None, scope=None):
+        user_id, session_key = scope or self.current_scope()
+        key = (user_id, session_key, name)
+
+        # Only re-read the payload when another worker has replaced it
+        version = self.backend.version(user_id, session_key, name)
+        if version is None:
+            return default
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == version:
+                self._cache.move_to_end(key)
+                return cached[1]
+
+        version, payload = self.backend.read(user_id, session_key, name)
+        if payload is None:
+            return default
+        value = json.loads(payload)
+        with self._lock:
+            self._cache[key] = (version, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return value
+
+    def delete_user(self, user_id):
+        self.backend.delete_user(user_id)
+        with self._lock:
+            for key in [k for k in self._cache if k[0] == user_id]:
+                del self._cache[key]
+
+    def purge_expired(self):
+        return self.backend.purge_expired()
@@ -1,68 +1,216 @@
 """
-Backup database to JSON file
+Backup every table to gzip-compressed NDJSON, one file per table
+Rows are streamed with a server-side cursor (yield_per), so memory use
+stays flat however large the tables are. Each backup is a directory with
+<table>.ndjson.gz files and a manifest.json that records row counts and
+per-table high-water marks. --incremental then only exports rows past the
+marks of the last backup:
+    tables with updated_at            rows updated since the last run
+    append-only tables (APPEND_ONLY)  rows created since the last run
+    anything else                     copied in full every time
+Marks are timestamps the app assigns before commit, so a row can commit
+after a backup's snapshot with a time older than that backup's mark (the
+same goes for ids on PostgreSQL). Each incremental therefore re-reads
+BACKUP_OVERLAP_MINUTES (default 15) before every mark, which covers
+transactions open for up to that long. Consecutive backups can hold the
+same row; restore each table oldest backup first and keep the last copy
+of every primary key.
+Deletes are not carried by incremental backups; take a full one regularly.
+Usage:
+    python backup_db.py                   full backup into backups/<timestamp>/
+    python backup_db.py --incremental     changes since the last backup
+    python backup_db.py --dir /mnt/backups
+    python backup_db.py --tables users,chat_messages
 """
-from web_app import app
-from models import db, User, FlashcardSet, ExamResult, StudySession, ChatMessage
+import gzip
 import json
-from datetime import datetime
-
-print("="*50)
-print("DATABASE BACKUP")
-print("="*50)
-
-with app.app_context():
-    backup_data = {
-        'backup_date': datetime.now().isoformat(),
-        'users': [],
-        'flashcard_sets': [],
-        'exam_results': [],
-        'study_sessions': [],
-        'chat_messages': []
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from web_app import app
+from models import db
+
+BATCH = 2000
+
+# Incrementals re-export rows marked this long before the last mark
+OVERLAP = timedelta(minutes=int(os.getenv('BACKUP_OVERLAP_MINUTES', '15')))
+
+# Rows in these tables are inserted but never updated in place
+# (page_views is not: deleting an account detaches its views)
+APPEND_ONLY = {'flashcard_sets', 'exam_results', 'study_sessions',
+               'chat_messages'}
+
+
+def option(name):
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return None
+
+
+def to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def mark_text(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def mark_column(table):
+    """(column, inclusive) used for incremental export, or None"""
+    if 'updated_at' in table.c:
+        # Inclusive: rows updated in the same instant as the mark are
+        # exported again rather than missed
+        return table.c.updated_at, True
+    if table.name in APPEND_ONLY and 'created_at' in table.c:
+        return table.c.created_at, True
+    return None
+
+
+def parse_mark(column, entry):
+    """The datetime mark from a manifest entry, None if it used another column"""
+    if entry.get('mark') is None or entry.get('mark_column') != column.name:
+        return None
+    return datetime.fromisoformat(entry['mark'])
+
+
+def previous_marks(root):
+    """
+    (name of the newest complete backup, {table: manifest entry}) with
+    each table's entry from the newest backup that included it, back to
+    the last full backup of every table. (None, {}) if there is none.
+    """
+    if not os.path.isdir(root):
+        return None, {}
+    newest, marks = None, {}
+    for name in sorted(os.listdir(root), reverse=True):
+        path = os.path.join(root, name, 'manifest.json')
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        newest = newest or manifest['name']
+        for table, entry in manifest['tables'].items():
+            marks.setdefault(table, entry)
+        if manifest['kind'] == 'full' and not manifest.get('only'):
+            break
+    return newest, marks
+
+
+def dump_table(conn, table, path, since=None):
+    """Stream table rows past `since` into path; returns (rows, new mark)"""
+    query = select(table)
+    marker = mark_column(table)
+    mark = since
+    if marker is not None and since is not None:
+        column, inclusive = marker
+        query = query.where(column >= since if inclusive else column > since)
+
+    rows = 0
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as f:
+        result = conn.execution_options(yield_per=BATCH).execute(query)
+        for row in result.mappings():
+            f.write(json.dumps(dict(row), default=to_json, separators=(',', ':')))
+            f.write('\n')
+            rows += 1
+            if marker is not None:
+                value = row[marker[0].name]
+                if value is not None and (mark is None or value > mark):
+                    mark = value
+    return rows, mark
+
+
+def backup(root, incremental=False, only=None):
+    base, marks = previous_marks(root) if incremental else (None, {})
+    if incremental and base is None:
+        print("ℹ️  No earlier backup found, taking a full backup")
+    kind = 'incremental' if base else 'full'
+
+    name = datetime.utcnow().strftime('%Y%m%d_%H%M%S') + f'_{kind}'
+    target = os.path.join(root, name)
+    partial = target + '.partial'
+    os.makedirs(partial)
+
+    manifest = {
+        'created_at': datetime.utcnow().isoformat(),
+        'kind': kind,
+        'base': base,
+        'name': name,
+        'only': sorted(only) if only else None,
+        'dialect': db.engine.dialect.name,
+        'tables': {},
     }
-    
-    # Backup users
-    users = User.query.all()
-    for user in users:
-        backup_data['users'].append({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'created_at': user.created_at.isoformat()
-        })
-    
-    # Backup flashcard sets
-    sets = FlashcardSet.query.all()
-    for s in sets:
-        backup_data['flashcard_sets'].append({
-            'id': s.id,
-            'user_id': s.user_id,
-            'name': s.name,
-            'card_count': s.card_count,
-            'difficulty': s.difficulty,
-            'created_at': s.created_at.isoformat()
-        })
-    
-    # Backup exam results
-    exams = ExamResult.query.all()
-    for exam in exams:
-        backup_data['exam_results'].append({
-            'id': exam.id,
-            'user_id': exam.user_id,
-            'exam_name': exam.exam_name,
-            'score': exam.score,
-            'total_questions': exam.total_questions,
-            'percentage': exam.percentage,
-            'time_taken': exam.time_taken,
-            'created_at': exam.created_at.isoformat()
-        })
-    
-    # Save backup
-    filename = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(filename, 'w') as f:
-        json.dump(backup_data, f, indent=2)
-    
-    print(f"✅ Backup saved: {filename}")
-    print(f"✅ Users: {len(backup_data['users'])}")
-    print(f"✅ Flashcard Sets: {len(backup_data['flashcard_sets'])}")
-    print(f"✅ Exam Results: {len(backup_data['exam_results'])}")
-    print("="*50)
\ No newline at end of file
+
+    tables = [t for t in db.metadata.sorted_tables if not only or t.name in only]
+    started = time.perf_counter()
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            # One snapshot for every table, so rows and marks agree
+            conn = conn.execution_options(isolation_level='REPEATABLE READ')
+        with conn.begin():
+            for table in tables:
+                marker = mark_column(table)
+                since = previous = None
+                if marker is not None and table.name in marks:
+                    since = previous = parse_mark(marker[0], marks[table.name])
+                    if since is not None:
+                        since -= OVERLAP
+
+                table_started = time.perf_counter()
+                filename = f'{table.name}.ndjson.gz'
+                rows, mark = dump_table(
+                    conn, table, os.path.join(partial, filename), since
+                )
+                if previous is not None and mark < previous:
+                    # Nothing new past the overlap: keep the old mark
+                    mark = previous
+                manifest['tables'][table.name] = {
+                    'file': filename,
+                    'rows': rows,
+                    'mark_column': marker[0].name if marker else None,
+                    'mark': mark_text(mark),
+                    'since': mark_text(since),
+                }
+                scope = f"since {mark_text(since)}" if since is not None else 'full'
+                print(f"✅ {table.name}: {rows:,} rows ({scope}, "
+                      f"{time.perf_counter() - table_started:.1f}s)")
+
+    with open(os.path.join(partial, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    # Only complete backups get their final name (and count as a base)
+    os.replace(partial, target)
+    return target, manifest, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    print("="*50)
+    print("DATABASE BACKUP")
+    print("="*50)
+
+    root = option('--dir') or 'backups'
+    only = set(option('--tables').split(',')) if option('--tables') else None
+
+    with app.app_context():
+        if only:
+            unknown = only - set(db.metadata.tables)
+            if unknown:
+                print(f"❌ Unknown tables: {', '.join(sorted(unknown))}")
+                sys.exit(1)
+        target, manifest, elapsed = backup(
+            root, incremental='--incremental' in sys.argv, only=only
+        )
+
+    total_rows = sum(t['rows'] for t in manifest['tables'].values())
+    size = sum(os.path.getsize(os.path.join(target, f)) for f in os.listdir(target))
+    print("="*50)
+    print(f"✅ {manifest['kind'].capitalize()} backup saved: {target}")
+    print(f"✅ {len(manifest['tables'])} tables, {total_rows:,} rows, "
+          f"{size / 1024 / 1024:.1f} MB in {elapsed:.1f}s")
+    print("="*50)
@@ -0,0 +1,379 @@
+"""
+Micro-benchmarks for the CPU hot paths
+Times the card parsers, PDF extraction, the stats reads and the
+/analytics aggregation on synthetic data: large model responses, a
+multi-hundred-page PDF and a user with 100k study sessions. Results are
+saved per commit in bench_results/ and compared with an earlier run, so
+regressions show up and optimizations can be proven.
+Usage:
+    python benchmark.py                  run everything, compare with the last run
+    python benchmark.py parse pdf        only benchmarks whose name contains a word
+    python benchmark.py --compare abc123 compare with the run saved for commit abc123
+    python benchmark.py --quick          smaller inputs, fewer repeats
+    python benchmark.py --database postgresql://localhost/flashcards_bench
+"""
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+QUICK = '--quick' in sys.argv
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_results')
+REGRESSION = 0.15    # flag benchmarks more than 15% slower than the baseline
+
+
+def option(name):
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return None
+
+
+WORKDIR = tempfile.mkdtemp(prefix='flashcards_bench_')
+# Must be set before web_app reads its configuration
+os.environ['DATABASE_URL'] = option('--database') or 'sqlite:///' + os.path.join(
+    WORKDIR, 'bench.db'
+)
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('LLM_BACKEND', 'fake')
+
+from web_app import app, analytics_data
+from models import (db, User, FlashcardSet, ExamResult, StudySession,
+                    rebuild_user_stats, rebuild_set_performance,
+                    compute_user_stats, compute_streaks)
+from card_parser import (parse_flashcards, parse_mcqs, parse_generated,
+                         FlashcardStreamParser)
+from pdf_extract import extract_pdf_text
+
+CARDS = 500 if QUICK else 2000
+MCQS = 250 if QUICK else 1000
+PDF_PAGES = 60 if QUICK else 300
+SESSIONS = 10000 if QUICK else 100000
+REPEAT = 3 if QUICK else 5
+
+WORDS = ('cell membrane protein energy enzyme reaction gradient transport '
+         'molecule structure function process cycle system signal pathway '
+         'theory evidence model example result factor change stage').split()
+
+
+# -- synthetic data ------------------------------------------------------------
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def flashcard_response(n, rng):
+    """Q1:/A1: output with a multi-line answer on every third card"""
+    cards = []
+    for i in range(1, n + 1):
+        answer = sentence(rng, 18)
+        if i % 3 == 0:
+            answer += '\n' + sentence(rng, 10) + '\n' + sentence(rng, 8)
+        cards.append(f"Q{i}: {sentence(rng, 10)[:-1]}?\nA{i}: {answer}")
+    return 'Here are your flashcards:\n\n' + '\n\n'.join(cards) + '\n'
+
+
+def mcq_response(n, rng):
+    questions = []
+    for i in range(1, n + 1):
+        options = ''.join(
+            f"{letter}) {sentence(rng, 6)}\n" for letter in 'ABCD'
+        )
+        questions.append(
+            f"Q{i}: {sentence(rng, 12)[:-1]}?\n{options}"
+            f"CORRECT: {rng.choice('ABCD')}"
+        )
+    return '\n\n'.join(questions) + '\n'
+
+
+def json_flashcards(n, rng):
+    return json.dumps([
+        {'question': sentence(rng, 10)[:-1] + '?', 'answer': sentence(rng, 18)}
+        for _ in range(n)
+    ])
+
+
+def json_mcqs(n, rng):
+    return json.dumps([{
+        'question': sentence(rng, 12)[:-1] + '?',
+        'options': {letter: sentence(rng, 6) for letter in 'ABCD'},
+        'correct': rng.choice('ABCD'),
+    } for _ in range(n)])
+
+
+def make_pdf(path, pages, rng, lines_per_page=40):
+    """Minimal uncompressed PDF with a page of Helvetica text per page"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = ' '.join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    font = 3 + 2 * pages
+    for i in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 {font} 0 R >> >> >>".encode()
+        )
+        lines = [f"Page {i + 1}"] + [sentence(rng, 11) for _ in range(lines_per_page)]
+        text = ' T* '.join(f"({line})Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 12 TL 50 760 Td {text} ET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) +
+                       stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % (i + 1) + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += (b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (len(objects) + 1, xref))
+    with open(path, 'wb') as f:
+        f.write(out)
+
+
+def seed_heavy_user(rng):
+    """One user with SESSIONS study sessions over two years, plus exams"""
+    now = datetime.utcnow()
+    user = User(username='bench', email='bench@example.com')
+    user.set_password('bench')
+    db.session.add(user)
+    db.session.commit()
+
+    def when(days=730):
+        return now - timedelta(minutes=rng.randint(0, days * 24 * 60))
+
+    sets = [{'user_id': user.id, 'name': f'Set {i}', 'card_count': 10,
+             'difficulty': rng.choice(['easy', 'medium', 'hard']),
+             'created_at': when()} for i in range(500)]
+    db.session.execute(FlashcardSet.__table__.insert(), sets)
+    set_ids = [row.id for row in FlashcardSet.query.with_entities(FlashcardSet.id)]
+
+    db.session.execute(ExamResult.__table__.insert(), [{
+        'user_id': user.id, 'flashcard_set_id': rng.choice(set_ids),
+        'exam_name': f'Exam {i}', 'score': 7, 'total_questions': 10,
+        'percentage': rng.uniform(30, 100),
+        'difficulty': rng.choice(['easy', 'medium', 'hard']),
+        'time_taken': rng.randint(60, 900), 'created_at': when()
+    } for i in range(2000)])
+
+    batch = 20000
+    for start in range(0, SESSIONS, batch):
+        db.session.execute(StudySession.__table__.insert(), [{
+            'user_id': user.id,
+            'activity_type': rng.choice(['flashcard', 'exam']),
+            'duration_minutes': rng.randint(1, 60),
+            # Recent days are denser, like a real active user
+            'created_at': when(90 if i % 2 else 730)
+        } for i in range(start, min(start + batch, SESSIONS))])
+    db.session.commit()
+
+    rebuild_user_stats([user.id])
+    rebuild_set_performance([user.id])
+    return user.id
+
+
+# -- harness -------------------------------------------------------------------
+
+def measure(fn):
+    """Seconds per call: repeat timings, each long enough to be stable"""
+    started = time.perf_counter()
+    fn()
+    once = time.perf_counter() - started
+    number = max(1, int(0.1 / once)) if once > 0 else 1000
+    samples = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+    return samples
+
+
+def benchmarks(user_id):
+    """(name, size description, function) for every benchmark"""
+    rng = random.Random(0)
+    flashcards = flashcard_response(CARDS, rng)
+    mcqs = mcq_response(MCQS, rng)
+    flashcards_json = json_flashcards(CARDS, rng)
+    mcqs_json = json_mcqs(MCQS, rng)
+    pdf_path = os.path.join(WORKDIR, 'bench.pdf')
+    make_pdf(pdf_path, PDF_PAGES, rng)
+
+    def stream_parse():
+        parser = FlashcardStreamParser()
+        for i in range(0, len(flashcards), 40):
+            parser.feed(flashcards[i:i + 40])
+        parser.close()
+
+    def fresh(fn):
+        # Start from an empty identity map, as a new request would
+        def run():
+            db.session.expunge_all()
+            return fn()
+        return run
+
+    today = datetime.utcnow().date()
+    kb = lambda text: f"{len(text) // 1024} KB"
+
+    return [
+        ('parse_flashcards', f"{CARDS} cards, {kb(flashcards)}",
+         lambda: parse_flashcards(flashcards)),
+        ('parse_flashcards_stream', f"{CARDS} cards in 40-char chunks",
+         stream_parse),
+        ('parse_mcqs', f"{MCQS} questions, {kb(mcqs)}",
+         lambda: parse_mcqs(mcqs)),
+        ('parse_generated_json_flashcards', f"{CARDS} items, {kb(flashcards_json)}",
+         lambda: parse_generated(flashcards_json, 'flashcards')),
+        ('parse_generated_json_mcqs', f"{MCQS} items, {kb(mcqs_json)}",
+         lambda: parse_generated(mcqs_json, 'exam')),
+        ('extract_pdf_serial', f"{PDF_PAGES} pages",
+         lambda: extract_pdf_text(pdf_path, parallel_threshold=0)),
+        ('extract_pdf_parallel', f"{PDF_PAGES} pages",
+         lambda: extract_pdf_text(pdf_path, parallel_threshold=1)),
+        ('user_get_stats', f"{SESSIONS} sessions",
+         fresh(lambda: db.session.get(User, user_id).get_stats())),
+        ('user_calculate_streak', f"{SESSIONS} sessions",
+         fresh(lambda: db.session.get(User, user_id).calculate_streak())),
+        ('compute_user_stats', f"{SESSIONS} sessions",
+         fresh(lambda: compute_user_stats([user_id]))),
+        ('compute_streaks', f"{SESSIONS} sessions",
+         fresh(lambda: compute_streaks([user_id]))),
+        ('analytics_data', f"{SESSIONS} sessions",
+         fresh(lambda: analytics_data(user_id, today))),
+    ]
+
+
+# -- results -------------------------------------------------------------------
+
+def current_commit():
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], text=True, cwd=repo,
+            stderr=subprocess.DEVNULL
+        ).strip()
+        dirty = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], text=True,
+            cwd=repo, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f'{commit}-dirty' if dirty else commit
+
+
+def results_path(commit):
+    suffix = '-quick' if QUICK else ''
+    return os.path.join(RESULTS_DIR, f'{commit}{suffix}.json')
+
+
+def load_baseline(commit):
+    """Run saved for --compare REF, else the latest run of another commit"""
+    wanted = option('--compare')
+    if wanted:
+        path = results_path(wanted)
+        if not os.path.exists(path):
+            print(f"❌ No saved results for {wanted} ({path})")
+            sys.exit(1)
+    else:
+        suffix = '-quick.json' if QUICK else '.json'
+        candidates = [
+            os.path.join(RESULTS_DIR, name) for name in os.listdir(RESULTS_DIR)
+            if name.endswith(suffix) and (QUICK or not name.endswith('-quick.json'))
+            and name != os.path.basename(results_path(commit))
+        ] if os.path.isdir(RESULTS_DIR) else []
+        if not candidates:
+            return None
+        path = max(candidates, key=os.path.getmtime)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+if __name__ == '__main__':
+    filters = [a for i, a in enumerate(sys.argv[1:], 1)
+               if not a.startswith('--') and sys.argv[i - 1] not in ('--compare', '--database')]
+
+    print("="*50)
+    print("MICRO-BENCHMARKS" + (" (quick)" if QUICK else ""))
+    print("="*50)
+
+    commit = current_commit()
+    with app.app_context():
+        db.create_all()
+        if User.query.count():
+            print("❌ Database is not empty. Point --database at a scratch database.")
+            sys.exit(1)
+
+        print(f"🗄️  Seeding {SESSIONS} study sessions on {db.engine.dialect.name}...")
+        user_id = seed_heavy_user(random.Random(1))
+
+        results = {}
+        try:
+            for name, size, fn in benchmarks(user_id):
+                if filters and not any(f in name for f in filters):
+                    continue
+                samples = measure(fn)
+                results[name] = {
+                    'size': size,
+                    'median': statistics.median(samples),
+                    'min': min(samples),
+                }
+                print(f"⏱️  {name:<34} {results[name]['median'] * 1000:10.3f} ms   ({size})")
+        finally:
+            db.session.rollback()
+            db.drop_all()
+
+    baseline = load_baseline(commit)
+    regressions = []
+    if baseline:
+        print("\n" + "="*50)
+        print(f"COMPARED WITH {baseline['commit']}")
+        print("="*50)
+        for name, result in results.items():
+            before = baseline['results'].get(name)
+            if not before:
+                print(f"🆕 {name}")
+                continue
+            change = result['median'] / before['median'] - 1
+            mark = '✅'
+            if change > REGRESSION:
+                mark = '❌'
+                regressions.append(name)
+            elif change < -REGRESSION:
+                mark = '🚀'
+            print(f"{mark} {name:<34} {change * 100:+7.1f}%")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    saved = {}
+    path = results_path(commit)
+    if os.path.exists(path):
+        # Keep results of benchmarks that were filtered out this time
+        with open(path, 'r', encoding='utf-8') as f:
+            saved = json.load(f).get('results', {})
+    saved.update(results)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'database': os.environ['DATABASE_URL'].split(':', 1)[0],
+            'results': saved,
+        }, f, indent=2)
+
+    print("\n" + "="*50)
+    print(f"💾 Saved to {os.path.relpath(path)}")
+    if regressions:
+        print(f"❌ {len(regressions)} regressions over {REGRESSION:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ No regressions")
@@ -0,0 +1,428 @@
+"""
+Parsers for generated flashcards and MCQs
+The stream parsers accept Q1:/A1: text in arbitrary pieces via feed() and
+return the items completed so far, so cards can be shown while the model
+is still writing. parse_flashcards() / parse_mcqs() parse a whole response.
+parse_generated() handles schema-constrained JSON output, validating each
+item and falling back to the text parsers when the output is not JSON;
+JSONStreamParser does the same for a streamed JSON array.
+"""
+import json
+import re
+from typing import Annotated, Literal
+
+from pydantic import (BeforeValidator, StringConstraints, TypeAdapter,
+                      ValidationError)
+# pydantic needs the typing_extensions version before Python 3.12
+from typing_extensions import TypedDict
+
+QUESTION_RE = re.compile(r'^\**Q\d*\s*[:.]\**\s*(.*)$')
+ANSWER_RE = re.compile(r'^\**A\d*\s*:\**\s*(.*)$')
+OPTION_RE = re.compile(r'^\**([A-D])[).]\**\s*(.*)$')
+CORRECT_RE = re.compile(r'^\**CORRECT\s*:\**\s*\(?([A-D])\b', re.IGNORECASE)
+
+
+class _LineParser:
+    """Splits fed text into complete lines"""
+
+    def __init__(self):
+        self._buffer = ''
+
+    def feed(self, text):
+        """Add text; returns the items completed by it"""
+        if '\n' not in text:
+            self._buffer += text
+            return []
+        # One split per feed keeps whole-response parsing linear
+        lines = (self._buffer + text).split('\n')
+        self._buffer = lines.pop()
+        items = []
+        for line in lines:
+            item = self._line(line.strip())
+            if item is not None:
+                items.append(item)
+        return items
+
+    def close(self):
+        """End of output; returns the remaining complete items"""
+        items = []
+        if self._buffer:
+            item = self._line(self._buffer.strip())
+            self._buffer = ''
+            if item is not None:
+                items.append(item)
+        item = self._finish()
+        if item is not None:
+            items.append(item)
+        return items
+
+    def _line(self, line):
+        raise NotImplementedError
+
+    def _finish(self):
+        raise NotImplementedError
+
+
+class FlashcardStreamParser(_LineParser):
+    """
+    Q1:/A1: cards. A card closes at the next question, at a blank line
+    after its answer, or at the end of output; lines in between extend
+    the question or answer, so multi-line answers are kept. Questions
+    without an answer are counted in `dropped`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.dropped = 0
+        self.question = None
+        self.answer = None
+
+    def _emit(self):
+        card = None
+        if self.question and self.answer:
+            card = {'question': self.question, 'answer': self.answer}
+        elif self.question is not None:
+            self.dropped += 1
+        self.question = self.answer = None
+        return card
+
+    def _line(self, line):
+        match = QUESTION_RE.match(line)
+        if match:
+            card = self._emit()
+            self.question = match.group(1).strip()
+            return card
+
+        match = ANSWER_RE.match(line)
+        if match and self.question is not None:
+            self.answer = match.group(1).strip()
+            return None
+
+        if not line:
+            return self._emit() if self.answer else None
+        if self.answer is not None:
+            self.answer = f"{self.answer}\n{line}" if self.answer else line
+        elif self.question is not None:
+            self.question = f"{self.question} {line}" if self.question else line
+        return None
+
+    def _finish(self):
+        return self._emit()
+
+
+class MCQStreamParser(_LineParser):
+    """
+    Q1: question, options A) to D), then CORRECT: <letter>. A question
+    closes as soon as its CORRECT line arrives; questions without four
+    options or a valid answer are dropped and counted in `dropped`.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.dropped = 0
+        self._reset()
+
+    def _reset(self):
+        self.question = None
+        self.options = {}
+        self.last_option = None
+
+    def _line(self, line):
+        match = QUESTION_RE.match(line)
+        if match:
+            if self.question is not None:
+                # Previous question never got a CORRECT line
+                self.dropped += 1
+            self._reset()
+            self.question = match.group(1).strip()
+            return None
+        if self.question is None:
+            return None
+
+        match = CORRECT_RE.match(line)
+        if match:
+            correct = match.group(1).upper()
+            mcq = None
+            if len(self.options) == 4 and correct in self.options:
+                mcq = {
+                    'question': self.question,
+                    'options': self.options,
+                    'correct': correct
+                }
+            else:
+                self.dropped += 1
+            self._reset()
+            return mcq
+
+        match = OPTION_RE.match(line)
+        if match:
+            self.last_option = match.group(1)
+            self.options[self.last_option] = match.group(2).strip()
+        elif line:
+            # Wrapped question or option text
+            if self.last_option:
+                self.options[self.last_option] += f" {line}"
+            else:
+                self.question = f"{self.question} {line}".strip()
+        return None
+
+    def _finish(self):
+        if self.question is not None:
+            self.dropped += 1
+        self._reset()
+        return None
+
+
+def parse_flashcards(text):
+    parser = FlashcardStreamParser()
+    return parser.feed(text) + parser.close()
+
+
+def parse_mcqs(text):
+    parser = MCQStreamParser()
+    return parser.feed(text) + parser.close()
+
+
+# -- JSON output ---------------------------------------------------------------
+
+# Response schemas in the OpenAPI subset Gemini accepts for response_schema
+FLASHCARDS_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'question': {'type': 'string'},
+            'answer': {'type': 'string'},
+        },
+        'required': ['question', 'answer'],
+    },
+}
+
+MCQS_SCHEMA = {
+    'type': 'array',
+    'items': {
+        'type': 'object',
+        'properties': {
+            'question': {'type': 'string'},
+            'options': {
+                'type': 'object',
+                'properties': {letter: {'type': 'string'} for letter in 'ABCD'},
+                'required': list('ABCD'),
+            },
+            'correct': {'type': 'string', 'enum': list('ABCD')},
+        },
+        'required': ['question', 'options', 'correct'],
+    },
+}
+
+Text = Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]
+Letter = Annotated[
+    Literal['A', 'B', 'C', 'D'],
+    BeforeValidator(lambda v: v.strip().strip('()').upper()
+                    if isinstance(v, str) else v)
+]
+
+
+class Flashcard(TypedDict):
+    question: Text
+    answer: Text
+
+
+class MCQOptions(TypedDict):
+    A: Text
+    B: Text
+    C: Text
+    D: Text
+
+
+class MCQ(TypedDict):
+    question: Text
+    options: MCQOptions
+    correct: Letter
+
+
+VALIDATORS = {
+    'flashcards': TypeAdapter(Flashcard),
+    'exam': TypeAdapter(MCQ),
+}
+
+TEXT_PARSERS = {
+    'flashcards': FlashcardStreamParser,
+    'exam': MCQStreamParser,
+}
+
+
+def _json_items(text):
+    """
+    Elements of the JSON array in text, or None if it is not JSON. An array
+    cut off mid-way (e.g. at the output token limit) yields the elements
+    that were complete plus None for the truncated tail.
+    """
+    text = text.strip()
+    if text.startswith('```'):
+        text = text.strip('`')
+        text = text[text.find('\n') + 1:] if '\n' in text else ''
+    decoder = json.JSONDecoder()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    else:
+        if isinstance(data, dict):
+            # {"flashcards": [...]} and similar wrappers
+            data = next((v for v in data.values() if isinstance(v, list)), None)
+        return data if isinstance(data, list) else None
+
+    if not text.startswith('['):
+        return None
+    items, pos = [], 1
+    while True:
+        while pos < len(text) and text[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(text) or text[pos] == ']':
+            return items
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            items.append(None)
+            return items
+        items.append(item)
+
+
+def parse_generated(text, kind):
+    """
+    (items, dropped) for a generation response of kind 'flashcards' or
+    'exam'. JSON output is validated item by item; anything that is not
+    JSON goes through the text parser instead.
+    """
+    raw = _json_items(text or '')
+    if raw is None:
+        parser = TEXT_PARSERS[kind]()
+        items = parser.feed(text or '') + parser.close()
+        return items, parser.dropped
+
+    validator = VALIDATORS[kind]
+    items, dropped = [], 0
+    for item in raw:
+        try:
+            items.append(validator.validate_python(item))
+        except ValidationError:
+            dropped += 1
+    return items, dropped
+
+
+class JSONStreamParser:
+    """
+    Elements of a streamed JSON array, each validated as soon as it
+    closes. Output that is not an array goes to the text parser, or, for
+    a wrapping object, through parse_generated() at the end. Invalid and
+    truncated elements are counted in `dropped`.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.dropped = 0
+        self._mode = None
+        self._pending = ''
+        self._fallback = None
+        self._element = ''
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._ended = False
+
+    def feed(self, text):
+        """Add text; returns the items completed by it"""
+        if self._mode is None:
+            self._pending += text
+            return self._start(final=False)
+        if self._mode == 'array':
+            return self._scan(text)
+        if self._mode == 'text':
+            return self._fallback.feed(text)
+        self._pending += text
+        return []
+
+    def close(self):
+        """End of output; returns the remaining complete items"""
+        items = self._start(final=True) if self._mode is None else []
+        if self._mode == 'array':
+            if self._depth:
+                # Cut off mid-element, e.g. at the output token limit
+                self.dropped += 1
+        elif self._mode == 'text':
+            items += self._fallback.close()
+            self.dropped += self._fallback.dropped
+        else:
+            whole, dropped = parse_generated(self._pending, self.kind)
+            items += whole
+            self.dropped += dropped
+        return items
+
+    def _start(self, final):
+        """Pick the mode once the first significant character is in"""
+        text = self._pending.lstrip()
+        if not final and (not text or '```'.startswith(text)):
+            return []
+        if text.startswith('```'):
+            if '\n' not in text and not final:
+                return []
+            # Markdown fence around the JSON
+            text = text[text.find('\n') + 1:].lstrip() if '\n' in text else ''
+            if not text and not final:
+                return []
+
+        self._pending = ''
+        if text.startswith('['):
+            self._mode = 'array'
+            return self._scan(text[1:])
+        if text.startswith('{'):
+            self._mode = 'object'
+            self._pending = text
+            return []
+        self._mode = 'text'
+        self._fallback = TEXT_PARSERS[self.kind]()
+        return self._fallback.feed(text)
+
+    def _scan(self, text):
+        items = []
+        if self._ended:
+            return items
+        start = 0
+        for i, ch in enumerate(text):
+            if self._depth == 0:
+                if ch in '{[':
+                    start = i
+                    self._depth = 1
+                elif ch == ']':
+                    self._ended = True
+                    return items
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._validate(self._element + text[start:i + 1])
+                    self._element = ''
+                    if item is not None:
+                        items.append(item)
+        if self._depth:
+            self._element += text[start:]
+        return items
+
+    def _validate(self, raw):
+        try:
+            return VALIDATORS[self.kind].validate_python(json.loads(raw))
+        except (ValueError, ValidationError):
+            self.dropped += 1
+            return None
@@ -0,0 +1,192 @@
+"""
+Token-bounded conversation context for the AI Study Buddy
+Prompts get the turns not yet summarized verbatim (newest first, within a
+token budget) plus a rolling summary of everything older. The summary
+lives in the chat_summaries table and is extended in the background,
+summary_batch aged-out turns per call, so both the chat prompt and the
+summarization prompt stay flat however long a chat runs.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from models import db, ChatMessage, ChatSummary
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token for English text)"""
+    return (len(text or '') + 3) // 4
+
+
+def clip_to_tokens(text, tokens):
+    """Cut text to about `tokens` tokens, marking the cut"""
+    text = text or ''
+    max_chars = max(0, tokens) * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 3)].rstrip() + '...'
+
+
+class ChatContext:
+    """Builds bounded chat history and maintains per-user summaries"""
+
+    def __init__(self, app=None, summarizer=None):
+        self.app = None
+        # summarizer(previous_summary, transcript) -> new summary text
+        self.summarizer = summarizer
+        self.history_tokens = 1500
+        self.summary_tokens = 400
+        self.study_tokens = 500
+        self.recent_turns = 6
+        self.summary_batch = 6
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.history_tokens = app.config.get('CHAT_HISTORY_TOKENS', 1500)
+        self.summary_tokens = app.config.get('CHAT_SUMMARY_TOKENS', 400)
+        self.study_tokens = app.config.get('CHAT_STUDY_TOKENS', 500)
+        self.recent_turns = app.config.get('CHAT_RECENT_TURNS', 6)
+        self.summary_batch = app.config.get('CHAT_SUMMARY_BATCH', 6)
+
+    def study_context(self, study_text):
+        return clip_to_tokens(study_text, self.study_tokens)
+
+    def history(self, user_id, exclude_latest=True):
+        """
+        Conversation history text within history_tokens: the summary (if
+        any) followed by the messages it does not cover yet, newest kept
+        first. Every unsummarized message is a candidate (not only the
+        recent window), so turns waiting for the next summary batch, or
+        for a summarizer that keeps failing, are trimmed by the token
+        budget rather than silently left out.
+        """
+        row = db.session.get(ChatSummary, user_id)
+        watermark = row.last_message_id if row else 0
+
+        summary = ''
+        if row is not None and row.summary:
+            summary = clip_to_tokens(row.summary, self.summary_tokens)
+        budget = self.history_tokens - estimate_tokens(summary)
+
+        # Newest first, fetched in small batches until the budget runs out
+        messages = db.session.scalars(
+            db.select(ChatMessage).filter(
+                ChatMessage.user_id == user_id,
+                ChatMessage.id > watermark
+            ).order_by(ChatMessage.id.desc()).execution_options(
+                yield_per=self.recent_turns * 2
+            )
+        )
+        lines = []
+        try:
+            for index, msg in enumerate(messages):
+                if exclude_latest and index == 0:
+                    # The message being answered is added to the prompt separately
+                    continue
+                line = f"{msg.role}: {msg.message}"
+                cost = estimate_tokens(line)
+                if cost > budget:
+                    if not lines and budget > 20:
+                        # Always keep part of the latest turn
+                        lines.append(clip_to_tokens(line, budget))
+                    break
+                lines.append(line)
+                budget -= cost
+        finally:
+            messages.close()
+
+        history = ''
+        if summary:
+            history += f"(Summary of earlier conversation: {summary})\n"
+        history += ''.join(f"{line}\n" for line in reversed(lines))
+        return history
+
+    def schedule_update(self, user_id):
+        """Fold aged-out turns into the summary on a background thread"""
+        if self.summarizer is None or self.app is None:
+            return
+        with self._lock:
+            if user_id in self._pending:
+                return
+            self._pending.add(user_id)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        self._executor.submit(self._update_in_context, user_id)
+
+    def _update_in_context(self, user_id):
+        try:
+            with self.app.app_context():
+                self.update_summary(user_id)
+        except Exception as e:
+            print(f"Chat summary error: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
+
+    def update_summary(self, user_id):
+        """
+        Summarize messages older than the recent window, summary_batch at
+        a time, while full batches have accumulated. A backlog (e.g. after
+        summarizer failures) takes several calls instead of one large
+        prompt. Returns True if the summary was updated.
+        """
+        updated = False
+        while self._summarize_batch(user_id):
+            updated = True
+        return updated
+
+    def _summarize_batch(self, user_id):
+        row = db.session.get(ChatSummary, user_id)
+        watermark = row.last_message_id if row else 0
+        previous = row.summary if row else ''
+
+        newest = [mid for (mid,) in db.session.query(ChatMessage.id).filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.id > watermark
+        ).order_by(ChatMessage.id.desc()).limit(self.recent_turns)]
+        if len(newest) < self.recent_turns:
+            return False
+
+        aged = ChatMessage.query.filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.id > watermark,
+            ChatMessage.id < newest[-1]
+        ).order_by(ChatMessage.id.asc()).limit(self.summary_batch).all()
+        if len(aged) < self.summary_batch:
+            return False
+
+        line_tokens = max(20, self.history_tokens // self.summary_batch)
+        transcript = '\n'.join(
+            clip_to_tokens(f"{m.role}: {m.message}", line_tokens) for m in aged
+        )
+        last_id = aged[-1].id
+        # Hold no transaction (or snapshot) during the summarizer call
+        db.session.rollback()
+        summary = self.summarizer(previous, transcript)
+        if not summary:
+            return False
+
+        # The chat may have been cleared (or summarized by another worker)
+        # while the summarizer ran; never write back a stale summary
+        row = db.session.get(ChatSummary, user_id)
+        if (row.last_message_id if row else 0) != watermark or \
+                db.session.get(ChatMessage, last_id) is None:
+            db.session.rollback()
+            return False
+
+        if row is None:
+            row = ChatSummary(user_id=user_id)
+            db.session.add(row)
+        row.summary = clip_to_tokens(summary.strip(), self.summary_tokens)
+        row.last_message_id = last_id
+        row.updated_at = datetime.utcnow()
+        db.session.commit()
+        return True
+
+    def clear(self, user_id):
+        ChatSummary.query.filter_by(user_id=user_id).delete()
@@ -0,0 +1,134 @@
+"""
+Query budget and N+1 check for the main routes
+Seeds the same synthetic data as check_query_plans.py into an EMPTY scratch
+database, drives each route through the Flask test client with the fake
+LLM backend, and fails if a route runs more queries than its
+@query_budget or repeats a statement often enough to suggest N+1.
+Usage:
+    python check_query_budgets.py                       temporary SQLite file
+    python check_query_budgets.py postgresql://localhost/flashcards_budgets
+"""
+import io
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+# Must be set before web_app reads its configuration
+os.environ['DATABASE_URL'] = sys.argv[1] if len(sys.argv) > 1 else 'sqlite:///' + \
+    os.path.join(tempfile.mkdtemp(), 'query_budgets.db')
+os.environ['QUERY_BUDGET_ENFORCE'] = 'True'
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('LLM_FAKE_LATENCY', 'fixed:0')
+os.environ.setdefault('JOB_WORKERS', '0')
+
+from web_app import app, query_monitor
+from models import db, User
+from check_query_plans import seed, USER_ID
+
+ADMIN_ID = 1
+PASSWORD = 'budget-password'
+
+MATERIAL = '\n\n'.join(
+    f"Section {i}. Photosynthesis turns light energy into chemical energy. "
+    f"Stage {i} depends on the conditions described in lecture {i}."
+    for i in range(1, 9)
+)
+
+
+def upload(n):
+    return {'data': {'file': (io.BytesIO(f'{MATERIAL} ({n})'.encode()), 'notes.txt'),
+                     'num_cards': '8'},
+            'content_type': 'multipart/form-data'}
+
+
+# (user id, method, path, request arguments) in the order a student would go
+ROUTES = [
+    (USER_ID, 'GET', '/dashboard', {}),
+    (USER_ID, 'GET', '/analytics', {}),
+    (USER_ID, 'POST', '/generate', upload(1)),
+    (USER_ID, 'POST', '/generate?mode=stream', upload(2)),
+    (USER_ID, 'POST', '/generate-exam', {'data': {'num_questions': '5'}}),
+    (USER_ID, 'POST', '/submit-exam', {'json': {'answers': {}, 'time_taken': '1:00'}}),
+    (USER_ID, 'GET', '/download/json', {}),
+    (USER_ID, 'POST', '/api/chat', {'json': {'message': 'Explain stage 2'}}),
+    (USER_ID, 'POST', '/api/chat/stream', {'json': {'message': 'And stage 3?'}}),
+    (USER_ID, 'GET', '/api/stats', {}),
+    (ADMIN_ID, 'GET', '/admin', {}),
+]
+
+
+def login(user_id):
+    client = app.test_client()
+    client.post('/login', json={'username': f'user{user_id}', 'password': PASSWORD})
+    return client
+
+
+if __name__ == '__main__':
+    print("="*50)
+    print("QUERY BUDGET CHECK")
+    print("="*50)
+
+    reports = []
+    query_monitor.observer = lambda endpoint, method, report: reports.append(report)
+
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with app.app_context():
+        print(f"🗄️  {db.engine.dialect.name}: {os.environ['DATABASE_URL'].split('@')[-1]}")
+        db.create_all()
+        if User.query.count():
+            print("❌ Database is not empty. Point this at a scratch database.")
+            sys.exit(1)
+        seed(datetime.utcnow())
+        for user_id in (USER_ID, ADMIN_ID):
+            db.session.get(User, user_id).set_password(PASSWORD)
+        db.session.commit()
+
+    clients = {}
+    failures = 0
+    try:
+        for user_id, method, path, kwargs in ROUTES:
+            client = clients.get(user_id) or clients.setdefault(user_id, login(user_id))
+            reports.clear()
+            try:
+                response = client.open(path, method=method, **kwargs)
+                # Streamed bodies run queries too; reading them finishes the request
+                response.get_data()
+                response.close()
+                status = response.status_code
+            except Exception as e:
+                status = f'{type(e).__name__}: {e}'
+
+            report = reports[-1] if reports else None
+            problems = []
+            if report is None:
+                problems.append('no query report')
+            else:
+                if report['over_budget']:
+                    problems.append(f"over budget {report['budget']}")
+                for statement, times in report['suspects']:
+                    problems.append(f"N+1 suspect {times}x {' '.join(statement.split())[:80]}")
+            if not isinstance(status, int) or status >= 500:
+                problems.append(f'status {status}')
+
+            count = report['count'] if report else '?'
+            budget = report['budget'] if report else None
+            label = f"{method} {path}: {count} queries" + \
+                (f" (budget {budget})" if budget is not None else '')
+            if problems:
+                failures += 1
+                print(f"❌ {label}")
+                for problem in problems:
+                    print(f"   {problem}")
+            else:
+                print(f"✅ {label}")
+    finally:
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    print("="*50)
+    if failures:
+        print(f"❌ {failures} routes over budget or with N+1 suspects")
+        sys.exit(1)
+    print("✅ All routes within their query budgets")
@@ -0,0 +1,193 @@
+"""
+Query plan regression check for the hot per-user queries
+Seeds synthetic data into an EMPTY scratch database, then runs EXPLAIN on
+each hot query and fails if it does not use the expected index.
+Usage:
+    python check_query_plans.py                         temporary SQLite file
+    python check_query_plans.py postgresql://localhost/flashcards_plans
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import func, text
+
+from models import (db, User, FlashcardSet, ExamResult, StudySession,
+                    ChatMessage, PageView, Artifact, SetPerformance)
+
+USERS = 200
+ROWS_PER_USER = 30
+PAGE_VIEWS = 20000
+USER_ID = 42
+
+
+def seed(now):
+    """Bulk insert synthetic rows with Core inserts (no ORM listeners)"""
+    rng = random.Random(0)
+
+    def when(days=90):
+        return now - timedelta(minutes=rng.randint(0, days * 24 * 60))
+
+    def insert(model, rows):
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+
+    insert(User, [{
+        'id': uid, 'username': f'user{uid}', 'email': f'user{uid}@example.com',
+        'password_hash': 'x', 'dark_mode': False, 'created_at': when(365)
+    } for uid in range(1, USERS + 1)])
+
+    sets, exams, sessions, messages, performance = [], [], [], [], []
+    for uid in range(1, USERS + 1):
+        for i in range(ROWS_PER_USER):
+            set_id = (uid - 1) * ROWS_PER_USER + i + 1
+            sets.append({'id': set_id, 'user_id': uid, 'name': f'Set {i}',
+                         'card_count': 10, 'difficulty': 'medium',
+                         'created_at': when()})
+            exams.append({'user_id': uid, 'flashcard_set_id': set_id,
+                          'exam_name': f'Exam {i}', 'score': 7,
+                          'total_questions': 10, 'percentage': 70.0,
+                          'difficulty': 'medium', 'created_at': when()})
+            sessions.append({'user_id': uid, 'activity_type': 'flashcard',
+                             'duration_minutes': 5, 'created_at': when()})
+            messages.append({'user_id': uid, 'role': 'user',
+                             'message': 'hello', 'created_at': when()})
+            performance.append({'flashcard_set_id': set_id, 'user_id': uid,
+                                'exam_count': 1, 'total_percentage': 70.0})
+    insert(FlashcardSet, sets)
+    insert(ExamResult, exams)
+    insert(StudySession, sessions)
+    insert(ChatMessage, messages)
+    insert(SetPerformance, performance)
+    insert(PageView, [{
+        'user_id': rng.randint(1, USERS), 'page': f'/page{rng.randint(1, 30)}',
+        'ip_address': f'10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}',
+        'created_at': when()
+    } for _ in range(PAGE_VIEWS)])
+    insert(Artifact, [{
+        'user_id': uid, 'session_key': 's', 'name': 'study_text',
+        'payload': '""', 'version': 1, 'expires_at': when(1) + timedelta(days=1)
+    } for uid in range(1, USERS + 1)])
+    db.session.commit()
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+
+
+def hot_queries(now):
+    """(description, table, expected index, query) for each hot path"""
+    return [
+        ('dashboard recent sets', 'flashcard_sets', 'ix_flashcard_sets_user_created',
+         FlashcardSet.query.filter_by(user_id=USER_ID)
+         .order_by(FlashcardSet.created_at.desc()).limit(5)),
+        ('dashboard recent exams', 'exam_results', 'ix_exam_results_user_created',
+         ExamResult.query.filter_by(user_id=USER_ID)
+         .order_by(ExamResult.created_at.desc()).limit(5)),
+        ('chat history', 'chat_messages', 'ix_chat_messages_user_created',
+         ChatMessage.query.filter_by(user_id=USER_ID)
+         .order_by(ChatMessage.created_at.desc()).limit(50)),
+        ('analytics session window', 'study_sessions', 'ix_study_sessions_user_created',
+         StudySession.query.filter(
+             StudySession.user_id == USER_ID,
+             StudySession.created_at >= now - timedelta(days=90))),
+        ('analytics set performance', 'set_performance', 'ix_set_performance_user_id',
+         SetPerformance.query.filter(SetPerformance.user_id == USER_ID)),
+        ('admin recent visitors', 'page_views', 'ix_page_views_created',
+         PageView.query.order_by(PageView.created_at.desc()).limit(20)),
+        ('admin raw page view tail', 'page_views', 'ix_page_views_created',
+         db.session.query(func.count(PageView.id)).filter(
+             PageView.created_at >= now - timedelta(minutes=10))),
+        ('artifact purge', 'artifacts', 'ix_artifacts_expires',
+         Artifact.query.filter(Artifact.expires_at <= now - timedelta(days=1))),
+    ]
+
+
+def explain(query):
+    """Plan as a list of (operation, table, index) tuples"""
+    dialect = db.engine.dialect
+    # Compile with named parameters so text() can bind them on any driver
+    named = dialect.__class__(paramstyle='named')
+    compiled = query.statement.compile(dialect=named)
+
+    if dialect.name == 'postgresql':
+        plan = db.session.execute(
+            text('EXPLAIN (FORMAT JSON) ' + str(compiled)), compiled.params
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes, stack = [], [plan[0]['Plan']]
+        while stack:
+            node = stack.pop()
+            nodes.append((node['Node Type'], node.get('Relation Name'),
+                          node.get('Index Name')))
+            stack.extend(node.get('Plans', []))
+        return nodes
+
+    nodes = []
+    for row in db.session.execute(
+        text('EXPLAIN QUERY PLAN ' + str(compiled)), compiled.params
+    ):
+        detail = row[-1]
+        words = detail.split()
+        table = words[1] if len(words) > 1 else None
+        index = None
+        if ' INDEX ' in f' {detail} ':
+            index = words[words.index('INDEX') + 1]
+        nodes.append((words[0], table, index))
+    return nodes
+
+
+def uses_index(nodes, table, index):
+    scans = [n for n in nodes if n[1] == table]
+    seq_scan = any(
+        n[0] == 'Seq Scan' or (n[0] == 'SCAN' and n[2] is None) for n in scans
+    )
+    return not seq_scan and any(n[2] == index for n in nodes)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        database_url = sys.argv[1]
+    else:
+        database_url = 'sqlite:///' + os.path.join(
+            tempfile.mkdtemp(), 'query_plans.db'
+        )
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    db.init_app(app)
+
+    print("="*50)
+    print("QUERY PLAN CHECK")
+    print("="*50)
+
+    failures = 0
+    with app.app_context():
+        print(f"🗄️  {db.engine.dialect.name}: {database_url.split('@')[-1]}")
+        db.create_all()
+        if User.query.count():
+            print("❌ Database is not empty. Point this at a scratch database.")
+            sys.exit(1)
+
+        now = datetime.utcnow()
+        seed(now)
+        try:
+            for description, table, index, query in hot_queries(now):
+                nodes = explain(query)
+                if uses_index(nodes, table, index):
+                    print(f"✅ {description}: {index}")
+                else:
+                    failures += 1
+                    print(f"❌ {description}: expected {index}, got {nodes}")
+        finally:
+            db.session.rollback()
+            db.drop_all()
+
+    print("="*50)
+    if failures:
+        print(f"❌ {failures} queries without the expected index")
+        sys.exit(1)
+    print("✅ All hot queries use their indexes")
@@ -0,0 +1,203 @@
+"""
+Map-reduce generation for large study documents
+Long study text is split on page/section boundaries, the requested
+number of items is spread across the chunks, each chunk is generated
+concurrently and the results are merged with duplicates removed.
+"""
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Preferred split points, from the coarsest to the finest
+SEPARATORS = [
+    re.compile(r'\f'),                        # PDF page breaks
+    re.compile(r'\n(?=#{1,6}\s)'),            # markdown headings
+    re.compile(r'\n\s*\n'),                   # paragraphs
+    re.compile(r'\n'),                        # lines
+    re.compile(r'(?<=[.!?])\s+'),             # sentences
+]
+
+
+def _split_piece(text, max_chars, level=0):
+    if len(text) <= max_chars:
+        return [text]
+    if level >= len(SEPARATORS):
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+    parts = [p for p in SEPARATORS[level].split(text) if p.strip()]
+    if len(parts) <= 1:
+        return _split_piece(text, max_chars, level + 1)
+
+    pieces = []
+    for part in parts:
+        pieces.extend(_split_piece(part, max_chars, level + 1))
+    return pieces
+
+
+def split_study_text(text, max_chars=12000):
+    """Split text into chunks of at most max_chars, keeping sections whole"""
+    text = text.strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    chunks = []
+    current = ''
+    for piece in _split_piece(text, max_chars):
+        piece = piece.strip()
+        if not piece:
+            continue
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def distribute_count(total, chunks):
+    """Spread total items over chunks in proportion to their length"""
+    lengths = [len(c) for c in chunks]
+    size = sum(lengths)
+    if not chunks or total <= 0 or size == 0:
+        return [0] * len(chunks)
+
+    shares = [total * length / size for length in lengths]
+    counts = [int(share) for share in shares]
+    # Hand the remainder to the chunks with the largest fractional share
+    by_remainder = sorted(
+        range(len(chunks)), key=lambda i: shares[i] - counts[i], reverse=True
+    )
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def _question_key(item):
+    question = item.get('question', '').lower()
+    return re.sub(r'[^a-z0-9]+', ' ', question).strip()
+
+
+def dedupe_items(items, exclude=()):
+    """Drop items whose question matches an earlier one or one in exclude"""
+    seen = {_question_key(item) for item in exclude}
+    unique = []
+    for item in items:
+        key = _question_key(item)
+        if key and key in seen:
+            continue
+        seen.add(key)
+        unique.append(item)
+    return unique
+
+
+def generate_chunked(study_text, total, generate_fn,
+                     max_chars=12000, max_workers=4, on_progress=None):
+    """
+    Run generate_fn(chunk_text, count) over each chunk concurrently and
+    merge the results in document order. on_progress(done, total_chunks)
+    is called as chunks finish.
+    """
+    chunks = split_study_text(study_text, max_chars)
+    if len(chunks) <= 1:
+        items = generate_fn(study_text, total)
+        if on_progress:
+            on_progress(1, 1)
+        return items
+
+    jobs = [
+        (chunk, count)
+        for chunk, count in zip(chunks, distribute_count(total, chunks))
+        if count > 0
+    ]
+
+    workers = max(1, min(max_workers, len(jobs)))
+    results = [None] * len(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(generate_fn, *job): index
+            for index, job in enumerate(jobs)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            results[futures[future]] = future.result()
+            if on_progress:
+                on_progress(done, len(jobs))
+
+    merged = []
+    for items in results:
+        merged.extend(items or [])
+    return dedupe_items(merged)[:total]
+
+
+def generate_chunked_stream(study_text, total, stream_fn,
+                            max_chars=12000, max_workers=4, exclude=()):
+    """
+    Streaming counterpart of generate_chunked: stream_fn(chunk_text, count)
+    yields items as they are parsed, and items from all chunks are yielded
+    as soon as they arrive (so not in document order), de-duplicated
+    (also against exclude) and capped at total. Closing the generator
+    stops the remaining chunks.
+    """
+    chunks = split_study_text(study_text, max_chars)
+    seen = {_question_key(item) for item in exclude}
+    produced = 0
+
+    def accept(item):
+        key = _question_key(item)
+        if key and key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    if len(chunks) <= 1:
+        items = stream_fn(study_text, total)
+        try:
+            for item in items:
+                if accept(item):
+                    yield item
+                    produced += 1
+                    if produced >= total:
+                        break
+        finally:
+            items.close()
+        return
+
+    jobs = [
+        (chunk, count)
+        for chunk, count in zip(chunks, distribute_count(total, chunks))
+        if count > 0
+    ]
+
+    results = queue.Queue()
+    stop = threading.Event()
+    finished = object()
+
+    def run(chunk, count):
+        items = stream_fn(chunk, count)
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                results.put(item)
+        finally:
+            items.close()
+            results.put(finished)
+
+    workers = max(1, min(max_workers, len(jobs)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for job in jobs:
+            pool.submit(run, *job)
+        remaining = len(jobs)
+        while remaining and produced < total:
+            item = results.get()
+            if item is finished:
+                remaining -= 1
+            elif accept(item):
+                yield item
+                produced += 1
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
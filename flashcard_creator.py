@@ -1,19 +1,23 @@
 """
 AI Flashcard Creator using Google Gemini (FREE)
-Updated version with new Google AI SDK
+Calls go through the same LLM gateway as the web app
 """
 
 import os
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+from llm_gateway import LLMGateway
+from llm_backends import make_backend
 
 # Load the API key from .env file
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 
-# Configure Gemini with new SDK
-client = genai.Client(api_key=api_key)
+# Shared client with timeouts, retries and circuit breaking;
+# LLM_BACKEND=fake or replay runs without a network connection
+llm = LLMGateway(backend=make_backend(
+    os.getenv('LLM_BACKEND', 'gemini'), api_key=api_key,
+    cassette_dir=os.getenv('LLM_CASSETTE_DIR', 'cassettes')
+))
 
 def generate_flashcards(study_text, num_cards=5, difficulty="medium"):
     """
@@ -42,14 +46,11 @@ Continue for all {num_cards} questions.
     
     print("🤖 Generating flashcards...")
     
-    # Send to Gemini AI using new SDK
-    response = client.models.generate_content(
-        model='gemini-2.5-flash',
-        contents=prompt
-    )
+    # Send to Gemini AI
+    response_text = llm.generate(prompt, 'gemini-2.5-flash')
     
     # Parse the response
-    flashcards = parse_flashcards(response.text)
+    flashcards = parse_flashcards(response_text)
     
     return flashcards
 
@@ -0,0 +1,172 @@
+"""
+Content-addressed cache for generated flashcards and exams
+Results are keyed by a hash of the normalized study text, the generation
+parameters, the model name, the LLM backend and the prompt version, so
+fake or replayed output is never served for real model calls. A small
+in-memory LRU sits in front of the generation_cache table.
+"""
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from models import db, GenerationCacheEntry
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different uploads share a key"""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def make_cache_key(kind, study_text, params, model_name, backend,
+                   prompt_version):
+    payload = json.dumps({
+        'kind': kind,
+        'params': params,
+        'model': model_name,
+        'backend': backend,
+        'prompt_version': prompt_version,
+    }, sort_keys=True)
+    digest = hashlib.sha256()
+    digest.update(payload.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_text(study_text).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class GenerationCache:
+    """Two-tier (memory + database) cache with TTL and size limits"""
+
+    def __init__(self, app=None):
+        self.max_memory_entries = 256
+        self.max_rows = 5000
+        self.ttl = timedelta(days=7)
+        self.enabled = True
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('GENERATION_CACHE_ENABLED', True)
+        self.max_memory_entries = app.config.get('GENERATION_CACHE_SIZE', 256)
+        self.max_rows = app.config.get('GENERATION_CACHE_MAX_ROWS', 5000)
+        self.ttl = timedelta(
+            seconds=app.config.get('GENERATION_CACHE_TTL', 7 * 24 * 3600)
+        )
+
+    def get(self, key):
+        """
+        Return a fresh copy of the cached value for key, or None. The
+        database tier uses its own connection, so a hit never commits
+        (or rolls back) the caller's session.
+        """
+        if not self.enabled:
+            return None
+
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, payload = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return json.loads(payload)
+                del self._memory[key]
+
+        table = GenerationCacheEntry.__table__
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    db.select(table.c.payload, table.c.created_at)
+                    .where(table.c.key == key)
+                ).first()
+        except Exception as e:
+            print(f"Generation cache read error: {e}")
+            row = None
+
+        if row is not None and row.created_at + self.ttl > now:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(table.update().where(table.c.key == key).values(
+                        hit_count=db.func.coalesce(table.c.hit_count, 0) + 1
+                    ))
+            except Exception as e:
+                # Only the statistic is lost; the hit is still served
+                print(f"Generation cache hit count error: {e}")
+            self._remember(key, row.payload, row.created_at + self.ttl)
+            with self._lock:
+                self.db_hits += 1
+            return json.loads(row.payload)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, kind, value):
+        if not self.enabled or not value:
+            return
+
+        now = datetime.utcnow()
+        payload = json.dumps(value)
+        self._remember(key, payload, now + self.ttl)
+        try:
+            row = db.session.get(GenerationCacheEntry, key)
+            if row is None:
+                row = GenerationCacheEntry(key=key, kind=kind)
+                db.session.add(row)
+            row.payload = payload
+            row.hit_count = 0
+            row.created_at = now
+            db.session.commit()
+            self._evict_rows(now)
+        except Exception as e:
+            print(f"Generation cache write error: {e}")
+            db.session.rollback()
+
+    def _remember(self, key, payload, expires_at):
+        # Serialized, so callers that modify a result cannot change the cache
+        with self._lock:
+            self._memory[key] = (expires_at, payload)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _evict_rows(self, now):
+        """Drop expired rows, then the oldest rows beyond max_rows"""
+        GenerationCacheEntry.query.filter(
+            GenerationCacheEntry.created_at < now - self.ttl
+        ).delete(synchronize_session=False)
+
+        excess = GenerationCacheEntry.query.count() - self.max_rows
+        if excess > 0:
+            oldest = db.session.query(GenerationCacheEntry.key).order_by(
+                GenerationCacheEntry.created_at.asc()
+            ).limit(excess).subquery()
+            GenerationCacheEntry.query.filter(
+                GenerationCacheEntry.key.in_(db.select(oldest.c.key))
+            ).delete(synchronize_session=False)
+        db.session.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        GenerationCacheEntry.query.delete()
+        db.session.commit()
+
+    def get_stats(self):
+        lookups = self.memory_hits + self.db_hits + self.misses
+        hits = self.memory_hits + self.db_hits
+        return {
+            'memory_entries': len(self._memory),
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0,
+        }
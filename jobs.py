@@ -0,0 +1,247 @@
+"""
+Background jobs for flashcard and exam generation
+Requests enqueue a row in generation_jobs and return its id right away.
+Worker threads claim queued rows, run the registered handler inside an
+app context and record stage/progress as they go, so clients can poll.
+Because the state lives in the database, jobs interrupted by a restart
+are picked up again once their heartbeat goes stale. A running job beats
+every JOB_HEARTBEAT seconds whether or not it reports progress, so long
+LLM calls and retries do not look like a dead worker.
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import db, GenerationJob
+
+
+class JobError(Exception):
+    """Expected failure with a message that is safe to show the user"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class JobQueue:
+    """Database-backed job queue with in-process worker threads"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 2
+        self.poll_interval = 2.0
+        self.stale_after = timedelta(minutes=5)
+        self.heartbeat = 30
+        self.max_attempts = 2
+        self.retention = timedelta(days=1)
+        self.handlers = {}
+        self._wake = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._last_sweep = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('JOB_WORKERS', 2)
+        self.poll_interval = app.config.get('JOB_POLL_INTERVAL', 2.0)
+        self.heartbeat = app.config.get('JOB_HEARTBEAT', 30)
+        # Requeue only after several missed heartbeats
+        self.stale_after = timedelta(seconds=max(
+            app.config.get('JOB_STALE_AFTER', 300), 4 * self.heartbeat
+        ))
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 2)
+        self.retention = timedelta(
+            seconds=app.config.get('JOB_RETENTION', 24 * 3600)
+        )
+
+    def register(self, kind):
+        """Decorator: handler(params, report, user_id, scope) -> result dict"""
+        def decorator(fn):
+            self.handlers[kind] = fn
+            return fn
+        return decorator
+
+    # -- producer side -----------------------------------------------------
+
+    def enqueue(self, kind, params, user_id, session_key):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind}")
+        job = GenerationJob(
+            id=secrets.token_hex(16), user_id=user_id,
+            session_key=session_key, kind=kind, status='queued',
+            stage='queued', progress=0, params=json.dumps(params)
+        )
+        db.session.add(job)
+        db.session.commit()
+        self.start()
+        self._wake.set()
+        return job.id
+
+    def status(self, job_id, user_id):
+        """Public view of a job, or None if it is not this user's"""
+        # Polling also revives workers, e.g. for jobs queued before a restart
+        self.start()
+        job = db.session.get(GenerationJob, job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        data = {
+            'job_id': job.id,
+            'kind': job.kind,
+            'status': job.status,
+            'stage': job.stage,
+            'progress': round(job.progress or 0, 3),
+        }
+        if job.status == 'succeeded' and job.result:
+            data['result'] = json.loads(job.result)
+        if job.status == 'failed':
+            data['error'] = job.error
+        return data
+
+    # -- worker side -------------------------------------------------------
+
+    def start(self):
+        """Start worker threads lazily, once per process"""
+        if self.workers <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+                return
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self.run_forever, daemon=True,
+                                 name=f'job-worker-{i}')
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def run_forever(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    ran = self.run_once()
+            except Exception as e:
+                print(f"Job worker error: {e}")
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_once(self):
+        """Claim and run one job; returns False if there was nothing to do"""
+        self._sweep()
+        job = self._claim()
+        if job is None:
+            return False
+
+        # Handlers commit, which expires the row; keep plain values
+        job_id, kind, user_id = job.id, job.kind, job.user_id
+        scope = (job.user_id, job.session_key)
+        params = json.loads(job.params)
+
+        handler = self.handlers.get(kind)
+        report = lambda stage, progress: self._report(job_id, stage, progress)
+        stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._beat, args=(job_id, stop), daemon=True,
+            name=f'job-heartbeat-{job_id[:8]}'
+        )
+        heartbeat.start()
+        try:
+            if handler is None:
+                raise JobError(f"Unknown job kind: {kind}")
+            result = handler(params, report, user_id, scope)
+            self._finish(job_id, 'succeeded', result=result)
+        except JobError as e:
+            db.session.rollback()
+            self._finish(job_id, 'failed', error=str(e))
+        except Exception as e:
+            print(f"Job {job_id} ({kind}) error: {e}")
+            db.session.rollback()
+            self._finish(job_id, 'failed', error='Generation failed, please try again')
+        finally:
+            stop.set()
+            heartbeat.join()
+        return True
+
+    def _beat(self, job_id, stop):
+        """Keep a running job's heartbeat fresh until stop is set"""
+        table = GenerationJob.__table__
+        while not stop.wait(self.heartbeat):
+            try:
+                with self.app.app_context(), db.engine.begin() as conn:
+                    conn.execute(table.update().where(
+                        table.c.id == job_id, table.c.status == 'running'
+                    ).values(updated_at=datetime.utcnow()))
+            except Exception as e:
+                print(f"Job {job_id} heartbeat error: {e}")
+
+    def _claim(self):
+        table = GenerationJob.__table__
+        while True:
+            candidate = db.session.query(GenerationJob.id).filter(
+                GenerationJob.status == 'queued'
+            ).order_by(GenerationJob.created_at).first()
+            if candidate is None:
+                return None
+            now = datetime.utcnow()
+            with db.engine.begin() as conn:
+                claimed = conn.execute(
+                    table.update().where(
+                        table.c.id == candidate.id, table.c.status == 'queued'
+                    ).values(
+                        status='running', stage='starting', started_at=now,
+                        updated_at=now, attempts=table.c.attempts + 1
+                    )
+                ).rowcount
+            db.session.rollback()
+            if claimed:
+                return db.session.get(GenerationJob, candidate.id)
+            # Another worker won the race; try the next one
+
+    def _report(self, job_id, stage, progress):
+        table = GenerationJob.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == job_id).values(
+                stage=stage, progress=min(max(progress, 0), 1),
+                updated_at=datetime.utcnow()
+            ))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        table = GenerationJob.__table__
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == job_id).values(
+                status=status, stage='done' if status == 'succeeded' else 'failed',
+                progress=1 if status == 'succeeded' else table.c.progress,
+                result=json.dumps(result) if result is not None else None,
+                error=error, finished_at=now, updated_at=now
+            ))
+
+    def _sweep(self):
+        """Requeue jobs whose worker died; drop old finished jobs"""
+        if time.monotonic() - self._last_sweep < 60:
+            return
+        self._last_sweep = time.monotonic()
+        table = GenerationJob.__table__
+        now = datetime.utcnow()
+        stale = [table.c.status == 'running',
+                 table.c.updated_at < now - self.stale_after]
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(
+                *stale, table.c.attempts < self.max_attempts
+            ).values(status='queued', stage='queued', updated_at=now))
+            conn.execute(table.update().where(*stale).values(
+                status='failed', stage='failed', finished_at=now,
+                error='Generation was interrupted, please try again'
+            ))
+            conn.execute(table.delete().where(
+                table.c.status.in_(['succeeded', 'failed']),
+                table.c.finished_at < now - self.retention
+            ))
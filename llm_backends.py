@@ -0,0 +1,364 @@
+"""
+Interchangeable backends behind the LLM gateway
+The gateway asks its backend for model objects with Gemini's
+generate_content(prompt, stream=..., request_options=..., **kwargs)
+interface. Besides the real Gemini backend there is a local fake with
+configurable latency for load tests, and a recorder / replayer that keeps
+real responses in cassette files so performance runs can be repeated on
+a machine without network access or an API key.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+
+class CassetteMissError(LookupError):
+    """Replay found no recorded response for a prompt"""
+
+
+class Response:
+    """The part of a Gemini response the gateway uses"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def request_key(model, prompt, kwargs):
+    """Stable key for one request (stream or not answers the same)"""
+    data = json.dumps(
+        {'model': model, 'prompt': prompt, 'kwargs': kwargs},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def split_text(text, size=40):
+    """Cut text into stream-sized pieces"""
+    return [text[i:i + size] for i in range(0, len(text), size)] or ['']
+
+
+# -- Gemini --------------------------------------------------------------------
+
+class GeminiBackend:
+    name = 'gemini'
+
+    def __init__(self, api_key=None):
+        if api_key:
+            genai.configure(api_key=api_key)
+
+    def model(self, name):
+        return genai.GenerativeModel(name)
+
+
+# -- fake ----------------------------------------------------------------------
+
+class Latency:
+    """
+    Response time distribution, from a spec such as
+        fixed:0.8            always 0.8 s
+        uniform:0.5,2        between 0.5 and 2 s
+        normal:1.5,0.3       mean, standard deviation
+        lognormal:1.2,0.5    median, sigma (long tail, like real APIs)
+    """
+
+    def __init__(self, spec='lognormal:1.2,0.5', seed=None):
+        kind, _, args = (spec or 'fixed:0').partition(':')
+        self.kind = kind.strip().lower()
+        self.args = [float(a) for a in args.split(',') if a.strip()]
+        if self.kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        self.spec = spec
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        with self._lock:
+            if self.kind == 'fixed':
+                value = self.args[0] if self.args else 0
+            elif self.kind == 'uniform':
+                value = self._rng.uniform(*self.args[:2])
+            elif self.kind == 'normal':
+                value = self._rng.gauss(*self.args[:2])
+            else:
+                median, sigma = self.args[:2]
+                value = self._rng.lognormvariate(math.log(median), sigma)
+        return max(0.0, value)
+
+
+class FakeModel:
+    """
+    Answers from the prompt itself: flashcard and MCQ prompts get
+    Q1:/A1: or MCQ text (or JSON when a JSON mime type is requested)
+    built from sentences of the study material, anything else a short
+    paragraph. Output is deterministic per prompt; timing is not.
+    """
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    def generate_content(self, prompt, stream=False, request_options=None,
+                         generation_config=None, **kwargs):
+        backend = self.backend
+        total = backend.latency.sample()
+        if backend.error_rate and backend.rng() < backend.error_rate:
+            time.sleep(total * backend.first_chunk_share)
+            raise google_exceptions.ServiceUnavailable("Fake backend failure")
+
+        text = self.answer(prompt, generation_config)
+        if not stream:
+            time.sleep(total)
+            return Response(text)
+        return self._stream(text, total)
+
+    def _stream(self, text, total):
+        chunks = split_text(text)
+        first = total * self.backend.first_chunk_share
+        rest = (total - first) / max(1, len(chunks) - 1)
+        time.sleep(first)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(rest)
+            yield Response(chunk)
+
+    def answer(self, prompt, generation_config=None):
+        rng = random.Random(request_key(self.name, prompt, None))
+        wants_json = 'json' in str(
+            (generation_config or {}).get('response_mime_type', '')
+        )
+        count = re.search(r'create (\d+) (flashcards|MCQs)', prompt)
+        if count is None:
+            return self._paragraph(prompt, rng)
+
+        sentences = self._sentences(prompt)
+        n = int(count.group(1))
+        if count.group(2) == 'MCQs':
+            items = [self._mcq(sentences, i, rng) for i in range(n)]
+            if wants_json:
+                return json.dumps(items)
+            return '\n\n'.join(
+                f"Q{i}: {item['question']}\n" +
+                ''.join(f"{k}) {v}\n" for k, v in item['options'].items()) +
+                f"CORRECT: {item['correct']}"
+                for i, item in enumerate(items, 1)
+            )
+
+        items = [self._flashcard(sentences, i, rng) for i in range(n)]
+        if wants_json:
+            return json.dumps(items)
+        return '\n\n'.join(
+            f"Q{i}: {item['question']}\nA{i}: {item['answer']}"
+            for i, item in enumerate(items, 1)
+        )
+
+    @staticmethod
+    def _sentences(prompt):
+        material = prompt.split('STUDY MATERIAL:', 1)[-1]
+        sentences = [
+            s.strip() for s in re.split(r'(?<=[.!?])\s+|\n+', material)
+            if len(s.split()) >= 4
+        ]
+        return sentences or ['The material covers one main idea in detail.']
+
+    @staticmethod
+    def _topic(sentence, rng):
+        words = [w.strip('.,;:()') for w in sentence.split() if len(w) > 4]
+        return rng.choice(words) if words else 'this topic'
+
+    def _flashcard(self, sentences, i, rng):
+        sentence = sentences[i % len(sentences)]
+        return {
+            'question': f"What does the material say about "
+                        f"{self._topic(sentence, rng)} (point {i + 1})?",
+            'answer': sentence,
+        }
+
+    def _mcq(self, sentences, i, rng):
+        sentence = sentences[i % len(sentences)]
+        wrong = [s[:120] for s in sentences if s != sentence]
+        wrong = rng.sample(wrong, min(3, len(wrong)))
+        while len(wrong) < 3:
+            wrong.append(f"None of the other options ({len(wrong) + 1})")
+        options = [sentence] + wrong
+        rng.shuffle(options)
+        letters = 'ABCD'
+        return {
+            'question': f"Which statement about {self._topic(sentence, rng)} "
+                        f"is correct (question {i + 1})?",
+            'options': dict(zip(letters, options)),
+            'correct': letters[options.index(sentence)],
+        }
+
+    @staticmethod
+    def _paragraph(prompt, rng):
+        words = re.findall(r'[A-Za-z]{5,}', prompt[-2000:]) or ['studying']
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            picked = ' '.join(rng.choice(words).lower() for _ in range(rng.randint(6, 12)))
+            sentences.append(picked.capitalize() + '.')
+        return ' '.join(sentences)
+
+
+class FakeBackend:
+    name = 'fake'
+
+    def __init__(self, latency='lognormal:1.2,0.5', error_rate=0.0,
+                 first_chunk_share=0.3, seed=None):
+        self.latency = latency if isinstance(latency, Latency) else Latency(latency, seed)
+        self.error_rate = error_rate
+        # Share of the total latency spent before the first streamed chunk
+        self.first_chunk_share = first_chunk_share
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def rng(self):
+        with self._lock:
+            return self._rng.random()
+
+    def model(self, name):
+        return FakeModel(self, name)
+
+
+# -- record / replay -----------------------------------------------------------
+
+class Cassette:
+    """Directory of recorded responses, one JSON file per request key"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def load(self, key):
+        try:
+            with open(self.path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, indent=1)
+        os.replace(tmp, path)
+
+
+class RecordingModel:
+    def __init__(self, inner, cassette, name):
+        self.inner = inner
+        self.cassette = cassette
+        self.name = name
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        options = {k: v for k, v in kwargs.items() if k != 'request_options'}
+        key = request_key(self.name, prompt, options)
+        started = time.monotonic()
+        response = self.inner.generate_content(prompt, stream=stream, **kwargs)
+        if not stream:
+            self._save(key, prompt, [response.text], [time.monotonic() - started])
+            return response
+        return self._record_stream(key, prompt, response, started)
+
+    def _record_stream(self, key, prompt, response, started):
+        chunks, offsets = [], []
+        for chunk in response:
+            try:
+                chunks.append(chunk.text)
+                offsets.append(time.monotonic() - started)
+            except ValueError:
+                pass
+            yield chunk
+        # Only complete streams are recorded
+        self._save(key, prompt, chunks, offsets)
+
+    def _save(self, key, prompt, chunks, offsets):
+        self.cassette.save(key, {
+            'model': self.name,
+            'prompt_preview': prompt.strip()[:200],
+            'chunks': chunks,
+            'offsets': [round(o, 4) for o in offsets],
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        })
+
+
+class RecordingBackend:
+    """Pass calls through to another backend and keep every response"""
+    name = 'record'
+
+    def __init__(self, inner, directory):
+        self.inner = inner
+        self.cassette = Cassette(directory)
+
+    def model(self, name):
+        return RecordingModel(self.inner.model(name), self.cassette, name)
+
+
+class ReplayModel:
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.name = name
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        options = {k: v for k, v in kwargs.items() if k != 'request_options'}
+        entry = self.backend.cassette.load(request_key(self.name, prompt, options))
+        if entry is None:
+            raise CassetteMissError(
+                f"No recording for this {self.name} prompt in "
+                f"{self.backend.cassette.directory}"
+            )
+        chunks, offsets = entry['chunks'], entry.get('offsets') or []
+        if not stream:
+            if self.backend.timing and offsets:
+                time.sleep(offsets[-1])
+            return Response(''.join(chunks))
+        return self._stream(chunks, offsets)
+
+    def _stream(self, chunks, offsets):
+        previous = 0
+        for i, chunk in enumerate(chunks):
+            if self.backend.timing and i < len(offsets):
+                time.sleep(max(0, offsets[i] - previous))
+                previous = offsets[i]
+            yield Response(chunk)
+
+
+class ReplayBackend:
+    """
+    Answer from recorded responses only. With timing=True the recorded
+    time to each chunk is reproduced as well.
+    """
+    name = 'replay'
+
+    def __init__(self, directory, timing=False):
+        self.cassette = Cassette(directory)
+        self.timing = timing
+
+    def model(self, name):
+        return ReplayModel(self, name)
+
+
+def make_backend(kind='gemini', api_key=None, cassette_dir='cassettes',
+                 fake_latency='lognormal:1.2,0.5', fake_error_rate=0.0,
+                 replay_timing=False, seed=None):
+    """Backend by name: gemini, fake, record (Gemini) or replay"""
+    kind = (kind or 'gemini').lower()
+    if kind == 'gemini':
+        return GeminiBackend(api_key)
+    if kind == 'fake':
+        return FakeBackend(fake_latency, fake_error_rate, seed=seed)
+    if kind == 'record':
+        return RecordingBackend(GeminiBackend(api_key), cassette_dir)
+    if kind == 'replay':
+        return ReplayBackend(cassette_dir, timing=replay_timing)
+    raise ValueError(f"Unknown LLM backend: {kind}")
@@ -0,0 +1,284 @@
+"""
+Shared gateway for every Gemini call
+One configured client and cached model objects, a global and per-user
+limit on calls in flight, request timeouts, retries with jittered
+exponential backoff for transient errors, and a circuit breaker that
+fails fast while the provider is down. Where requests actually go is
+up to the backend (see llm_backends): Gemini, a local fake, or recorded
+responses.
+"""
+import random
+import threading
+import time
+
+from google.api_core import exceptions as google_exceptions
+
+from llm_backends import GeminiBackend, make_backend
+
+DEFAULT_MODEL = 'gemini-2.5-flash'
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,    # 429 / quota
+    google_exceptions.ServiceUnavailable,   # 503
+    google_exceptions.InternalServerError,  # 500
+    google_exceptions.DeadlineExceeded,     # 504 / our timeout
+    google_exceptions.TooManyRequests,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class LLMError(Exception):
+    """Base class for errors raised by the gateway itself"""
+
+
+class LLMBusyError(LLMError):
+    """No call slot became free within the queue timeout"""
+
+
+class CircuitOpenError(LLMError):
+    """The provider failed repeatedly; calls are refused for a while"""
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures; one trial
+    call is let through (half-open) once reset_timeout has passed"""
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class LLMGateway:
+    """All Gemini traffic goes through generate() / generate_stream()"""
+
+    def __init__(self, app=None, api_key=None, backend=None, **settings):
+        self.max_concurrency = 8
+        self.max_per_user = 4
+        self.queue_timeout = 30
+        self.timeout = 60
+        self.max_retries = 3
+        self.backoff_base = 0.5
+        self.backoff_max = 8
+        self.breaker = CircuitBreaker()
+        self.api_key = api_key
+        self.backend = backend or GeminiBackend(api_key)
+        self._models = {}
+        self._active = 0
+        self._active_by_user = {}
+        self._slots = threading.Condition()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.rejected = 0
+        # observer(model, seconds, outcome, first_chunk=None) per finished call
+        self.observer = None
+        if app is not None:
+            self.init_app(app)
+        self.configure(**settings)
+
+    def init_app(self, app):
+        if 'LLM_BACKEND' in app.config:
+            self.set_backend(make_backend(
+                app.config['LLM_BACKEND'], api_key=self.api_key,
+                cassette_dir=app.config.get('LLM_CASSETTE_DIR', 'cassettes'),
+                fake_latency=app.config.get('LLM_FAKE_LATENCY', 'lognormal:1.2,0.5'),
+                fake_error_rate=app.config.get('LLM_FAKE_ERROR_RATE', 0.0),
+                replay_timing=app.config.get('LLM_REPLAY_TIMING', False),
+                seed=app.config.get('LLM_FAKE_SEED'),
+            ))
+        self.configure(
+            max_concurrency=app.config.get('LLM_MAX_CONCURRENCY', 8),
+            max_per_user=app.config.get('LLM_MAX_PER_USER', 4),
+            queue_timeout=app.config.get('LLM_QUEUE_TIMEOUT', 30),
+            timeout=app.config.get('LLM_TIMEOUT', 60),
+            max_retries=app.config.get('LLM_MAX_RETRIES', 3),
+            breaker_threshold=app.config.get('LLM_BREAKER_THRESHOLD', 5),
+            breaker_reset=app.config.get('LLM_BREAKER_RESET', 30),
+        )
+
+    def configure(self, breaker_threshold=None, breaker_reset=None, **settings):
+        for name, value in settings.items():
+            if not hasattr(self, name):
+                raise TypeError(f"Unknown gateway setting: {name}")
+            setattr(self, name, value)
+        if breaker_threshold is not None:
+            self.breaker.threshold = breaker_threshold
+        if breaker_reset is not None:
+            self.breaker.reset_timeout = breaker_reset
+
+    def set_backend(self, backend):
+        self.backend = backend
+        self._models = {}
+
+    def model(self, name=DEFAULT_MODEL):
+        """Model objects are reused across calls and threads"""
+        model = self._models.get(name)
+        if model is None:
+            model = self._models[name] = self.backend.model(name)
+        return model
+
+    # -- concurrency -------------------------------------------------------
+
+    def _acquire(self, user_id):
+        deadline = time.monotonic() + self.queue_timeout
+        with self._slots:
+            while (self._active >= self.max_concurrency or
+                   (user_id is not None and
+                    self._active_by_user.get(user_id, 0) >= self.max_per_user)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise LLMBusyError("Too many AI requests in progress, try again shortly")
+                self._slots.wait(remaining)
+            self._active += 1
+            if user_id is not None:
+                self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+
+    def _release(self, user_id):
+        with self._slots:
+            self._active -= 1
+            if user_id is not None:
+                left = self._active_by_user.get(user_id, 1) - 1
+                if left:
+                    self._active_by_user[user_id] = left
+                else:
+                    self._active_by_user.pop(user_id, None)
+            self._slots.notify_all()
+
+    # -- calls -------------------------------------------------------------
+
+    def _backoff(self, attempt):
+        # Full jitter keeps retrying workers from hitting the API in lockstep
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        time.sleep(random.uniform(0, cap))
+
+    def _call(self, prompt, model, stream, **kwargs):
+        """Start one request, retrying transient errors"""
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise CircuitOpenError("AI service is temporarily unavailable")
+            try:
+                self.calls += 1
+                response = self.model(model).generate_content(
+                    prompt, stream=stream,
+                    request_options={'timeout': self.timeout}, **kwargs
+                )
+                self.breaker.record_success()
+                return response
+            except RETRYABLE_ERRORS as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    self.failures += 1
+                    raise
+                print(f"LLM call failed ({type(e).__name__}), retrying: {e}")
+                self.retries += 1
+                self._backoff(attempt)
+                attempt += 1
+            except Exception:
+                # The provider answered (e.g. a bad request): it is not down
+                self.breaker.record_success()
+                raise
+
+    def _observe(self, model, started, outcome, first_chunk=None):
+        if self.observer is not None:
+            self.observer(model, time.perf_counter() - started, outcome, first_chunk)
+
+    def generate(self, prompt, model=DEFAULT_MODEL, user_id=None, **kwargs):
+        """Complete response text for prompt"""
+        self._acquire(user_id)
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            text = self._call(prompt, model, False, **kwargs).text
+            outcome = 'ok'
+            return text
+        finally:
+            self._release(user_id)
+            self._observe(model, started, outcome)
+
+    def generate_stream(self, prompt, model=DEFAULT_MODEL, user_id=None, **kwargs):
+        """
+        Yield response text as it arrives. The call slot is held until the
+        stream is exhausted or the caller closes the generator.
+        """
+        self._acquire(user_id)
+        started = time.perf_counter()
+        first_chunk = None
+        outcome = 'error'
+        try:
+            response = self._call(prompt, model, True, **kwargs)
+            try:
+                for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunks without text (e.g. safety metadata only)
+                        continue
+                    if text:
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter() - started
+                        yield text
+                outcome = 'ok'
+            except RETRYABLE_ERRORS:
+                self.breaker.record_failure()
+                self.failures += 1
+                raise
+            except GeneratorExit:
+                outcome = 'cancelled'
+                raise
+        finally:
+            self._release(user_id)
+            self._observe(model, started, outcome, first_chunk)
+
+    def get_stats(self):
+        with self._slots:
+            active = self._active
+            users = len(self._active_by_user)
+        return {
+            'backend': self.backend.name,
+            'active': active,
+            'active_users': users,
+            'calls': self.calls,
+            'retries': self.retries,
+            'failures': self.failures,
+            'rejected': self.rejected,
+            'circuit': self.breaker.state,
+        }
@@ -0,0 +1,225 @@
+"""
+In-process metrics in the Prometheus text format
+Per-endpoint latency histograms, request and error counts, database
+queries per request, named stage timings (extract, prompt_build, llm,
+parse, db), LLM latency by model and the query monitor's findings.
+Everything is kept in memory per process, so with several workers each
+one is scraped or summed on the Prometheus side.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Registry plus the Flask hooks that feed the request metrics"""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        # Every engine: the app's, and any created by scripts in-process
+        event.listen(Engine, 'before_cursor_execute', self._count_query)
+
+    # -- recording ---------------------------------------------------------
+
+    def inc(self, name, amount=1, help='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counter = self._counters.setdefault(name, {'help': help, 'series': {}})
+            counter['series'][key] = counter['series'].get(key, 0) + amount
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, help='', **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms.setdefault(
+                name, {'help': help, 'buckets': buckets, 'series': {}}
+            )
+            series = histogram['series'].get(key)
+            if series is None:
+                series = histogram['series'][key] = [[0] * len(histogram['buckets']), 0.0, 0]
+            for i, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def stage(self, name):
+        """Time a named step of request or job processing"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - started,
+                         help='Time spent per processing stage', stage=name)
+
+    def observe_llm(self, model, seconds, outcome, first_chunk=None):
+        """LLM gateway observer: one call, and time to first chunk for streams"""
+        self.observe('llm_request_duration_seconds', seconds,
+                     help='LLM call latency by model and outcome',
+                     model=model, outcome=outcome)
+        if first_chunk is not None:
+            self.observe('llm_first_chunk_seconds', first_chunk,
+                         help='Time to the first streamed chunk by model',
+                         model=model)
+
+    def observe_queries(self, endpoint, method, report):
+        """Query monitor observer: slow queries, N+1 suspects, budget overruns"""
+        if report['slow']:
+            self.inc('db_slow_queries_total', len(report['slow']),
+                     help='Queries over the slow query threshold',
+                     endpoint=endpoint, method=method)
+        if report['suspects']:
+            self.inc('db_n_plus_one_suspects_total', len(report['suspects']),
+                     help='Statements repeated often enough to suggest N+1',
+                     endpoint=endpoint, method=method)
+        if report['over_budget']:
+            self.inc('db_query_budget_exceeded_total',
+                     help='Requests that ran more queries than their budget',
+                     endpoint=endpoint, method=method)
+
+    def collector(self, fn):
+        """
+        Register fn() -> iterable of (name, type, help, labels, value),
+        called at scrape time for values owned by other components.
+        """
+        self._collectors.append(fn)
+        return fn
+
+    # -- request hooks -----------------------------------------------------
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        # Mutable so queries run while a streamed body is sent still count
+        g.metrics_queries = [0]
+
+    def _count_query(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            queries = g.get('metrics_queries')
+            if queries is not None:
+                queries[0] += 1
+
+    def _finish_request(self, response):
+        started = g.get('metrics_started')
+        if started is None:
+            return response
+        g.metrics_recorded = True
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        method = request.method
+        status = response.status_code
+        queries = g.metrics_queries
+
+        def record():
+            self._record_request(endpoint, method, status,
+                                 time.perf_counter() - started, queries[0])
+
+        # Measure until the last byte of a streamed body was sent. Files
+        # (direct passthrough) never run call_on_close handlers.
+        if response.is_streamed and not response.direct_passthrough:
+            response.call_on_close(record)
+        else:
+            record()
+        return response
+
+    def _teardown_request(self, exc):
+        # Unhandled exceptions skip after_request handlers
+        started = g.get('metrics_started')
+        if exc is not None and started is not None and not g.get('metrics_recorded'):
+            endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+            self._record_request(endpoint, request.method, 500,
+                                 time.perf_counter() - started,
+                                 g.metrics_queries[0])
+
+    def _record_request(self, endpoint, method, status, seconds, queries):
+        self.observe('http_request_duration_seconds', seconds,
+                     help='Request latency by endpoint',
+                     endpoint=endpoint, method=method)
+        self.inc('http_requests_total',
+                 help='Requests by endpoint and status code',
+                 endpoint=endpoint, method=method, status=status)
+        if status >= 500:
+            self.inc('http_request_errors_total',
+                     help='Requests that ended in a server error',
+                     endpoint=endpoint, method=method)
+        self.observe('db_queries_per_request', queries, buckets=QUERY_BUCKETS,
+                     help='Database queries issued per request',
+                     endpoint=endpoint, method=method)
+
+    # -- exposition --------------------------------------------------------
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (0.0.4)"""
+        lines = []
+        with self._lock:
+            counters = {name: (c['help'], dict(c['series']))
+                        for name, c in self._counters.items()}
+            histograms = {name: (h['help'], h['buckets'],
+                                 {k: [list(s[0]), s[1], s[2]] for k, s in h['series'].items()})
+                          for name, h in self._histograms.items()}
+
+        for name, (help_text, series) in sorted(counters.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{_label_text(labels)} {_number(value)}')
+
+        for name, (help_text, buckets, series) in sorted(histograms.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, (counts, total, count) in sorted(series.items()):
+                for bound, bucket_count in zip(buckets, counts):
+                    bucket_labels = labels + (('le', _number(float(bound))),)
+                    lines.append(f'{name}_bucket{_label_text(bucket_labels)} {bucket_count}')
+                lines.append(f'{name}_bucket{_label_text(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{name}_sum{_label_text(labels)} {_number(total)}')
+                lines.append(f'{name}_count{_label_text(labels)} {count}')
+
+        collected = {}
+        for collector in self._collectors:
+            try:
+                for name, kind, help_text, labels, value in collector():
+                    entry = collected.setdefault(name, (kind, help_text, []))
+                    entry[2].append((tuple(sorted(labels.items())), value))
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+        for name, (kind, help_text, samples) in sorted(collected.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{name}{_label_text(labels)} {_number(value)}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,106 @@
+"""
+Bring an existing database up to date with models.py
+Creates missing tables, adds missing columns and creates missing indexes.
+Safe to run repeatedly; nothing is dropped or rewritten.
+Usage:
+    python migrate_db.py            apply changes
+    python migrate_db.py --dry-run  only print what would change
+"""
+import sys
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from web_app import app
+from models import db
+
+
+def column_ddl(column, dialect):
+    """ALTER TABLE ... ADD COLUMN clause for a model column"""
+    ddl = f'{column.name} {column.type.compile(dialect=dialect)}'
+    default = column.default.arg if column.default is not None else None
+    if default is not None and not callable(default):
+        ddl += f' DEFAULT {default!r}' if isinstance(default, str) \
+            else f' DEFAULT {default}'
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    for fk in column.foreign_keys:
+        target = fk.column
+        ddl += f' REFERENCES {target.table.name} ({target.name})'
+        if fk.ondelete:
+            ddl += f' ON DELETE {fk.ondelete}'
+    return ddl
+
+
+def pending_changes(engine):
+    """List of (description, callable) needed to match the models"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    changes = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append((
+                f'create table {table.name}',
+                lambda conn, t=table: t.create(conn, checkfirst=True)
+            ))
+            continue
+
+        columns = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                ddl = column_ddl(column, engine.dialect)
+                changes.append((
+                    f'add column {table.name}.{column.name}',
+                    lambda conn, t=table.name, d=ddl: conn.execute(
+                        text(f'ALTER TABLE {t} ADD COLUMN {d}')
+                    )
+                ))
+
+        indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                changes.append((f'create index {index.name}', index))
+    return changes
+
+
+def create_index(engine, index):
+    if engine.dialect.name == 'postgresql':
+        # Build without blocking writes to large tables like page_views
+        ddl = str(CreateIndex(index).compile(dialect=engine.dialect))
+        ddl = ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY IF NOT EXISTS', 1)
+        with engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT'
+        ) as conn:
+            conn.execute(text(ddl))
+    else:
+        with engine.begin() as conn:
+            index.create(conn, checkfirst=True)
+
+
+print("="*50)
+print("DATABASE MIGRATION")
+print("="*50)
+
+with app.app_context():
+    engine = db.engine
+    changes = pending_changes(engine)
+
+    if not changes:
+        print("✅ Database already matches the models")
+    for description, change in changes:
+        if '--dry-run' in sys.argv:
+            print(f"   • {description}")
+            continue
+        try:
+            if isinstance(change, db.Index):
+                create_index(engine, change)
+            else:
+                with engine.begin() as conn:
+                    change(conn)
+            print(f"✅ {description}")
+        except Exception as e:
+            print(f"❌ {description}: {e}")
+            sys.exit(1)
+
+    print("="*50)
@@ -6,7 +6,8 @@ from itsdangerous import URLSafeTimedSerializer
 from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from sqlalchemy import event, func, text
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -51,81 +52,86 @@ class User(UserMixin, db.Model):
     
 
     def get_stats(self):
-        total_flashcards = sum(
-            fs.card_count for fs in self.flashcard_sets
-        )
-        total_exams = len(self.exam_results)
-        
-        if total_exams > 0:
-            avg_score = sum(
-                er.percentage for er in self.exam_results
-            ) / total_exams
-        else:
-            avg_score = 0
-        
-        streak = self.calculate_streak()
-        
-        return {
-            'total_flashcards': total_flashcards,
-            'total_exams': total_exams,
-            'average_score': round(avg_score, 1),
-            'study_streak': streak,
-            'total_sets': len(self.flashcard_sets)
-        }
+        """Read the materialized totals from user_stats"""
+        row = db.session.get(UserStats, self.id)
+        if row is None:
+            row = rebuild_user_stats([self.id])[0]
+        return stats_dict(row)
     
     def calculate_streak(self):
-        if not self.study_sessions:
-            return 0
-        
-        study_dates = sorted(set(
-            session.created_at.date()
-            for session in self.study_sessions
-        ), reverse=True)
-        
-        if not study_dates:
-            return 0
-        
-        from datetime import date, timedelta
-        today = date.today()
-        
-        if study_dates[0] != today and \
-           study_dates[0] != today - timedelta(days=1):
-            return 0
-        
-        streak = 1
-        for i in range(len(study_dates) - 1):
-            if study_dates[i] - study_dates[i+1] == timedelta(days=1):
-                streak += 1
-            else:
-                break
-        
-        return streak
+        row = db.session.get(UserStats, self.id)
+        if row is None:
+            row = rebuild_user_stats([self.id])[0]
+        return current_streak(row)
+
+
+def current_streak(row, today=None):
+    """The stored run only counts while it reaches today or yesterday"""
+    if row is None or not row.last_active_date:
+        return 0
+    today = today or date.today()
+    if row.last_active_date < today - timedelta(days=1):
+        return 0
+    return row.current_streak or 0
+
+
+def stats_dict(row):
+    """Shape a UserStats row the way templates and /api/stats expect"""
+    total_exams = row.total_exams or 0
+    if total_exams > 0:
+        avg_score = (row.total_percentage or 0) / total_exams
+    else:
+        avg_score = 0
+    
+    return {
+        'total_flashcards': row.total_flashcards or 0,
+        'total_exams': total_exams,
+        'average_score': round(avg_score, 1),
+        'study_streak': current_streak(row),
+        'total_sets': row.total_sets or 0
+    }
 
 
 class FlashcardSet(db.Model):
     __tablename__ = 'flashcard_sets'
+    __table_args__ = (
+        db.Index('ix_flashcard_sets_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
         db.Integer, db.ForeignKey('users.id'), nullable=False
     )
     name = db.Column(db.String(200), nullable=False)
-    card_count = db.Column(db.Integer, default=0)
+    # active_history: the stats listeners need the old value even when the
+    # row was expired by a commit
+    card_count = db.column_property(
+        db.Column(db.Integer, default=0), active_history=True
+    )
     difficulty = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
 class ExamResult(db.Model):
     __tablename__ = 'exam_results'
+    __table_args__ = (
+        db.Index('ix_exam_results_user_created', 'user_id', 'created_at'),
+        db.Index('ix_exam_results_flashcard_set', 'flashcard_set_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
         db.Integer, db.ForeignKey('users.id'), nullable=False
     )
+    # active_history: moving an exam must know its old set
+    flashcard_set_id = db.column_property(db.Column(
+        db.Integer, db.ForeignKey('flashcard_sets.id', ondelete='SET NULL'),
+        nullable=True
+    ), active_history=True)
     exam_name = db.Column(db.String(200))
     score = db.Column(db.Integer)
     total_questions = db.Column(db.Integer)
-    percentage = db.Column(db.Float)
+    percentage = db.column_property(db.Column(db.Float), active_history=True)
     time_taken = db.Column(db.String(20))
     difficulty = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -133,6 +139,9 @@ class ExamResult(db.Model):
 
 class StudySession(db.Model):
     __tablename__ = 'study_sessions'
+    __table_args__ = (
+        db.Index('ix_study_sessions_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -144,6 +153,9 @@ class StudySession(db.Model):
 
 class ChatMessage(db.Model):
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        db.Index('ix_chat_messages_user_created', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(
@@ -156,6 +168,9 @@ class ChatMessage(db.Model):
 
 class PageView(db.Model):
     __tablename__ = 'page_views'
+    __table_args__ = (
+        db.Index('ix_page_views_created', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
@@ -168,4 +183,530 @@ class PageView(db.Model):
         return f'<PageView {self.page}>'
     
     
-    user = db.relationship('User', backref='chat_messages')
\ No newline at end of file
+    user = db.relationship('User', backref='chat_messages')
+
+class GenerationCacheEntry(db.Model):
+    __tablename__ = 'generation_cache'
+    __table_args__ = (
+        db.Index('ix_generation_cache_created', 'created_at'),
+    )
+    
+    key = db.Column(db.String(64), primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    hit_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Artifact(db.Model):
+    __tablename__ = 'artifacts'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'session_key', 'name',
+                            name='uq_artifact_scope'),
+        db.Index('ix_artifacts_expires', 'expires_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    session_key = db.Column(db.String(64), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    version = db.Column(db.Integer, default=1)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+
+class PageViewDaily(db.Model):
+    """Page views per day and page, compacted from page_views"""
+    __tablename__ = 'page_view_daily'
+    
+    day = db.Column(db.Date, primary_key=True)
+    page = db.Column(db.String(200), primary_key=True)
+    views = db.Column(db.Integer, default=0, nullable=False)
+
+
+class PageViewUserDaily(db.Model):
+    """Page views per day for each logged-in user"""
+    __tablename__ = 'page_view_user_daily'
+    
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    views = db.Column(db.Integer, default=0, nullable=False)
+
+
+class VisitorSketch(db.Model):
+    """HyperLogLog of the visitor IPs in compacted page views"""
+    __tablename__ = 'visitor_sketches'
+    
+    name = db.Column(db.String(40), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class RollupState(db.Model):
+    """High-water mark for each incremental compaction job"""
+    __tablename__ = 'rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    watermark = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class TrafficSketch(db.Model):
+    """Serialized HyperLogLog / top-k sketch for one day"""
+    __tablename__ = 'traffic_sketches'
+    
+    name = db.Column(db.String(40), primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class GenerationJob(db.Model):
+    """Queued flashcard/exam generation, run by background workers"""
+    __tablename__ = 'generation_jobs'
+    __table_args__ = (
+        db.Index('ix_generation_jobs_status_created', 'status', 'created_at'),
+        db.Index('ix_generation_jobs_user_created', 'user_id', 'created_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    session_key = db.Column(db.String(64), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    # queued -> running -> succeeded | failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    stage = db.Column(db.String(50), default='queued')
+    progress = db.Column(db.Float, default=0, nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Heartbeat: bumped on every progress update while running
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ChatSummary(db.Model):
+    """Rolling summary of a user's chat up to last_message_id"""
+    __tablename__ = 'chat_summaries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    last_message_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class UserStats(db.Model):
+    """Per-user totals, kept up to date as sets and exams are written"""
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_sets = db.Column(db.Integer, default=0, nullable=False)
+    total_flashcards = db.Column(db.Integer, default=0, nullable=False)
+    total_exams = db.Column(db.Integer, default=0, nullable=False)
+    total_percentage = db.Column(db.Float, default=0, nullable=False)
+    current_streak = db.Column(db.Integer, default=0, nullable=False)
+    longest_streak = db.Column(db.Integer, default=0, nullable=False)
+    last_active_date = db.Column(db.Date, nullable=True)
+    # Bumped on every write to the user's sets, exams or sessions; cached
+    # per-user pages are keyed on it
+    cache_generation = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class SetPerformance(db.Model):
+    """Per-set exam totals, kept up to date as exam results are written"""
+    __tablename__ = 'set_performance'
+    
+    flashcard_set_id = db.Column(
+        db.Integer, db.ForeignKey('flashcard_sets.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False,
+                        index=True)
+    exam_count = db.Column(db.Integer, default=0, nullable=False)
+    total_percentage = db.Column(db.Float, default=0, nullable=False)
+    last_exam_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def compute_user_stats(user_ids=None):
+    """Recompute totals from the source tables with grouped queries"""
+    totals = {}
+    
+    def row_for(user_id):
+        return totals.setdefault(user_id, {
+            'total_sets': 0, 'total_flashcards': 0,
+            'total_exams': 0, 'total_percentage': 0.0,
+        })
+    
+    sets = db.session.query(
+        FlashcardSet.user_id,
+        func.count(FlashcardSet.id),
+        func.coalesce(func.sum(FlashcardSet.card_count), 0)
+    )
+    exams = db.session.query(
+        ExamResult.user_id,
+        func.count(ExamResult.id),
+        func.coalesce(func.sum(ExamResult.percentage), 0)
+    )
+    if user_ids is not None:
+        sets = sets.filter(FlashcardSet.user_id.in_(user_ids))
+        exams = exams.filter(ExamResult.user_id.in_(user_ids))
+    
+    for user_id, count, cards in sets.group_by(FlashcardSet.user_id):
+        row = row_for(user_id)
+        row['total_sets'] = count
+        row['total_flashcards'] = int(cards)
+    for user_id, count, percentage in exams.group_by(ExamResult.user_id):
+        row = row_for(user_id)
+        row['total_exams'] = count
+        row['total_percentage'] = float(percentage)
+    
+    for user_id in user_ids or []:
+        row_for(user_id)
+    return totals
+
+
+# Day number expressions for the gaps-and-islands streak query, with the
+# day number that corresponds to 1970-01-01 on each dialect
+_DAY_NUMBER_SQL = {
+    'sqlite': ("CAST(julianday(date(created_at)) AS INTEGER)", 2440587),
+    'postgresql': ("(CAST(created_at AS DATE) - DATE '1970-01-01')", 0),
+}
+_EPOCH = date(1970, 1, 1)
+
+
+def compute_streaks(user_ids, connection=None):
+    """
+    Streak data per user computed in the database.
+
+    Consecutive study days form islands: day_number - row_number() is
+    constant within a run. Returns {user_id: (run_length_of_latest_island,
+    longest_run, last_active_date)}.
+    """
+    connection = connection or db.session.connection()
+    results = {user_id: (0, 0, None) for user_id in user_ids}
+    if not user_ids:
+        return results
+
+    dialect = connection.dialect.name
+    if dialect not in _DAY_NUMBER_SQL:
+        return _compute_streaks_python(user_ids, connection)
+    day_number, epoch_day = _DAY_NUMBER_SQL[dialect]
+
+    query = text(f"""
+        SELECT user_id, MAX(day_num) AS last_day, COUNT(*) AS run_length
+        FROM (
+            SELECT user_id, day_num,
+                   day_num - ROW_NUMBER() OVER (
+                       PARTITION BY user_id ORDER BY day_num
+                   ) AS island
+            FROM (
+                SELECT DISTINCT user_id, {day_number} AS day_num
+                FROM study_sessions
+                WHERE user_id IN :user_ids AND created_at IS NOT NULL
+            ) AS days
+        ) AS islands
+        GROUP BY user_id, island
+    """).bindparams(db.bindparam('user_ids', expanding=True))
+
+    for user_id, last_day, run_length in connection.execute(
+        query, {'user_ids': list(user_ids)}
+    ):
+        last_active = _EPOCH + timedelta(days=int(last_day) - epoch_day)
+        current, longest, latest = results[user_id]
+        if latest is None or last_active > latest:
+            current, latest = run_length, last_active
+        results[user_id] = (current, max(longest, run_length), latest)
+    return results
+
+
+def _compute_streaks_python(user_ids, connection):
+    """Fallback for databases without the day arithmetic used above"""
+    sessions = StudySession.__table__
+    days = {user_id: set() for user_id in user_ids}
+    for user_id, created_at in connection.execute(
+        db.select(sessions.c.user_id, sessions.c.created_at)
+        .where(sessions.c.user_id.in_(user_ids))
+    ):
+        if created_at is not None:
+            days[user_id].add(created_at.date())
+
+    results = {}
+    for user_id, user_days in days.items():
+        run = longest = 0
+        previous = None
+        for day in sorted(user_days):
+            if previous and day - previous == timedelta(days=1):
+                run += 1
+            else:
+                run = 1
+            longest = max(longest, run)
+            previous = day
+        results[user_id] = (run, longest, previous)
+    return results
+
+
+def rebuild_user_stats(user_ids=None):
+    """Overwrite user_stats from the source tables; returns the rows"""
+    if user_ids is None:
+        user_ids = [uid for (uid,) in db.session.query(User.id)]
+    totals = compute_user_stats(user_ids)
+    streaks = compute_streaks(user_ids)
+    
+    existing = {
+        row.user_id: row
+        for row in UserStats.query.filter(UserStats.user_id.in_(user_ids))
+    } if user_ids else {}
+    
+    rows = []
+    for user_id in user_ids:
+        row = existing.get(user_id)
+        if row is None:
+            row = UserStats(user_id=user_id)
+            db.session.add(row)
+        for column, value in totals[user_id].items():
+            setattr(row, column, value)
+        (row.current_streak, row.longest_streak,
+         row.last_active_date) = streaks[user_id]
+        row.updated_at = datetime.utcnow()
+        rows.append(row)
+    db.session.commit()
+    return rows
+
+
+def rebuild_set_performance(user_ids=None):
+    """Overwrite set_performance from exam_results; returns the row count"""
+    exams = db.session.query(
+        ExamResult.flashcard_set_id,
+        FlashcardSet.user_id,
+        func.count(ExamResult.id),
+        func.coalesce(func.sum(ExamResult.percentage), 0),
+        func.max(ExamResult.created_at)
+    ).join(
+        FlashcardSet, FlashcardSet.id == ExamResult.flashcard_set_id
+    )
+    stale = SetPerformance.query
+    if user_ids is not None:
+        exams = exams.filter(FlashcardSet.user_id.in_(user_ids))
+        stale = stale.filter(SetPerformance.user_id.in_(user_ids))
+    
+    stale.delete(synchronize_session=False)
+    count = 0
+    for set_id, user_id, exam_count, percentage, last_exam in exams.group_by(
+        ExamResult.flashcard_set_id, FlashcardSet.user_id
+    ):
+        db.session.add(SetPerformance(
+            flashcard_set_id=set_id, user_id=user_id, exam_count=exam_count,
+            total_percentage=float(percentage), last_exam_at=last_exam,
+            updated_at=datetime.utcnow()
+        ))
+        count += 1
+    db.session.commit()
+    return count
+
+
+def _apply_stats_delta(connection, user_id, **deltas):
+    """
+    Add deltas to a user's stats row inside the current transaction and
+    bump its cache generation
+    """
+    table = UserStats.__table__
+    values = {
+        column: table.c[column] + delta for column, delta in deltas.items()
+    }
+    values['cache_generation'] = table.c.cache_generation + 1
+    values['updated_at'] = datetime.utcnow()
+    result = connection.execute(
+        table.update().where(table.c.user_id == user_id).values(**values)
+    )
+    if result.rowcount:
+        return
+    
+    # No row yet (e.g. data from before user_stats existed): build it from
+    # the source tables, which already include the row being written
+    sets = FlashcardSet.__table__
+    exams = ExamResult.__table__
+    set_count, card_count = connection.execute(
+        db.select(func.count(sets.c.id),
+                  func.coalesce(func.sum(sets.c.card_count), 0))
+        .where(sets.c.user_id == user_id)
+    ).one()
+    exam_count, percentage = connection.execute(
+        db.select(func.count(exams.c.id),
+                  func.coalesce(func.sum(exams.c.percentage), 0))
+        .where(exams.c.user_id == user_id)
+    ).one()
+    current, longest, last_active = compute_streaks(
+        [user_id], connection
+    )[user_id]
+    connection.execute(table.insert().values(
+        user_id=user_id,
+        total_sets=set_count,
+        total_flashcards=int(card_count),
+        total_exams=exam_count,
+        total_percentage=float(percentage),
+        current_streak=current,
+        longest_streak=longest,
+        last_active_date=last_active,
+        cache_generation=1,
+        updated_at=datetime.utcnow()
+    ))
+
+
+def _apply_set_delta(connection, set_id, exam_count, percentage, exam_at=None):
+    """Add an exam (or remove one, with negative deltas) to a set's totals"""
+    if set_id is None:
+        return
+    table = SetPerformance.__table__
+    values = {
+        'exam_count': table.c.exam_count + exam_count,
+        'total_percentage': table.c.total_percentage + percentage,
+        'updated_at': datetime.utcnow(),
+    }
+    if exam_at is not None:
+        values['last_exam_at'] = db.case(
+            (table.c.last_exam_at.is_(None) | (table.c.last_exam_at < exam_at),
+             exam_at),
+            else_=table.c.last_exam_at
+        )
+    result = connection.execute(
+        table.update().where(table.c.flashcard_set_id == set_id).values(**values)
+    )
+    if result.rowcount or exam_count <= 0:
+        return
+    
+    user_id = connection.execute(
+        db.select(FlashcardSet.__table__.c.user_id)
+        .where(FlashcardSet.__table__.c.id == set_id)
+    ).scalar()
+    if user_id is None:
+        return
+    connection.execute(table.insert().values(
+        flashcard_set_id=set_id, user_id=user_id, exam_count=exam_count,
+        total_percentage=percentage, last_exam_at=exam_at,
+        updated_at=datetime.utcnow()
+    ))
+
+
+def _history_delta(target, attribute):
+    """
+    new - old for a numeric attribute changed in this flush; the
+    attribute must be declared with active_history=True
+    """
+    history = db.inspect(target).attrs[attribute].history
+    if not history.has_changes():
+        return 0
+    old = (history.deleted[0] if history.deleted else 0) or 0
+    new = (history.added[0] if history.added else 0) or 0
+    return new - old
+
+
+@event.listens_for(User, 'after_insert')
+def _user_inserted(mapper, connection, target):
+    connection.execute(UserStats.__table__.insert().values(
+        user_id=target.id, total_sets=0, total_flashcards=0,
+        total_exams=0, total_percentage=0, current_streak=0,
+        longest_streak=0, cache_generation=0, updated_at=datetime.utcnow()
+    ))
+
+
+@event.listens_for(FlashcardSet, 'after_insert')
+def _flashcard_set_inserted(mapper, connection, target):
+    _apply_stats_delta(connection, target.user_id,
+                       total_sets=1, total_flashcards=target.card_count or 0)
+
+
+@event.listens_for(FlashcardSet, 'after_delete')
+def _flashcard_set_deleted(mapper, connection, target):
+    _apply_stats_delta(connection, target.user_id,
+                       total_sets=-1, total_flashcards=-(target.card_count or 0))
+
+
+@event.listens_for(FlashcardSet, 'after_update')
+def _flashcard_set_updated(mapper, connection, target):
+    _apply_stats_delta(connection, target.user_id,
+                       total_flashcards=_history_delta(target, 'card_count'))
+
+
+@event.listens_for(ExamResult, 'after_insert')
+def _exam_result_inserted(mapper, connection, target):
+    _apply_stats_delta(connection, target.user_id,
+                       total_exams=1, total_percentage=target.percentage or 0)
+    _apply_set_delta(connection, target.flashcard_set_id,
+                     1, target.percentage or 0, target.created_at)
+
+
+@event.listens_for(ExamResult, 'after_delete')
+def _exam_result_deleted(mapper, connection, target):
+    _apply_stats_delta(connection, target.user_id,
+                       total_exams=-1, total_percentage=-(target.percentage or 0))
+    _apply_set_delta(connection, target.flashcard_set_id,
+                     -1, -(target.percentage or 0))
+
+
+@event.listens_for(ExamResult, 'after_update')
+def _exam_result_updated(mapper, connection, target):
+    _apply_stats_delta(connection, target.user_id,
+                       total_percentage=_history_delta(target, 'percentage'))
+    moved = db.inspect(target).attrs.flashcard_set_id.history
+    if moved.has_changes():
+        old_percentage = (target.percentage or 0) - _history_delta(target, 'percentage')
+        for old_set_id in moved.deleted:
+            _apply_set_delta(connection, old_set_id, -1, -old_percentage)
+        _apply_set_delta(connection, target.flashcard_set_id,
+                         1, target.percentage or 0, target.created_at)
+    else:
+        _apply_set_delta(connection, target.flashcard_set_id,
+                         0, _history_delta(target, 'percentage'))
+
+
+@event.listens_for(StudySession, 'after_update')
+def _study_session_updated(mapper, connection, target):
+    _apply_stats_delta(connection, target.user_id)
+
+
+@event.listens_for(StudySession, 'after_insert')
+def _study_session_inserted(mapper, connection, target):
+    """Extend, restart or keep the user's streak for the new study day"""
+    table = UserStats.__table__
+    day = (target.created_at or datetime.utcnow()).date()
+    row = connection.execute(
+        db.select(table.c.current_streak, table.c.longest_streak,
+                  table.c.last_active_date)
+        .where(table.c.user_id == target.user_id)
+    ).first()
+    
+    if row is None or (row.last_active_date and day < row.last_active_date):
+        # Missing row or a backdated session: recompute from scratch
+        _apply_stats_delta(connection, target.user_id)
+        current, longest, last_active = compute_streaks(
+            [target.user_id], connection
+        )[target.user_id]
+    elif row.last_active_date == day:
+        _apply_stats_delta(connection, target.user_id)
+        return
+    elif row.last_active_date == day - timedelta(days=1):
+        current = (row.current_streak or 0) + 1
+        longest = max(row.longest_streak or 0, current)
+        last_active = day
+    else:
+        current = 1
+        longest = max(row.longest_streak or 0, 1)
+        last_active = day
+    
+    connection.execute(
+        table.update().where(table.c.user_id == target.user_id).values(
+            current_streak=current,
+            longest_streak=longest,
+            last_active_date=last_active,
+            cache_generation=table.c.cache_generation + 1,
+            updated_at=datetime.utcnow()
+        )
+    )
@@ -0,0 +1,143 @@
+"""
+Streaming PDF text extraction
+Pages are yielded one at a time and joined once at the end. Large files
+can be split into page ranges and extracted on a process pool, and
+extraction can stop early once enough text has been collected.
+The pool is created once per process with the forkserver (or spawn)
+start method: forking a threaded web worker is unsafe, and a pool per
+request would leave children behind under load.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import PyPDF2
+
+PAGE_SEPARATOR = '\n\f\n'
+
+
+def iter_pdf_pages(pdf_path, start=0, stop=None):
+    """Yield the text of each page in [start, stop)"""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        pages = pdf_reader.pages
+        stop = len(pages) if stop is None else min(stop, len(pages))
+        for index in range(start, stop):
+            try:
+                yield pages[index].extract_text() or ''
+            except Exception as e:
+                print(f"Error reading PDF page {index + 1}: {e}")
+                yield ''
+
+
+def _extract_page_range(pdf_path, start, stop):
+    return list(iter_pdf_pages(pdf_path, start, stop))
+
+
+def count_pdf_pages(pdf_path):
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """The process's extraction pool, created on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            methods = multiprocessing.get_all_start_methods()
+            method = 'forkserver' if 'forkserver' in methods else 'spawn'
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(method)
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _reset_pool(pool):
+    """Drop a broken pool so the next call starts a fresh one"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@atexit.register
+def _shutdown_pool():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _iter_parallel(pdf_path, page_count, workers, range_size):
+    ranges = [
+        (start, min(start + range_size, page_count))
+        for start in range(0, page_count, range_size)
+    ]
+    pool = _get_pool(workers)
+    futures = [
+        pool.submit(_extract_page_range, pdf_path, start, stop)
+        for start, stop in ranges
+    ]
+    try:
+        # Consume in page order so early stopping keeps the document prefix
+        for future in futures:
+            for text in future.result():
+                yield text
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+    finally:
+        # Ranges not needed after an early stop are never started
+        for future in futures:
+            future.cancel()
+
+
+def extract_pdf_text(pdf_path, max_pages=None, max_chars=None,
+                     parallel_threshold=100, workers=None, range_size=25):
+    """
+    Extract text from a PDF.
+
+    max_pages / max_chars stop extraction early. Files with at least
+    parallel_threshold pages are extracted on a process pool.
+    """
+    parts = []
+    collected = 0
+    try:
+        page_count = count_pdf_pages(pdf_path)
+        if max_pages:
+            page_count = min(page_count, max_pages)
+
+        workers = workers or min(4, os.cpu_count() or 1)
+        if workers > 1 and parallel_threshold and page_count >= parallel_threshold:
+            try:
+                pages = _iter_parallel(pdf_path, page_count, workers, range_size)
+                for text in pages:
+                    parts.append(text)
+                    collected += len(text)
+                    if max_chars and collected >= max_chars:
+                        break
+                pages.close()
+                return PAGE_SEPARATOR.join(parts)
+            except (OSError, RuntimeError) as e:
+                # Process pools are unavailable on some serverless hosts
+                print(f"Parallel PDF extraction unavailable, falling back: {e}")
+                parts = []
+                collected = 0
+
+        for text in iter_pdf_pages(pdf_path, 0, page_count):
+            parts.append(text)
+            collected += len(text)
+            if max_chars and collected >= max_chars:
+                break
+    except Exception as e:
+        print(f"Error reading PDF: {e}")
+    return PAGE_SEPARATOR.join(parts)
@@ -0,0 +1,194 @@
+"""
+Route-level performance run against a stand-in LLM
+Drives /generate, /generate-exam and /api/chat through the Flask test
+client from several threads and reports latency percentiles. It uses
+the fake LLM backend by default, or recorded responses with
+LLM_BACKEND=replay, so runs need no network access or API key and can be
+repeated on an isolated machine.
+Usage:
+    python perf_routes.py [requests per route] [concurrency]
+    LLM_BACKEND=replay LLM_CASSETTE_DIR=cassettes python perf_routes.py
+    LLM_FAKE_LATENCY=uniform:0.2,0.6 python perf_routes.py 50 8
+"""
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Must be set before web_app reads its configuration
+os.environ.setdefault('LLM_BACKEND', 'fake')
+os.environ.setdefault('LLM_FAKE_LATENCY', 'lognormal:0.4,0.4')
+os.environ.setdefault('LLM_FAKE_SEED', '1')
+os.environ.setdefault('JOB_WORKERS', '0')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(
+    tempfile.mkdtemp(), 'perf_routes.db'
+))
+
+from web_app import app, llm
+from models import db, User
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+PASSWORD = 'perf-password'
+
+TOPICS = ['photosynthesis', 'the water cycle', 'plate tectonics',
+          'cell division', 'the French Revolution', 'supply and demand']
+
+
+def study_material(n):
+    """Distinct material per request, so the generation cache stays cold"""
+    topic = TOPICS[n % len(TOPICS)]
+    return '\n\n'.join(
+        f"Section {i} on {topic} (run {n}). The first important idea is "
+        f"that {topic} involves several connected stages. Each stage "
+        f"depends on conditions described in lecture {i}. Students should "
+        f"explain how the stages relate and give one example of each."
+        for i in range(1, 9)
+    )
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def ensure_user(n):
+    username = f'perf{n}'
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        user = User(username=username, email=f'{username}@example.com')
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+    return username
+
+
+def scenario_generate(client, n):
+    data = {'file': (io.BytesIO(study_material(n).encode()), 'notes.txt'),
+            'num_cards': '8', 'difficulty': 'medium', 'set_name': 'Perf'}
+    res = client.post('/generate', data=data, content_type='multipart/form-data')
+    return res.status_code == 200 and res.get_json().get('success'), None
+
+
+def scenario_generate_stream(client, n):
+    data = {'file': (io.BytesIO(study_material(n).encode()), 'notes.txt'),
+            'num_cards': '8', 'mode': 'stream'}
+    started = time.perf_counter()
+    res = client.post('/generate', data=data, content_type='multipart/form-data')
+    first_card = None
+    ok = False
+    for chunk in res.response:
+        text = chunk.decode() if isinstance(chunk, bytes) else chunk
+        if first_card is None and 'event: card' in text:
+            first_card = time.perf_counter() - started
+        if 'event: done' in text:
+            ok = True
+    return ok, first_card
+
+
+def upload_material(client, n):
+    """Untimed: fresh material for the exam, so it is not a cache hit"""
+    scenario_generate(client, n)
+
+
+def scenario_exam(client, n):
+    res = client.post('/generate-exam', data={'num_questions': '10'})
+    return res.status_code == 200 and res.get_json().get('success'), None
+
+
+def scenario_chat(client, n):
+    res = client.post('/api/chat', json={
+        'message': f'Can you explain the main idea of section {n % 8 + 1}?'
+    })
+    return res.status_code == 200 and res.get_json().get('success'), None
+
+
+# (name, timed request, untimed preparation)
+SCENARIOS = [
+    ('POST /generate', scenario_generate, None),
+    ('POST /generate (stream)', scenario_generate_stream, None),
+    ('POST /generate-exam', scenario_exam, upload_material),
+    ('POST /api/chat', scenario_chat, None),
+]
+
+
+def run_scenario(offset, fn, prepare, usernames):
+    timings, firsts, errors = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(REQUESTS))
+
+    def worker(username):
+        client = app.test_client()
+        client.post('/login', json={'username': username, 'password': PASSWORD})
+        # Chat needs material uploaded in this session
+        scenario_generate(client, offset - 1 - usernames.index(username))
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            # Every scenario gets its own material: no generation cache hits
+            n += offset
+            if prepare:
+                prepare(client, n)
+            started = time.perf_counter()
+            try:
+                ok, first = fn(client, n)
+            except Exception as e:
+                ok, first = False, None
+                print(f"   request error: {e}")
+            elapsed = time.perf_counter() - started
+            with lock:
+                timings.append(elapsed)
+                if first is not None:
+                    firsts.append(first)
+                if not ok:
+                    errors.append(n)
+
+    threads = [threading.Thread(target=worker, args=(u,)) for u in usernames]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return timings, firsts, errors, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    print("="*50)
+    print("ROUTE PERFORMANCE RUN")
+    print("="*50)
+    print(f"🤖 LLM backend: {llm.backend.name} "
+          f"({app.config['LLM_FAKE_LATENCY'] if llm.backend.name == 'fake' else app.config['LLM_CASSETTE_DIR']})")
+    print(f"📊 {REQUESTS} requests per route, {CONCURRENCY} concurrent clients")
+
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with app.app_context():
+        db.create_all()
+        usernames = [ensure_user(i) for i in range(CONCURRENCY)]
+
+    failed = 0
+    for index, (name, fn, prepare) in enumerate(SCENARIOS, 1):
+        timings, firsts, errors, wall = run_scenario(
+            index * 100000, fn, prepare, usernames
+        )
+        failed += len(errors)
+        status = '✅' if not errors else '❌'
+        print(f"\n{status} {name}")
+        print(f"   p50 {percentile(timings, 50) * 1000:7.0f} ms   "
+              f"p95 {percentile(timings, 95) * 1000:7.0f} ms   "
+              f"max {max(timings) * 1000:7.0f} ms")
+        print(f"   {len(timings) / wall:.1f} req/s, {len(errors)} errors")
+        if firsts:
+            print(f"   first card p50 {percentile(firsts, 50) * 1000:.0f} ms, "
+                  f"p95 {percentile(firsts, 95) * 1000:.0f} ms")
+
+    print("\n" + "="*50)
+    print(f"LLM gateway: {llm.get_stats()}")
+    if failed:
+        print(f"❌ {failed} failed requests")
+        sys.exit(1)
+    print("✅ Done")
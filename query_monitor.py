@@ -0,0 +1,157 @@
+"""
+Database query instrumentation
+Counts the statements each request runs, flags statements repeated with
+different parameters as suspected N+1 patterns, and logs queries slower
+than a threshold together with their EXPLAIN plan. Routes can declare a
+query budget with @query_budget(n); over-budget requests are logged, or
+fail with QueryBudgetExceeded when QUERY_BUDGET_ENFORCE is on (for test
+and CI runs).
+"""
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A route ran more queries than its declared budget"""
+
+
+def query_budget(limit):
+    """Declare the most queries a view may run per request"""
+    def decorator(fn):
+        fn.query_budget = limit
+        return fn
+    return decorator
+
+
+def _short(statement, length=200):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= length else statement[:length] + '...'
+
+
+def explain(cursor, dialect, statement, parameters):
+    """Plan lines for a statement, run on a fresh cursor of its connection"""
+    if dialect == 'postgresql':
+        prefix = 'EXPLAIN '
+    elif dialect == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        return []
+    # A plain DB-API cursor: EXPLAIN itself never reaches these listeners
+    explain_cursor = cursor.connection.cursor()
+    try:
+        explain_cursor.execute(prefix + statement, parameters)
+        return [str(row[-1]) for row in explain_cursor.fetchall()]
+    finally:
+        explain_cursor.close()
+
+
+class QueryMonitor:
+    """SQLAlchemy cursor listeners plus the request hooks that report"""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.n_plus_one_threshold = 5
+        self.slow_query_seconds = 0.2
+        self.explain_slow = True
+        self.enforce_budgets = False
+        # Optional callback(endpoint, method, report) per finished request
+        self.observer = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('QUERY_MONITOR', True)
+        self.n_plus_one_threshold = app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+        self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+        self.explain_slow = app.config.get('SLOW_QUERY_EXPLAIN', True)
+        self.enforce_budgets = app.config.get('QUERY_BUDGET_ENFORCE', False)
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+
+    # -- request hooks -----------------------------------------------------
+
+    def _start_request(self):
+        view = current_app.view_functions.get(request.endpoint)
+        g.query_report = {
+            'count': 0,
+            'statements': Counter(),
+            'slow': [],
+            'budget': getattr(view, 'query_budget', None),
+        }
+
+    def _finish_request(self, response):
+        report = g.get('query_report')
+        if report is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        method = request.method
+        if response.is_streamed and not response.direct_passthrough:
+            # Queries run while a streamed body is sent count too
+            response.call_on_close(lambda: self._report(endpoint, method, report))
+        else:
+            self._report(endpoint, method, report)
+        return response
+
+    def _report(self, endpoint, method, report):
+        report['suspects'] = [
+            (statement, times)
+            for statement, times in report['statements'].most_common()
+            if times >= self.n_plus_one_threshold
+        ]
+        for statement, times in report['suspects']:
+            print(f"Suspected N+1 on {method} {endpoint}: "
+                  f"{times}x {_short(statement)}")
+        budget = report['budget']
+        report['over_budget'] = budget is not None and report['count'] > budget
+        if report['over_budget']:
+            print(f"Query budget exceeded on {method} {endpoint}: "
+                  f"{report['count']} queries, budget {budget}")
+        if self.observer:
+            self.observer(endpoint, method, report)
+
+    # -- cursor listeners --------------------------------------------------
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._query_started = time.perf_counter()
+        report = g.get('query_report') if has_request_context() else None
+        if report is None:
+            return
+        report['count'] += 1
+        if not executemany:
+            # Same SQL text, different parameters: one query per row
+            report['statements'][statement] += 1
+        budget = report['budget']
+        if self.enforce_budgets and budget is not None and report['count'] > budget:
+            raise QueryBudgetExceeded(
+                f"{request.method} {request.path} ran more than {budget} queries"
+            )
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_query_started', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        if seconds < self.slow_query_seconds:
+            return
+
+        where = f"{request.method} {request.path}" if has_request_context() else 'no request'
+        print(f"Slow query ({seconds * 1000:.0f} ms, {where}): {_short(statement, 500)}")
+        if self.explain_slow and not executemany and \
+                statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            try:
+                for line in explain(cursor, conn.dialect.name, statement, parameters):
+                    print(f"    {line}")
+            except Exception as e:
+                print(f"    EXPLAIN failed: {e}")
+        report = g.get('query_report') if has_request_context() else None
+        if report is not None:
+            report['slow'].append((statement, seconds))
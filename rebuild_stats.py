@@ -0,0 +1,62 @@
+"""
+Rebuild or verify the materialized user_stats and set_performance tables
+Usage:
+    python rebuild_stats.py           rebuild every user's stats
+    python rebuild_stats.py --check   report rows that have drifted
+"""
+import sys
+
+from web_app import app
+from models import (db, User, UserStats, compute_user_stats,
+                    compute_streaks, rebuild_user_stats,
+                    rebuild_set_performance)
+
+COLUMNS = ['total_sets', 'total_flashcards', 'total_exams', 'total_percentage',
+           'current_streak', 'longest_streak', 'last_active_date']
+
+print("="*50)
+print("USER STATS REBUILD")
+print("="*50)
+
+with app.app_context():
+    db.create_all()
+
+    if '--check' in sys.argv:
+        user_ids = [uid for (uid,) in db.session.query(User.id)]
+        expected = compute_user_stats(user_ids)
+        for user_id, streak in compute_streaks(user_ids).items():
+            (expected[user_id]['current_streak'],
+             expected[user_id]['longest_streak'],
+             expected[user_id]['last_active_date']) = streak
+        stored = {row.user_id: row for row in UserStats.query}
+        mismatches = 0
+
+        for user_id in user_ids:
+            row = stored.get(user_id)
+            if row is None:
+                print(f"❌ User {user_id}: no stats row")
+                mismatches += 1
+                continue
+            for column in COLUMNS:
+                want = expected[user_id][column]
+                have = getattr(row, column)
+                if column != 'last_active_date':
+                    have = have or 0
+                    mismatch = abs(want - have) > 1e-6
+                else:
+                    mismatch = want != have
+                if mismatch:
+                    print(f"❌ User {user_id}: {column} is {have}, expected {want}")
+                    mismatches += 1
+
+        if mismatches:
+            print(f"\n❌ {mismatches} mismatches. Run without --check to fix.")
+            sys.exit(1)
+        print(f"✅ All {len(user_ids)} users consistent")
+    else:
+        rows = rebuild_user_stats()
+        print(f"✅ Rebuilt stats for {len(rows)} users")
+        sets = rebuild_set_performance()
+        print(f"✅ Rebuilt performance for {sets} flashcard sets")
+
+    print("="*50)
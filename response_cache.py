@@ -0,0 +1,88 @@
+"""
+Per-user cache for dashboard-style responses
+Entries are keyed by (user_id, view) and tagged with the user's
+cache_generation from user_stats. Every write to the user's sets, exams
+or study sessions bumps the generation, so a stale entry is simply never
+matched again; no explicit invalidation is needed across workers.
+"""
+import threading
+from collections import OrderedDict
+
+from models import db, UserStats
+
+
+def cache_generation(user_id):
+    """Current generation for user_id, or None if there is no stats row"""
+    row = db.session.get(UserStats, user_id)
+    return row.cache_generation if row is not None else None
+
+
+class ResponseCache:
+    """Bounded LRU of computed view payloads, validated by generation"""
+
+    def __init__(self, app=None):
+        self.max_entries = 1000
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.max_entries = app.config.get('RESPONSE_CACHE_SIZE', 1000)
+
+    def get_or_compute(self, user_id, view, compute, extra=None):
+        """
+        Return the cached payload for (user_id, view) if it was computed at
+        the current generation with the same extra key, otherwise call
+        compute() and cache its result.
+
+        extra covers inputs other than the user's data, e.g. today's date
+        for views with rolling windows.
+        """
+        generation = cache_generation(user_id) if self.enabled else None
+        if generation is None:
+            return compute()
+
+        key = (user_id, view)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation and entry[1] == extra:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (generation, extra, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
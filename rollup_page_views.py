@@ -0,0 +1,27 @@
+"""
+Compact page views into daily rollups and prune old raw rows
+Run this periodically (e.g. from cron):
+    python rollup_page_views.py
+"""
+from web_app import app
+from models import db
+from rollups import compact_page_views, prune_page_views
+
+print("="*50)
+print("PAGE VIEW ROLLUP")
+print("="*50)
+
+with app.app_context():
+    db.create_all()
+
+    compacted = compact_page_views()
+    print(f"✅ Compacted {compacted} page views into daily rollups")
+
+    retention_days = app.config['PAGE_VIEW_RETENTION_DAYS']
+    if retention_days:
+        deleted = prune_page_views(retention_days)
+        print(f"✅ Pruned {deleted} raw page views older than {retention_days} days")
+    else:
+        print("ℹ️  Retention disabled, keeping all raw page views")
+
+    print("="*50)
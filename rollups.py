@@ -0,0 +1,215 @@
+"""
+Daily rollups and retention for page_views
+compact_page_views() folds raw page views older than a short lag into
+per-day aggregate tables and advances a watermark. Admin queries read
+the rollups plus the small raw tail after the watermark, and
+prune_page_views() deletes compacted raw rows past the retention period.
+Unique visitors are kept as a fixed-size HyperLogLog, so no IP address
+outlives the raw rows it came from.
+"""
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import func
+
+from models import (db, PageView, PageViewDaily, PageViewUserDaily,
+                    VisitorSketch, RollupState)
+from traffic_sketch import HyperLogLog
+
+JOB_NAME = 'page_views'
+IN_CHUNK = 500
+
+
+def _as_date(value):
+    """func.date() gives a date on PostgreSQL but a string on SQLite"""
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _chunks(items, size=IN_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def get_watermark():
+    state = db.session.get(RollupState, JOB_NAME)
+    return state.watermark if state else None
+
+
+def _visitor_sketch():
+    row = db.session.get(VisitorSketch, JOB_NAME)
+    return HyperLogLog.from_json(row.data) if row else HyperLogLog()
+
+
+def _raw_tail(query, watermark):
+    if watermark is not None:
+        query = query.filter(PageView.created_at >= watermark)
+    return query
+
+
+def compact_page_views(now=None, lag=timedelta(minutes=5)):
+    """
+    Fold raw page views in [watermark, now - lag) into the rollup tables.
+
+    The lag leaves room for buffered page views that are still on their
+    way to the database. Returns the number of raw rows compacted.
+    """
+    cutoff = (now or datetime.utcnow()) - lag
+    state = db.session.get(RollupState, JOB_NAME)
+    start = state.watermark if state else None
+    if start is not None and start >= cutoff:
+        return 0
+
+    window = [PageView.created_at < cutoff]
+    if start is not None:
+        window.append(PageView.created_at >= start)
+    day = func.date(PageView.created_at)
+
+    compacted = 0
+    page_counts = db.session.query(
+        day, PageView.page, func.count(PageView.id)
+    ).filter(*window).group_by(day, PageView.page).all()
+    days = {_as_date(d) for d, _, _ in page_counts}
+    daily = {
+        (row.day, row.page): row
+        for batch in _chunks(days)
+        for row in PageViewDaily.query.filter(PageViewDaily.day.in_(batch))
+    }
+    for day_value, page, views in page_counts:
+        key = (_as_date(day_value), page or '')
+        row = daily.get(key)
+        if row is None:
+            row = daily[key] = PageViewDaily(day=key[0], page=key[1], views=0)
+            db.session.add(row)
+        row.views += views
+        compacted += views
+
+    user_counts = db.session.query(
+        day, PageView.user_id, func.count(PageView.id)
+    ).filter(*window, PageView.user_id.isnot(None)).group_by(
+        day, PageView.user_id
+    ).all()
+    user_daily = {
+        (row.day, row.user_id): row
+        for batch in _chunks(days)
+        for row in PageViewUserDaily.query.filter(PageViewUserDaily.day.in_(batch))
+    }
+    for day_value, user_id, views in user_counts:
+        key = (_as_date(day_value), user_id)
+        row = user_daily.get(key)
+        if row is None:
+            row = user_daily[key] = PageViewUserDaily(
+                day=key[0], user_id=user_id, views=0
+            )
+            db.session.add(row)
+        row.views += views
+
+    visitors = _visitor_sketch()
+    for (ip,) in db.session.query(PageView.ip_address).filter(
+        *window, PageView.ip_address.isnot(None)
+    ).distinct():
+        visitors.add(ip)
+    sketch = db.session.get(VisitorSketch, JOB_NAME)
+    if sketch is None:
+        sketch = VisitorSketch(name=JOB_NAME)
+        db.session.add(sketch)
+    sketch.data = visitors.to_json()
+    sketch.updated_at = datetime.utcnow()
+
+    if state is None:
+        state = RollupState(name=JOB_NAME)
+        db.session.add(state)
+    state.watermark = cutoff
+    state.updated_at = datetime.utcnow()
+    db.session.commit()
+    return compacted
+
+
+def maybe_compact(max_age=timedelta(minutes=10)):
+    """Compact if the last run is older than max_age"""
+    state = db.session.get(RollupState, JOB_NAME)
+    if state is not None and state.updated_at and \
+       state.updated_at > datetime.utcnow() - max_age:
+        return 0
+    try:
+        return compact_page_views()
+    except Exception as e:
+        print(f"Page view compaction error: {e}")
+        db.session.rollback()
+        return 0
+
+
+def prune_page_views(retention_days, batch_size=5000):
+    """Delete compacted raw page views older than retention_days, in batches"""
+    watermark = get_watermark()
+    if watermark is None or not retention_days:
+        return 0
+    cutoff = min(watermark, datetime.utcnow() - timedelta(days=retention_days))
+
+    deleted = 0
+    while True:
+        ids = [pid for (pid,) in db.session.query(PageView.id).filter(
+            PageView.created_at < cutoff
+        ).order_by(PageView.id).limit(batch_size)]
+        if not ids:
+            break
+        PageView.query.filter(PageView.id.in_(ids)).delete(
+            synchronize_session=False
+        )
+        db.session.commit()
+        deleted += len(ids)
+    return deleted
+
+
+def traffic_summary(today=None, top_pages=10):
+    """Admin traffic numbers from the rollups plus the raw tail"""
+    today = today or datetime.utcnow().date()
+    week_ago = today - timedelta(days=7)
+    today_start = datetime.combine(today, datetime.min.time())
+    week_start = datetime.combine(week_ago, datetime.min.time())
+    watermark = get_watermark()
+
+    rolled_total, rolled_today, rolled_week = db.session.query(
+        func.coalesce(func.sum(PageViewDaily.views), 0),
+        func.coalesce(func.sum(db.case(
+            (PageViewDaily.day == today, PageViewDaily.views), else_=0
+        )), 0),
+        func.coalesce(func.sum(db.case(
+            (PageViewDaily.day >= week_ago, PageViewDaily.views), else_=0
+        )), 0)
+    ).one()
+
+    tail = _raw_tail(db.session.query(PageView), watermark)
+    raw_total = tail.count()
+    raw_today = tail.filter(PageView.created_at >= today_start).count()
+    raw_week = tail.filter(PageView.created_at >= week_start).count()
+
+    visitors = _visitor_sketch()
+    for (ip,) in _raw_tail(db.session.query(PageView.ip_address), watermark) \
+            .filter(PageView.ip_address.isnot(None)).distinct():
+        visitors.add(ip)
+    unique_visitors = visitors.count()
+
+    pages = {}
+    rolled_pages = db.session.query(
+        PageViewDaily.page, func.sum(PageViewDaily.views)
+    ).group_by(PageViewDaily.page)
+    raw_pages = _raw_tail(db.session.query(
+        PageView.page, func.count(PageView.id)
+    ), watermark).group_by(PageView.page)
+    for page, views in list(rolled_pages) + list(raw_pages):
+        pages[page] = pages.get(page, 0) + int(views or 0)
+    popular_pages = [
+        {'page': page, 'count': views}
+        for page, views in sorted(pages.items(), key=lambda p: p[1],
+                                  reverse=True)[:top_pages]
+    ]
+
+    return {
+        'total_page_views': int(rolled_total) + raw_total,
+        'today_views': int(rolled_today) + raw_today,
+        'week_views': int(rolled_week) + raw_week,
+        'unique_visitors': unique_visitors,
+        'popular_pages': popular_pages,
+    }
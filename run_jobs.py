@@ -0,0 +1,20 @@
+"""
+Run generation job workers in the foreground
+Use this where the web process cannot keep background threads alive
+(set JOB_WORKERS=0 for the web app there).
+"""
+from web_app import app, job_queue
+
+print("="*50)
+print("GENERATION JOB WORKER")
+print("="*50)
+
+with app.app_context():
+    from models import db
+    db.create_all()
+
+print("✅ Waiting for jobs... (Ctrl+C to stop)")
+try:
+    job_queue.run_forever()
+except KeyboardInterrupt:
+    print("\n👋 Worker stopped")
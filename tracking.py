@@ -0,0 +1,170 @@
+"""
+Buffered page view tracking
+Requests push page views into a bounded in-memory queue and a
+background thread bulk-inserts them in batches, so tracking never
+adds a database round-trip to the request itself.
+"""
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime
+
+from models import db, PageView, User
+
+
+class PageViewBuffer:
+    """Bounded write-behind queue for PageView rows"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_size = 10000
+        self.batch_size = 200
+        self.flush_interval = 5.0
+        self.queue = None
+        self.dropped = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        # Callables run in the flusher thread (inside an app context) after
+        # each periodic flush
+        self.flush_hooks = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_size = app.config.get('PAGE_VIEW_QUEUE_SIZE', 10000)
+        self.batch_size = app.config.get('PAGE_VIEW_BATCH_SIZE', 200)
+        self.flush_interval = app.config.get('PAGE_VIEW_FLUSH_INTERVAL', 5.0)
+        self.queue = queue.Queue(maxsize=self.max_size)
+        atexit.register(self.shutdown)
+
+    def record(self, user_id, page, ip_address, user_agent):
+        """Queue a page view. Returns False if it was dropped."""
+        self._ensure_worker()
+        row = {
+            'user_id': user_id,
+            'page': page,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+            'created_at': datetime.utcnow(),
+        }
+        try:
+            self.queue.put_nowait(row)
+            if self.queue.qsize() >= self.batch_size:
+                self._wake.set()
+            return True
+        except queue.Full:
+            # Drop newest under back-pressure rather than block the request
+            with self._lock:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    print(f"Tracking queue full, dropped {self.dropped} page views")
+            return False
+
+    def _ensure_worker(self):
+        # Threads do not survive a fork, so restart the flusher per process
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid \
+           and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid \
+               and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                self.queue = queue.Queue(maxsize=self.max_size)
+            self._stop.clear()
+            self._worker_pid = pid
+            self._worker = threading.Thread(
+                target=self._run, name='page-view-flusher', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            self._run_hooks()
+
+    def _run_hooks(self):
+        for hook in self.flush_hooks:
+            try:
+                with self.app.app_context():
+                    hook()
+            except Exception as e:
+                print(f"Tracking hook error: {e}")
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self.queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def flush(self):
+        """Write everything currently queued"""
+        if self.queue is None:
+            return 0
+        rows = self._drain()
+        for start in range(0, len(rows), self.batch_size):
+            self._write(rows[start:start + self.batch_size])
+        return len(rows)
+
+    def _write(self, rows, retry=True):
+        try:
+            with self.app.app_context():
+                db.session.bulk_insert_mappings(PageView, rows)
+                db.session.commit()
+            with self._lock:
+                self.written += len(rows)
+        except Exception as e:
+            try:
+                with self.app.app_context():
+                    db.session.rollback()
+                    # Views queued before their account was deleted (possibly
+                    # in another worker) would fail the whole batch on the
+                    # foreign key; keep them as anonymous visits instead
+                    if retry and self._detach_deleted_users(rows):
+                        return self._write(rows, retry=False)
+            except Exception:
+                pass
+            print(f"Tracking flush error: {e}")
+
+    def _detach_deleted_users(self, rows):
+        """Null out user ids that no longer exist; True if any changed"""
+        user_ids = {row['user_id'] for row in rows if row['user_id'] is not None}
+        if not user_ids:
+            return False
+        existing = {uid for (uid,) in db.session.query(User.id).filter(
+            User.id.in_(user_ids)
+        )}
+        missing = user_ids - existing
+        for row in rows:
+            if row['user_id'] in missing:
+                row['user_id'] = None
+        return bool(missing)
+
+    def shutdown(self):
+        """Stop the flusher and write any pending page views"""
+        self._stop.set()
+        self._wake.set()
+        worker = self._worker
+        if worker is not None and worker.is_alive() and \
+           self._worker_pid == os.getpid():
+            worker.join(timeout=self.flush_interval + 5)
+        self.flush()
+        self._run_hooks()
+
+    def get_stats(self):
+        return {
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+        }
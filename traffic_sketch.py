@@ -0,0 +1,214 @@
+"""
+Streaming traffic counters for the admin panel
+Each worker keeps a HyperLogLog sketch of visitor IPs and a Space-Saving
+top-k of pages per day. The sketches are merged into the traffic_sketches
+table periodically, so answers combine every worker in constant memory.
+"""
+import base64
+import hashlib
+import json
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import db, TrafficSketch
+
+
+def _hash64(value):
+    digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HyperLogLog:
+    """Cardinality estimate with ~1.04/sqrt(2**p) relative error"""
+
+    def __init__(self, p=12, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+
+    def add(self, value):
+        h = _hash64(value)
+        index = h >> (64 - self.p)
+        rest = (h << self.p) & ((1 << 64) - 1)
+        rank = (64 - self.p + 1) if rest == 0 else (64 - rest.bit_length() + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(
+            2.0 ** -r for r in self.registers
+        )
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small-range correction: linear counting
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    def to_json(self):
+        return json.dumps({
+            'p': self.p,
+            'registers': base64.b64encode(bytes(self.registers)).decode('ascii'),
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        return cls(data['p'], base64.b64decode(data['registers']))
+
+
+class SpaceSaving:
+    """Top-k heavy hitters; counts overestimate by at most the stored error"""
+
+    def __init__(self, k=50, counters=None):
+        self.k = k
+        # item -> [count, error]
+        self.counters = counters or {}
+
+    def add(self, item, count=1):
+        entry = self.counters.get(item)
+        if entry is not None:
+            entry[0] += count
+        elif len(self.counters) < self.k:
+            self.counters[item] = [count, 0]
+        else:
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + count, floor]
+
+    def merge(self, other):
+        for item, (count, error) in other.counters.items():
+            entry = self.counters.setdefault(item, [0, 0])
+            entry[0] += count
+            entry[1] += error
+        if len(self.counters) > self.k:
+            keep = sorted(self.counters.items(), key=lambda kv: kv[1][0],
+                          reverse=True)[:self.k]
+            self.counters = dict(keep)
+        return self
+
+    def top(self, n=10):
+        ranked = sorted(self.counters.items(), key=lambda kv: kv[1][0],
+                        reverse=True)
+        return [(item, count) for item, (count, _) in ranked[:n]]
+
+    def to_json(self):
+        return json.dumps({'k': self.k, 'counters': self.counters})
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        return cls(data['k'], data['counters'])
+
+
+SKETCH_TYPES = {'hll': HyperLogLog, 'topk': SpaceSaving}
+
+
+class TrafficCounters:
+    """Per-day visitor and page sketches fed from track_page_view"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.persist_interval = 60
+        self.retention_days = 35
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_persist = time.monotonic()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.persist_interval = app.config.get('TRAFFIC_SKETCH_PERSIST_INTERVAL', 60)
+        self.retention_days = app.config.get('TRAFFIC_SKETCH_RETENTION_DAYS', 35)
+
+    @staticmethod
+    def _day_key(day):
+        return day.strftime('%Y-%m-%d')
+
+    def _pending_sketch(self, kind, day_key):
+        name = f'{kind}:{day_key}'
+        sketch = self._pending.get(name)
+        if sketch is None:
+            sketch = self._pending[name] = SKETCH_TYPES[kind]()
+        return sketch
+
+    def record(self, page, ip_address, when=None):
+        day_key = self._day_key(when or datetime.utcnow())
+        with self._lock:
+            self._pending_sketch('hll', day_key).add(ip_address)
+            self._pending_sketch('topk', day_key).add(page)
+
+    def maybe_persist(self):
+        if time.monotonic() - self._last_persist >= self.persist_interval:
+            self.persist()
+
+    def persist(self):
+        """Merge this worker's pending sketches into the database"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        self._last_persist = time.monotonic()
+        if not pending:
+            return
+
+        try:
+            for name, sketch in sorted(pending.items()):
+                row = TrafficSketch.query.filter_by(name=name) \
+                    .with_for_update().first()
+                if row is None:
+                    kind, day_key = name.split(':')
+                    row = TrafficSketch(
+                        name=name, kind=kind,
+                        day=datetime.strptime(day_key, '%Y-%m-%d').date()
+                    )
+                    db.session.add(row)
+                else:
+                    stored = SKETCH_TYPES[row.kind].from_json(row.data)
+                    sketch = stored.merge(sketch)
+                row.data = sketch.to_json()
+                row.updated_at = datetime.utcnow()
+            cutoff = datetime.utcnow().date() - timedelta(days=self.retention_days)
+            TrafficSketch.query.filter(
+                TrafficSketch.day < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            print(f"Traffic sketch persist error: {e}")
+            db.session.rollback()
+            # Keep the data for the next attempt
+            with self._lock:
+                for name, sketch in pending.items():
+                    current = self._pending.get(name)
+                    self._pending[name] = sketch.merge(current) if current else sketch
+
+    def _combined(self, kind, days):
+        """Stored sketches for the given days merged with pending ones"""
+        names = [f'{kind}:{self._day_key(day)}' for day in days]
+        combined = SKETCH_TYPES[kind]()
+        for row in TrafficSketch.query.filter(TrafficSketch.name.in_(names)):
+            combined.merge(SKETCH_TYPES[kind].from_json(row.data))
+        with self._lock:
+            for name in names:
+                if name in self._pending:
+                    combined.merge(self._pending[name])
+        return combined
+
+    def summary(self, today=None, top_pages=10):
+        today = today or datetime.utcnow().date()
+        week = [today - timedelta(days=offset) for offset in range(7)]
+        return {
+            'unique_today': self._combined('hll', [today]).count(),
+            'unique_week': self._combined('hll', week).count(),
+            'trending_pages': [
+                {'page': page, 'count': count}
+                for page, count in self._combined('topk', week).top(top_pages)
+            ],
+        }
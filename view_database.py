@@ -10,6 +10,9 @@ print("DATABASE VIEWER - AI FLASHCARD CREATOR")
 print("="*60)
 
 with app.app_context():
+    # One lookup for every row below instead of a query per row
+    usernames = dict(db.session.query(User.id, User.username))
+    
     # View Users
     print("\n👥 USERS:")
     print("-"*60)
@@ -33,7 +36,7 @@ with app.app_context():
     if sets:
         for s in sets:
             print(f"\n🆔 ID: {s.id}")
-            print(f"   User ID: {s.user_id} ({User.query.get(s.user_id).username})")
+            print(f"   User ID: {s.user_id} ({usernames.get(s.user_id)})")
             print(f"   Name: {s.name}")
             print(f"   Cards: {s.card_count}")
             print(f"   Difficulty: {s.difficulty}")
@@ -49,7 +52,7 @@ with app.app_context():
     if exams:
         for exam in exams:
             print(f"\n🆔 ID: {exam.id}")
-            print(f"   User: {User.query.get(exam.user_id).username}")
+            print(f"   User: {usernames.get(exam.user_id)}")
             print(f"   Exam: {exam.exam_name}")
             print(f"   Score: {exam.score}/{exam.total_questions} ({exam.percentage}%)")
             print(f"   Time: {exam.time_taken}")
@@ -64,7 +67,7 @@ with app.app_context():
     
     if sessions:
         for session in sessions:
-            print(f"   {User.query.get(session.user_id).username} - {session.activity_type} - {session.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
+            print(f"   {usernames.get(session.user_id)} - {session.activity_type} - {session.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
     else:
         print("   No study sessions found")
     
@@ -76,7 +79,7 @@ with app.app_context():
     if messages:
         print(f"   (Showing first 10 messages)")
         for msg in messages:
-            print(f"\n   {User.query.get(msg.user_id).username} ({msg.role}):")
+            print(f"\n   {usernames.get(msg.user_id)} ({msg.role}):")
             print(f"   {msg.message[:80]}...")
             print(f"   {msg.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
     else:
@@ -7,30 +7,49 @@ import secrets
 from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer
 import os
-import tempfile
+import io
+import base64
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, flash
+from flask import (Flask, render_template, request, redirect, url_for, jsonify,
+                   send_file, flash, Response, stream_with_context)
 
 from flask_login import (LoginManager, login_user,
                          logout_user, login_required, current_user)
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
-import google.generativeai as genai
-import PyPDF2
 import json
 from datetime import datetime, timedelta
 import csv
 
-from models import (db, User, FlashcardSet,
-                    ExamResult, StudySession, ChatMessage, PageView)
+from models import (db, User, FlashcardSet, ExamResult,
+                    StudySession, ChatMessage, ChatSummary, PageView,
+                    PageViewUserDaily, UserStats, SetPerformance, GenerationJob,
+                    rebuild_user_stats, stats_dict)
+from tracking import PageViewBuffer
+from generation_cache import GenerationCache, make_cache_key
+from chunking import generate_chunked, generate_chunked_stream, dedupe_items
+from card_parser import (FlashcardStreamParser, MCQStreamParser,
+                         JSONStreamParser, FLASHCARDS_SCHEMA, MCQS_SCHEMA,
+                         parse_generated)
+from pdf_extract import extract_pdf_text
+from artifact_store import ArtifactStore
+from rollups import maybe_compact, traffic_summary
+from traffic_sketch import TrafficCounters
+from response_cache import ResponseCache
+from chat_context import ChatContext, clip_to_tokens
+from llm_gateway import LLMGateway, LLMError
+from jobs import JobQueue, JobError
+from metrics import Metrics
+from query_monitor import QueryMonitor, query_budget
 
 load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 database_url = os.getenv("DATABASE_URL")
 secret_key = os.getenv("SECRET_KEY", "fallback-secret-key")
 
-# Configure Gemini API
-genai.configure(api_key=api_key)
+MODEL_NAME = 'gemini-2.5-flash'
+# Bump whenever the generation prompts change so cached results are not reused
+PROMPT_VERSION = 2
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secret_key
@@ -62,7 +81,132 @@ app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
 app.config['UPLOAD_FOLDER'] = '/tmp/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
+# Page views are buffered and written in batches by a background thread
+app.config['PAGE_VIEW_QUEUE_SIZE'] = int(os.getenv('PAGE_VIEW_QUEUE_SIZE', 10000))
+app.config['PAGE_VIEW_BATCH_SIZE'] = int(os.getenv('PAGE_VIEW_BATCH_SIZE', 200))
+app.config['PAGE_VIEW_FLUSH_INTERVAL'] = float(os.getenv('PAGE_VIEW_FLUSH_INTERVAL', 5))
+# Raw page views are compacted into daily rollups and pruned after this many days
+app.config['PAGE_VIEW_RETENTION_DAYS'] = int(os.getenv('PAGE_VIEW_RETENTION_DAYS', 90))
+app.config['ROLLUP_INTERVAL'] = int(os.getenv('ROLLUP_INTERVAL', 600))
+# Real-time visitor/page sketches, merged into the database this often
+app.config['TRAFFIC_SKETCH_PERSIST_INTERVAL'] = int(os.getenv('TRAFFIC_SKETCH_PERSIST_INTERVAL', 60))
+
+# Generated flashcards/exams are cached by content hash
+app.config['GENERATION_CACHE_ENABLED'] = os.getenv('GENERATION_CACHE_ENABLED', 'True') == 'True'
+app.config['GENERATION_CACHE_SIZE'] = int(os.getenv('GENERATION_CACHE_SIZE', 256))
+app.config['GENERATION_CACHE_MAX_ROWS'] = int(os.getenv('GENERATION_CACHE_MAX_ROWS', 5000))
+app.config['GENERATION_CACHE_TTL'] = int(os.getenv('GENERATION_CACHE_TTL', 7 * 24 * 3600))
+
+# Large documents are split into chunks generated concurrently
+app.config['GENERATION_CHUNK_CHARS'] = int(os.getenv('GENERATION_CHUNK_CHARS', 12000))
+app.config['GENERATION_MAX_WORKERS'] = int(os.getenv('GENERATION_MAX_WORKERS', 4))
+# 'json' asks Gemini for schema-constrained JSON; 'text' for the Q1:/A1:
+# format. Applies to streamed generation too.
+app.config['GENERATION_OUTPUT'] = os.getenv('GENERATION_OUTPUT', 'json')
+# How the study page generates: 'stream' shows items as they arrive,
+# 'async' runs a background job and polls it, 'sync' waits for the result
+app.config['STUDY_GENERATION_MODE'] = os.getenv('STUDY_GENERATION_MODE', 'stream')
+# Follow-up requests for only the missing items when a generation comes
+# back short (0 disables)
+app.config['GENERATION_TOP_UP_ROUNDS'] = int(os.getenv('GENERATION_TOP_UP_ROUNDS', 1))
+
+# PDF extraction: process-pool fan-out for big files, optional early stop
+app.config['PDF_PARALLEL_PAGES'] = int(os.getenv('PDF_PARALLEL_PAGES', 100))
+app.config['PDF_WORKERS'] = int(os.getenv('PDF_WORKERS', 0)) or None
+app.config['PDF_MAX_PAGES'] = int(os.getenv('PDF_MAX_PAGES', 0)) or None
+# 0 reads the whole document; otherwise stop after this much text per card
+app.config['PDF_CHARS_PER_CARD'] = int(os.getenv('PDF_CHARS_PER_CARD', 0))
+
+# Last flashcards/exam/study text per user session: 'database' or 'disk'
+app.config['ARTIFACT_BACKEND'] = os.getenv('ARTIFACT_BACKEND', 'database')
+app.config['ARTIFACT_DIR'] = os.getenv('ARTIFACT_DIR', '/tmp/artifacts')
+app.config['ARTIFACT_TTL'] = int(os.getenv('ARTIFACT_TTL', 24 * 3600))
+
+# Dashboard/analytics payloads cached per user until their data changes
+app.config['RESPONSE_CACHE_SIZE'] = int(os.getenv('RESPONSE_CACHE_SIZE', 1000))
+
+# Study Buddy prompt budget (approximate tokens): recent turns verbatim,
+# older turns folded into a rolling summary
+app.config['CHAT_HISTORY_TOKENS'] = int(os.getenv('CHAT_HISTORY_TOKENS', 1500))
+app.config['CHAT_SUMMARY_TOKENS'] = int(os.getenv('CHAT_SUMMARY_TOKENS', 400))
+app.config['CHAT_STUDY_TOKENS'] = int(os.getenv('CHAT_STUDY_TOKENS', 500))
+app.config['CHAT_RECENT_TURNS'] = int(os.getenv('CHAT_RECENT_TURNS', 6))
+app.config['CHAT_SUMMARY_BATCH'] = int(os.getenv('CHAT_SUMMARY_BATCH', 6))
+
+# Gemini calls: concurrency limits, timeouts, retries, circuit breaker
+app.config['LLM_MAX_CONCURRENCY'] = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+app.config['LLM_MAX_PER_USER'] = int(os.getenv('LLM_MAX_PER_USER', 4))
+app.config['LLM_QUEUE_TIMEOUT'] = float(os.getenv('LLM_QUEUE_TIMEOUT', 30))
+app.config['LLM_TIMEOUT'] = float(os.getenv('LLM_TIMEOUT', 60))
+app.config['LLM_MAX_RETRIES'] = int(os.getenv('LLM_MAX_RETRIES', 3))
+app.config['LLM_BREAKER_THRESHOLD'] = int(os.getenv('LLM_BREAKER_THRESHOLD', 5))
+app.config['LLM_BREAKER_RESET'] = int(os.getenv('LLM_BREAKER_RESET', 30))
+# gemini, fake (local stand-in for load tests), record (Gemini, saving
+# every response to LLM_CASSETTE_DIR) or replay (recorded responses only)
+app.config['LLM_BACKEND'] = os.getenv('LLM_BACKEND', 'gemini')
+app.config['LLM_CASSETTE_DIR'] = os.getenv('LLM_CASSETTE_DIR', 'cassettes')
+app.config['LLM_FAKE_LATENCY'] = os.getenv('LLM_FAKE_LATENCY', 'lognormal:1.2,0.5')
+app.config['LLM_FAKE_ERROR_RATE'] = float(os.getenv('LLM_FAKE_ERROR_RATE', 0))
+app.config['LLM_FAKE_SEED'] = os.getenv('LLM_FAKE_SEED')
+app.config['LLM_REPLAY_TIMING'] = os.getenv('LLM_REPLAY_TIMING', 'False') == 'True'
+
+# Background generation jobs; set JOB_WORKERS=0 and run run_jobs.py
+# where request handlers cannot keep threads alive (e.g. serverless).
+# Running jobs beat every JOB_HEARTBEAT seconds; silent ones are requeued
+# after JOB_STALE_AFTER (at least four heartbeats)
+app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))
+app.config['JOB_STALE_AFTER'] = int(os.getenv('JOB_STALE_AFTER', 300))
+app.config['JOB_HEARTBEAT'] = int(os.getenv('JOB_HEARTBEAT', 30))
+
+# /metrics is for the admin, or for scrapers sending this bearer token
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+
+# Query instrumentation: statements repeated this often in one request are
+# reported as suspected N+1, slower ones are logged with their EXPLAIN plan.
+# QUERY_BUDGET_ENFORCE=True makes routes over their @query_budget fail
+# (for test and CI runs) instead of only logging.
+app.config['QUERY_MONITOR'] = os.getenv('QUERY_MONITOR', 'True') == 'True'
+app.config['N_PLUS_ONE_THRESHOLD'] = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 200))
+app.config['SLOW_QUERY_EXPLAIN'] = os.getenv('SLOW_QUERY_EXPLAIN', 'True') == 'True'
+app.config['QUERY_BUDGET_ENFORCE'] = os.getenv('QUERY_BUDGET_ENFORCE', 'False') == 'True'
+
 db.init_app(app)
+metrics = Metrics(app)
+query_monitor = QueryMonitor(app)
+query_monitor.observer = metrics.observe_queries
+page_view_buffer = PageViewBuffer(app)
+traffic_counters = TrafficCounters(app)
+page_view_buffer.flush_hooks.append(traffic_counters.maybe_persist)
+generation_cache = GenerationCache(app)
+artifact_store = ArtifactStore(app)
+response_cache = ResponseCache(app)
+chat_context = ChatContext(app)
+llm = LLMGateway(app, api_key=api_key)
+llm.observer = metrics.observe_llm
+job_queue = JobQueue(app)
+
+
+@metrics.collector
+def component_metrics():
+    gateway = llm.get_stats()
+    for name in ('calls', 'retries', 'failures', 'rejected'):
+        yield (f'llm_gateway_{name}_total', 'counter',
+               f'LLM gateway {name}', {}, gateway[name])
+    yield ('llm_gateway_active', 'gauge', 'LLM calls in flight', {}, gateway['active'])
+
+    cache = response_cache.get_stats()
+    yield ('response_cache_hits_total', 'counter', 'Response cache hits', {}, cache['hits'])
+    yield ('response_cache_misses_total', 'counter', 'Response cache misses', {}, cache['misses'])
+    yield ('response_cache_entries', 'gauge', 'Response cache entries', {}, cache['entries'])
+
+    cache = generation_cache.get_stats()
+    yield ('generation_cache_hits_total', 'counter', 'Generation cache hits by tier',
+           {'tier': 'memory'}, cache['memory_hits'])
+    yield ('generation_cache_hits_total', 'counter', 'Generation cache hits by tier',
+           {'tier': 'db'}, cache['db_hits'])
+    yield ('generation_cache_misses_total', 'counter', 'Generation cache misses', {}, cache['misses'])
+
 
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -79,9 +223,10 @@ except:
 # Track page views
 @app.before_request
 def track_page_view():
-    """Track every page view in database"""
+    """Queue every page view for a batched database write"""
     if request.path.startswith('/static') or \
        request.path.startswith('/toggle-') or \
+       request.path == '/metrics' or \
        request.path == '/favicon.ico' or \
        request.path == '/favicon.png':
         return
@@ -92,17 +237,15 @@ def track_page_view():
         user_agent = request.headers.get('User-Agent', '')[:500]
         page = request.path
         
-        page_view = PageView(
+        page_view_buffer.record(
             user_id=user_id,
             page=page,
             ip_address=ip_address,
             user_agent=user_agent
         )
-        db.session.add(page_view)
-        db.session.commit()
+        traffic_counters.record(page, ip_address)
     except Exception as e:
         print(f"Tracking error: {e}")
-        db.session.rollback()
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -137,35 +280,71 @@ def save_profile_photo(photo):
     
     return photo_filename
 
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-    except Exception as e:
-        print(f"Error reading PDF: {e}")
-    return text
+def extract_text_from_pdf(pdf_path, num_cards=None):
+    max_chars = None
+    if num_cards and app.config['PDF_CHARS_PER_CARD']:
+        max_chars = num_cards * app.config['PDF_CHARS_PER_CARD']
+    return extract_pdf_text(
+        pdf_path,
+        max_pages=app.config['PDF_MAX_PAGES'],
+        max_chars=max_chars,
+        parallel_threshold=app.config['PDF_PARALLEL_PAGES'],
+        workers=app.config['PDF_WORKERS']
+    )
 
-def extract_text_from_file(filepath):
+def extract_text_from_file(filepath, num_cards=None):
     file_extension = filepath.lower().split('.')[-1]
     if file_extension == 'pdf':
-        return extract_text_from_pdf(filepath)
+        return extract_text_from_pdf(filepath, num_cards)
     elif file_extension in ['txt', 'md']:
         with open(filepath, 'r', encoding='utf-8') as f:
             return f.read()
     return None
 
-def generate_flashcards(study_text, num_cards=5, difficulty="medium"):
-    prompt = f"""
-You are an expert teacher creating study flashcards.
-Read this study material and create {num_cards} flashcards.
-Difficulty level: {difficulty}
+def generate_flashcards(study_text, num_cards=5, difficulty="medium",
+                        user_id=None, on_progress=None, stats=None):
+    cache_key = flashcards_cache_key(study_text, num_cards, difficulty)
+    cached = generation_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    stats = stats if stats is not None else {}
+    flashcards = generate_items_chunked(
+        'flashcards', flashcards_prompt, study_text, num_cards, difficulty,
+        user_id, on_progress, stats
+    )
+    cache_if_complete(cache_key, 'flashcards', flashcards, num_cards, stats)
+    return flashcards
 
-STUDY MATERIAL:
-{study_text}
+def stream_flashcards(study_text, num_cards=5, difficulty="medium",
+                      user_id=None):
+    """Yield flashcards one by one while Gemini writes them"""
+    failures = []
+    return cached_stream(
+        flashcards_cache_key(study_text, num_cards, difficulty), 'flashcards',
+        stream_items_chunked(
+            stream_flashcards_for_chunk, study_text, num_cards, difficulty,
+            user_id, failures
+        ),
+        num_cards, failures
+    )
+
+def flashcards_cache_key(study_text, num_cards, difficulty):
+    return make_cache_key(
+        'flashcards', study_text,
+        {'num_cards': num_cards, 'difficulty': difficulty},
+        MODEL_NAME, llm.backend.name, PROMPT_VERSION
+    )
 
+def flashcards_prompt(study_text, num_cards, difficulty, json_output=False,
+                      existing=None):
+    if json_output:
+        output_format = """
+Return a JSON array with one object per flashcard, each with a
+"question" and an "answer".
+"""
+    else:
+        output_format = f"""
 FORMAT (follow exactly):
 Q1: [question here]
 A1: [answer here]
@@ -175,49 +354,73 @@ A2: [answer here]
 
 Continue for all {num_cards} questions.
 """
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        return parse_flashcards(response.text)
-    except Exception as e:
-        print(f"Error generating flashcards: {e}")
-        return []
-
-def parse_flashcards(text):
-    flashcards = []
-    lines = text.strip().split('\n')
-    current_question = None
-    current_answer = None
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith('Q') and ':' in line:
-            if current_question and current_answer:
-                flashcards.append({
-                    "question": current_question,
-                    "answer": current_answer
-                })
-            current_question = line.split(':', 1)[1].strip()
-            current_answer = None
-        elif line.startswith('A') and ':' in line:
-            current_answer = line.split(':', 1)[1].strip()
-
-    if current_question and current_answer:
-        flashcards.append({
-            "question": current_question,
-            "answer": current_answer
-        })
-    return flashcards
-
-def generate_mcq_exam(study_text, num_questions=10, difficulty="medium"):
-    prompt = f"""
-You are an expert teacher creating a practice exam.
-Read this study material and create {num_questions} MCQs.
+    return f"""
+You are an expert teacher creating study flashcards.
+Read this study material and create {num_cards} flashcards.
 Difficulty level: {difficulty}
 
 STUDY MATERIAL:
 {study_text}
+{existing_questions_text(existing)}{output_format}"""
+
+def stream_flashcards_for_chunk(study_text, num_cards, difficulty,
+                                user_id=None, existing=None, failures=None):
+    json_output = app.config['GENERATION_OUTPUT'] == 'json'
+    prompt = flashcards_prompt(
+        study_text, num_cards, difficulty, json_output, existing
+    )
+    parser = JSONStreamParser('flashcards') if json_output \
+        else FlashcardStreamParser()
+    yield from stream_parsed(
+        prompt, parser, user_id, 'flashcards', failures,
+        **output_options('flashcards', json_output)
+    )
+
+def generate_mcq_exam(study_text, num_questions=10, difficulty="medium",
+                      user_id=None, on_progress=None, stats=None):
+    cache_key = exam_cache_key(study_text, num_questions, difficulty)
+    cached = generation_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    stats = stats if stats is not None else {}
+    mcqs = generate_items_chunked(
+        'exam', mcqs_prompt, study_text, num_questions, difficulty,
+        user_id, on_progress, stats
+    )
+    cache_if_complete(cache_key, 'exam', mcqs, num_questions, stats)
+    return mcqs
+
+def stream_mcq_exam(study_text, num_questions=10, difficulty="medium",
+                    user_id=None):
+    """Yield exam questions one by one while Gemini writes them"""
+    failures = []
+    return cached_stream(
+        exam_cache_key(study_text, num_questions, difficulty), 'exam',
+        stream_items_chunked(
+            stream_mcqs_for_chunk, study_text, num_questions, difficulty,
+            user_id, failures
+        ),
+        num_questions, failures
+    )
+
+def exam_cache_key(study_text, num_questions, difficulty):
+    return make_cache_key(
+        'exam', study_text,
+        {'num_questions': num_questions, 'difficulty': difficulty},
+        MODEL_NAME, llm.backend.name, PROMPT_VERSION
+    )
 
+def mcqs_prompt(study_text, num_questions, difficulty, json_output=False,
+                existing=None):
+    if json_output:
+        output_format = """
+Return a JSON array with one object per question: "question", "options"
+(an object with the keys "A", "B", "C" and "D") and "correct" (the
+letter of the right option).
+"""
+    else:
+        output_format = f"""
 FORMAT (follow EXACTLY):
 Q1: [question here]
 A) [option A]
@@ -227,53 +430,219 @@ D) [option D]
 CORRECT: [A/B/C/D]
 
 Continue for all {num_questions} questions.
+"""
+    return f"""
+You are an expert teacher creating a practice exam.
+Read this study material and create {num_questions} MCQs.
+Difficulty level: {difficulty}
 
+STUDY MATERIAL:
+{study_text}
+{existing_questions_text(existing)}{output_format}
 RULES:
 - Make wrong options plausible
 - Vary correct answer positions
 - Test understanding not memorization
 """
+
+def stream_mcqs_for_chunk(study_text, num_questions, difficulty,
+                          user_id=None, existing=None, failures=None):
+    json_output = app.config['GENERATION_OUTPUT'] == 'json'
+    prompt = mcqs_prompt(
+        study_text, num_questions, difficulty, json_output, existing
+    )
+    parser = JSONStreamParser('exam') if json_output else MCQStreamParser()
+    yield from stream_parsed(
+        prompt, parser, user_id, 'MCQs', failures,
+        **output_options('exam', json_output)
+    )
+
+def existing_questions_text(existing):
+    """Prompt section listing questions a top-up request must not repeat"""
+    if not existing:
+        return ''
+    lines = ''.join(
+        f"- {clip_to_tokens(item['question'], 60)}\n" for item in existing[-50:]
+    )
+    return f"""
+These questions were already created. Do NOT repeat or rephrase them:
+{lines}"""
+
+GENERATION_SCHEMAS = {'flashcards': FLASHCARDS_SCHEMA, 'exam': MCQS_SCHEMA}
+
+def output_options(kind, json_output):
+    """LLM call options holding JSON output to the kind's schema"""
+    if not json_output:
+        return {}
+    return {'generation_config': {
+        'response_mime_type': 'application/json',
+        'response_schema': GENERATION_SCHEMAS[kind],
+    }}
+
+def cache_if_complete(cache_key, kind, items, count, stats):
+    """Cache only full results; a short one would be served for the whole TTL"""
+    if stats.get('errors'):
+        print(f"Generation: not caching {kind} after {stats['errors']} failed call(s)")
+    elif len(items) < count:
+        print(f"Generation: not caching {kind}, got {len(items)} of {count}")
+    else:
+        generation_cache.put(cache_key, kind, items)
+
+def generate_items_chunked(kind, build_prompt, study_text, count, difficulty,
+                           user_id=None, on_progress=None, stats=None):
+    """
+    Generate over all chunks of study_text, then top up any shortfall
+    with requests for only the missing count. stats (if given) gets the
+    number of malformed items 'dropped', of items 'topped_up' and of
+    chunk calls that failed ('errors').
+    """
+    dropped = []
+    errors = []
+
+    def run(total, existing, on_progress=None):
+        def generate_chunk(chunk, chunk_count):
+            try:
+                items, chunk_dropped = generate_items(
+                    kind, build_prompt, chunk, chunk_count, difficulty,
+                    user_id, existing
+                )
+            except Exception as e:
+                # The other chunks still count; the caller sees the error
+                print(f"Error generating {kind}: {e}")
+                errors.append(e)
+                return []
+            dropped.append(chunk_dropped)
+            return items
+
+        return generate_chunked(
+            study_text, total, generate_chunk,
+            max_chars=app.config['GENERATION_CHUNK_CHARS'],
+            max_workers=app.config['GENERATION_MAX_WORKERS'],
+            on_progress=on_progress
+        )
+
+    items = run(count, None, on_progress)
+    topped_up = 0
+    for _ in range(app.config['GENERATION_TOP_UP_ROUNDS']):
+        missing = count - len(items)
+        # Nothing at all means the generation failed; that is not a gap
+        if missing <= 0 or not items:
+            break
+        extra = dedupe_items(run(missing, items), exclude=items)[:missing]
+        if not extra:
+            break
+        print(f"Generation: topped up {len(extra)} of {missing} missing {kind} item(s)")
+        items = items + extra
+        topped_up += len(extra)
+
+    if stats is not None:
+        stats['dropped'] = stats.get('dropped', 0) + sum(dropped)
+        stats['topped_up'] = stats.get('topped_up', 0) + topped_up
+        stats['errors'] = stats.get('errors', 0) + len(errors)
+    return items
+
+def stream_items_chunked(stream_chunk, study_text, count, difficulty,
+                         user_id=None, failures=None):
+    """
+    generate_chunked_stream, followed by top-up requests if it came up
+    short. Chunk calls that fail mid-stream are appended to failures.
+    """
+    produced = []
+
+    def run(total, existing):
+        return generate_chunked_stream(
+            study_text, total,
+            lambda chunk, chunk_count: stream_chunk(
+                chunk, chunk_count, difficulty, user_id, existing, failures
+            ),
+            max_chars=app.config['GENERATION_CHUNK_CHARS'],
+            max_workers=app.config['GENERATION_MAX_WORKERS'],
+            exclude=existing or ()
+        )
+
+    items = run(count, None)
+    rounds = 0
+    while True:
+        try:
+            for item in items:
+                produced.append(item)
+                yield item
+        finally:
+            items.close()
+
+        missing = count - len(produced)
+        if (missing <= 0 or not produced or
+                rounds >= app.config['GENERATION_TOP_UP_ROUNDS']):
+            return
+        rounds += 1
+        items = run(missing, list(produced))
+
+def generate_items(kind, build_prompt, study_text, count, difficulty,
+                   user_id=None, existing=None):
+    """
+    One Gemini call; returns (items, dropped) and lets LLM errors
+    propagate. In JSON mode the model is held to the response schema and
+    every item is validated, so the text parser is only used if the
+    answer comes back in another format.
+    """
+    json_output = app.config['GENERATION_OUTPUT'] == 'json'
+    with metrics.stage('prompt_build'):
+        prompt = build_prompt(study_text, count, difficulty, json_output, existing)
+    with metrics.stage('llm'):
+        response = llm.generate(
+            prompt, MODEL_NAME, user_id=user_id,
+            **output_options(kind, json_output)
+        )
+
+    with metrics.stage('parse'):
+        items, dropped = parse_generated(response, kind)
+    if dropped:
+        print(f"Generation: dropped {dropped} malformed {kind} item(s)")
+    return items, dropped
+
+def stream_parsed(prompt, parser, user_id, what, failures=None, **options):
+    """
+    Feed Gemini's streamed answer through an incremental parser. An LLM
+    error ends the stream early and is appended to failures (if given).
+    """
+    stream = llm.generate_stream(prompt, MODEL_NAME, user_id=user_id, **options)
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(prompt)
-        return parse_mcqs(response.text)
+        for text in stream:
+            yield from parser.feed(text)
+        yield from parser.close()
+        if parser.dropped:
+            print(f"Generation: dropped {parser.dropped} malformed {what}")
+    except GeneratorExit:
+        raise
     except Exception as e:
-        print(f"Error generating MCQs: {e}")
-        return []
-
-def parse_mcqs(text):
-    mcqs = []
-    lines = text.strip().split('\n')
-    current_question = None
-    options = {}
-    correct_answer = None
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith('Q') and ':' in line:
-            if current_question and len(options) == 4 and correct_answer:
-                mcqs.append({
-                    "question": current_question,
-                    "options": options,
-                    "correct": correct_answer
-                })
-            current_question = line.split(':', 1)[1].strip()
-            options = {}
-            correct_answer = None
-        elif line.startswith(('A)', 'B)', 'C)', 'D)')):
-            option_letter = line[0]
-            option_text = line.split(')', 1)[1].strip()
-            options[option_letter] = option_text
-        elif line.startswith('CORRECT:'):
-            correct_answer = line.split(':', 1)[1].strip()
-
-    if current_question and len(options) == 4 and correct_answer:
-        mcqs.append({
-            "question": current_question,
-            "options": options,
-            "correct": correct_answer
-        })
-    return mcqs
+        # Like the non-streaming path: keep what was parsed so far
+        print(f"Error generating {what}: {e}")
+        if failures is not None:
+            failures.append(e)
+    finally:
+        stream.close()
+
+def cached_stream(cache_key, kind, items, count, failures):
+    """
+    Replay a cached result, or yield freshly generated items and cache
+    them once the generation ran to completion: no call in failures and
+    at least count items.
+    """
+    cached = generation_cache.get(cache_key)
+    if cached is not None:
+        items.close()
+        yield from cached
+        return
+
+    generated = []
+    try:
+        for item in items:
+            generated.append(item)
+            yield item
+    finally:
+        items.close()
+    cache_if_complete(cache_key, kind, generated, count,
+                      {'errors': len(failures)})
 
 # ============================================
 # AUTH ROUTES
@@ -457,34 +826,56 @@ def index():
         return redirect(url_for('dashboard'))
     return redirect(url_for('login'))
 
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    """Dashboard with optimized queries"""
-    stats = current_user.get_stats()
-    
+def dashboard_activity(user_id):
+    """Recent sets/exams and score history as plain, cacheable data"""
     recent_sets = FlashcardSet.query.filter_by(
-        user_id=current_user.id
+        user_id=user_id
     ).order_by(FlashcardSet.created_at.desc()).limit(5).all()
     
     recent_exams = ExamResult.query.filter_by(
-        user_id=current_user.id
+        user_id=user_id
     ).order_by(ExamResult.created_at.desc()).limit(5).all()
     
     exam_history = ExamResult.query.filter_by(
-        user_id=current_user.id
+        user_id=user_id
     ).order_by(ExamResult.created_at.asc()).limit(10).all()
     
-    exam_data = {
-        'labels': [e.created_at.strftime('%m/%d') for e in exam_history],
-        'scores': [e.percentage for e in exam_history]
+    return {
+        'recent_sets': [{
+            'name': s.name,
+            'card_count': s.card_count,
+            'difficulty': s.difficulty,
+            'created_at': s.created_at
+        } for s in recent_sets],
+        'recent_exams': [{
+            'exam_name': e.exam_name,
+            'score': e.score,
+            'total_questions': e.total_questions,
+            'percentage': e.percentage,
+            'created_at': e.created_at
+        } for e in recent_exams],
+        'exam_data': {
+            'labels': [e.created_at.strftime('%m/%d') for e in exam_history],
+            'scores': [e.percentage for e in exam_history]
+        }
     }
+
+@app.route('/dashboard')
+@query_budget(20)
+@login_required
+def dashboard():
+    """Dashboard with optimized queries"""
+    stats = current_user.get_stats()
+    activity = response_cache.get_or_compute(
+        current_user.id, 'dashboard',
+        lambda: dashboard_activity(current_user.id)
+    )
     
     return render_template('dashboard.html',
                            stats=stats,
-                           recent_sets=recent_sets,
-                           recent_exams=recent_exams,
-                           exam_data=exam_data)
+                           recent_sets=activity['recent_sets'],
+                           recent_exams=activity['recent_exams'],
+                           exam_data=activity['exam_data'])
 
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
@@ -639,10 +1030,24 @@ def profile():
                     except:
                         pass
             
-            FlashcardSet.query.filter_by(user_id=current_user.id).delete()
+            # Queued page views of this user must reach the table before
+            # they are detached from the account below
+            page_view_buffer.flush()
+            PageViewUserDaily.query.filter_by(user_id=current_user.id).delete()
+            # Keep the visits in the site totals, without the account
+            PageView.query.filter_by(user_id=current_user.id).update(
+                {'user_id': None}, synchronize_session=False
+            )
+            SetPerformance.query.filter_by(user_id=current_user.id).delete()
             ExamResult.query.filter_by(user_id=current_user.id).delete()
+            FlashcardSet.query.filter_by(user_id=current_user.id).delete()
             StudySession.query.filter_by(user_id=current_user.id).delete()
             ChatMessage.query.filter_by(user_id=current_user.id).delete()
+            ChatSummary.query.filter_by(user_id=current_user.id).delete()
+            GenerationJob.query.filter_by(user_id=current_user.id).delete()
+            UserStats.query.filter_by(user_id=current_user.id).delete()
+            artifact_store.delete_user(current_user.id)
+            response_cache.invalidate_user(current_user.id)
             
             db.session.delete(current_user)
             db.session.commit()
@@ -658,16 +1063,26 @@ def profile():
     return render_template('profile.html', stats=stats)
 
 @app.route('/analytics')
+@query_budget(15)
 @login_required
 def analytics():
     """Advanced analytics dashboard"""
+    today = datetime.utcnow().date()
+    data = response_cache.get_or_compute(
+        current_user.id, 'analytics',
+        lambda: analytics_data(current_user.id, today),
+        extra=today
+    )
+    return render_template('analytics.html', **data)
+
+def analytics_data(user_id, today):
+    """Everything analytics.html shows, for user_id as of today"""
     from sqlalchemy import func, extract
     
-    today = datetime.utcnow().date()
     ninety_days_ago = today - timedelta(days=90)
     
     sessions = StudySession.query.filter(
-        StudySession.user_id == current_user.id,
+        StudySession.user_id == user_id,
         StudySession.created_at >= ninety_days_ago
     ).all()
     
@@ -677,13 +1092,15 @@ def analytics():
         heatmap_data[date_key] = heatmap_data.get(date_key, 0) + 1
     
     thirty_days_ago = today - timedelta(days=30)
+    # Typed as Date so SQLite's text result comes back as a date too
+    study_day = func.date(StudySession.created_at, type_=db.Date)
     daily_time = db.session.query(
-        func.date(StudySession.created_at).label('date'),
+        study_day.label('date'),
         func.sum(StudySession.duration_minutes).label('total_minutes')
     ).filter(
-        StudySession.user_id == current_user.id,
+        StudySession.user_id == user_id,
         StudySession.created_at >= thirty_days_ago
-    ).group_by(func.date(StudySession.created_at)).all()
+    ).group_by(study_day).all()
     
     time_per_day = {
         'labels': [d.date.strftime('%m/%d') if d.date else '' for d in daily_time],
@@ -695,7 +1112,7 @@ def analytics():
         func.avg(ExamResult.percentage).label('avg_score'),
         func.count(ExamResult.id).label('count')
     ).filter(
-        ExamResult.user_id == current_user.id
+        ExamResult.user_id == user_id
     ).group_by(ExamResult.difficulty).all()
     
     difficulty_data = {
@@ -704,31 +1121,34 @@ def analytics():
         'counts': [d.count for d in difficulty_stats]
     }
     
+    avg_score = SetPerformance.total_percentage / SetPerformance.exam_count
     set_performance = db.session.query(
         FlashcardSet.name,
-        func.avg(ExamResult.percentage).label('avg_score'),
-        func.count(ExamResult.id).label('exam_count')
+        avg_score.label('avg_score'),
+        SetPerformance.exam_count
     ).join(
-        ExamResult,
-        ExamResult.user_id == current_user.id
+        FlashcardSet, FlashcardSet.id == SetPerformance.flashcard_set_id
     ).filter(
-        FlashcardSet.user_id == current_user.id
-    ).group_by(FlashcardSet.name).all()
-    
-    sorted_sets = sorted(
-        [(s.name, s.avg_score or 0, s.exam_count) for s in set_performance],
-        key=lambda x: x[1],
-        reverse=True
+        SetPerformance.user_id == user_id,
+        SetPerformance.exam_count > 0
     )
     
-    best_sets = sorted_sets[:5] if len(sorted_sets) > 0 else []
-    worst_sets = sorted_sets[-5:][::-1] if len(sorted_sets) > 5 else []
+    best_sets = [
+        (s.name, s.avg_score or 0, s.exam_count)
+        for s in set_performance.order_by(avg_score.desc()).limit(5)
+    ]
+    worst_sets = []
+    if set_performance.count() > 5:
+        worst_sets = [
+            (s.name, s.avg_score or 0, s.exam_count)
+            for s in set_performance.order_by(avg_score.asc()).limit(5)
+        ]
     
     hourly_activity = db.session.query(
         extract('hour', StudySession.created_at).label('hour'),
         func.count(StudySession.id).label('count')
     ).filter(
-        StudySession.user_id == current_user.id
+        StudySession.user_id == user_id
     ).group_by(extract('hour', StudySession.created_at)).all()
     
     hour_data = {hour: 0 for hour in range(24)}
@@ -740,16 +1160,17 @@ def analytics():
     total_sessions = len(sessions)
     avg_session_length = total_study_time / total_sessions if total_sessions > 0 else 0
     
-    return render_template('analytics.html',
-                           heatmap_data=heatmap_data,
-                           time_per_day=time_per_day,
-                           difficulty_data=difficulty_data,
-                           best_sets=best_sets,
-                           worst_sets=worst_sets,
-                           hour_data=hour_data,
-                           total_study_time=total_study_time,
-                           total_sessions=total_sessions,
-                           avg_session_length=round(avg_session_length, 1))
+    return {
+        'heatmap_data': heatmap_data,
+        'time_per_day': time_per_day,
+        'difficulty_data': difficulty_data,
+        'best_sets': best_sets,
+        'worst_sets': worst_sets,
+        'hour_data': hour_data,
+        'total_study_time': total_study_time,
+        'total_sessions': total_sessions,
+        'avg_session_length': round(avg_session_length, 1)
+    }
 
 @app.route('/toggle-dark-mode', methods=['POST'])
 @login_required
@@ -765,9 +1186,210 @@ def toggle_dark_mode():
 @app.route('/study')
 @login_required
 def study():
-    return render_template('study.html')
+    return render_template(
+        'study.html', generation_mode=app.config['STUDY_GENERATION_MODE']
+    )
+
+def load_study_text(filepath, num_cards):
+    with metrics.stage('extract'):
+        study_text = extract_text_from_file(filepath, num_cards)
+    if not study_text or len(study_text) < 50:
+        raise JobError('Could not extract enough text from file')
+    return study_text
+
+def load_upload_text(filename, data, num_cards):
+    """Study text from uploaded file contents, via a temporary file"""
+    # Keep concurrent uploads of the same name apart
+    filepath = os.path.join(
+        app.config['UPLOAD_FOLDER'], f'{secrets.token_hex(8)}_{filename}'
+    )
+    with open(filepath, 'wb') as f:
+        f.write(data)
+    try:
+        return load_study_text(filepath, num_cards)
+    finally:
+        os.remove(filepath)
+
+def create_flashcard_set(study_text, num_cards, difficulty, set_name,
+                         user_id, scope, report=None):
+    """Generate and save a flashcard set (request or job)"""
+    report = report or (lambda stage, progress: None)
+
+    report('generating', 0.2)
+    stats = {}
+    flashcards = generate_flashcards(
+        study_text, num_cards, difficulty, user_id=user_id,
+        on_progress=lambda done, total: report(
+            'generating', 0.2 + 0.7 * done / total
+        ),
+        stats=stats
+    )
+
+    if not flashcards:
+        raise JobError('Failed to generate flashcards', 500)
+
+    report('saving', 0.95)
+    save_flashcard_set(
+        flashcards, study_text, set_name, difficulty, user_id, scope
+    )
+    return {
+        'flashcards': flashcards,
+        'count': len(flashcards),
+        'dropped': stats.get('dropped', 0),
+        'topped_up': stats.get('topped_up', 0)
+    }
+
+def save_flashcard_set(flashcards, study_text, set_name, difficulty,
+                       user_id, scope):
+    with metrics.stage('db'):
+        flashcard_set = FlashcardSet(
+            user_id=user_id,
+            name=set_name,
+            card_count=len(flashcards),
+            difficulty=difficulty
+        )
+        db.session.add(flashcard_set)
+
+        session = StudySession(
+            user_id=user_id,
+            activity_type='flashcard'
+        )
+        db.session.add(session)
+        db.session.commit()
+
+        artifact_store.put('flashcards', flashcards, scope=scope)
+        artifact_store.put('study_text', study_text, scope=scope)
+        artifact_store.put('flashcard_set_id', flashcard_set.id, scope=scope)
+    return flashcard_set
+
+def exam_study_text(scope):
+    study_text = artifact_store.get('study_text', scope=scope)
+    if study_text is None:
+        raise JobError('Please upload a file first!')
+
+    if not study_text or len(study_text) < 50:
+        raise JobError('Not enough study material')
+    return study_text
+
+def create_exam(num_questions, difficulty, user_id, scope, report=None):
+    """Generate and store an exam from the last uploaded material"""
+    report = report or (lambda stage, progress: None)
+    study_text = exam_study_text(scope)
+
+    report('generating', 0.1)
+    stats = {}
+    mcqs = generate_mcq_exam(
+        study_text, num_questions, difficulty, user_id=user_id,
+        on_progress=lambda done, total: report(
+            'generating', 0.1 + 0.8 * done / total
+        ),
+        stats=stats
+    )
+
+    if not mcqs:
+        raise JobError('Failed to generate exam', 500)
+
+    report('saving', 0.95)
+    save_exam(mcqs, scope)
+    return {
+        'mcqs': mcqs,
+        'count': len(mcqs),
+        'dropped': stats.get('dropped', 0),
+        'topped_up': stats.get('topped_up', 0)
+    }
+
+def save_exam(mcqs, scope):
+    with metrics.stage('db'):
+        artifact_store.put('exam', mcqs, scope=scope)
+        # Exams are scored against the set they were generated from
+        artifact_store.put(
+            'exam_set_id',
+            artifact_store.get('flashcard_set_id', scope=scope),
+            scope=scope
+        )
+
+@job_queue.register('flashcards')
+def flashcards_job(params, report, user_id, scope):
+    report('extracting', 0.05)
+    study_text = load_upload_text(
+        params['filename'], base64.b64decode(params['upload']),
+        params['num_cards']
+    )
+    return create_flashcard_set(
+        study_text, params['num_cards'], params['difficulty'],
+        params['set_name'], user_id, scope, report
+    )
+
+@job_queue.register('exam')
+def exam_job(params, report, user_id, scope):
+    return create_exam(
+        params['num_questions'], params['difficulty'], user_id, scope, report
+    )
+
+def request_mode():
+    """'async' for a background job, 'stream' for server-sent events"""
+    return request.form.get('mode') or request.args.get('mode')
+
+def wants_async():
+    return request_mode() == 'async'
+
+def wants_stream():
+    return request_mode() == 'stream'
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def stream_generation(event, items, save, empty_error):
+    """
+    SSE body for mode=stream: one `event` per item as soon as it is
+    parsed, then save(items) and a 'done' event. If the client goes
+    away first, generation stops and nothing is saved.
+    """
+    def generate():
+        generated = []
+        try:
+            yield sse_event('stage', {'stage': 'generating'})
+            for item in items:
+                generated.append(item)
+                yield sse_event(event, {
+                    'index': len(generated) - 1, 'item': item
+                })
+            if not generated:
+                raise JobError(empty_error, 500)
+
+            yield sse_event('stage', {'stage': 'saving'})
+            save(generated)
+            yield sse_event('done', {'count': len(generated)})
+        except GeneratorExit:
+            print("Generation stream: client disconnected")
+            raise
+        except JobError as e:
+            yield sse_event('error', {'error': str(e)})
+        except Exception as e:
+            print(f"Generation stream error: {e}")
+            db.session.rollback()
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            items.close()
+
+    return sse_response(generate())
+
+def job_accepted(job_id):
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('job_status', job_id=job_id)
+    }), 202
 
 @app.route('/generate', methods=['POST'])
+@query_budget(30)
 @login_required
 def generate():
     try:
@@ -789,101 +1411,98 @@ def generate():
             f'Study Set - {datetime.now().strftime("%Y-%m-%d")}'
         )
 
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-
-        study_text = extract_text_from_file(filepath)
-
-        if not study_text or len(study_text) < 50:
-            return jsonify({
-                'success': False,
-                'error': 'Could not extract enough text from file'
-            }), 400
-
-        flashcards = generate_flashcards(study_text, num_cards, difficulty)
-
-        if not flashcards:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to generate flashcards'
-            }), 500
-
-        flashcard_set = FlashcardSet(
-            user_id=current_user.id,
-            name=set_name,
-            card_count=len(flashcards),
-            difficulty=difficulty
+        user_id, session_key = artifact_store.current_scope()
+        if wants_async():
+            # Extraction runs in the job too; the file travels in the job
+            # row so any worker host can run it
+            with metrics.stage('upload'):
+                upload = base64.b64encode(file.read()).decode('ascii')
+            job_id = job_queue.enqueue('flashcards', {
+                'filename': secure_filename(file.filename),
+                'upload': upload,
+                'num_cards': num_cards,
+                'difficulty': difficulty,
+                'set_name': set_name
+            }, user_id, session_key)
+            return job_accepted(job_id)
+
+        with metrics.stage('upload'):
+            data = file.read()
+        study_text = load_upload_text(
+            secure_filename(file.filename), data, num_cards
         )
-        db.session.add(flashcard_set)
 
-        session = StudySession(
-            user_id=current_user.id,
-            activity_type='flashcard'
+        if wants_stream():
+            scope = (user_id, session_key)
+            return stream_generation(
+                'card',
+                stream_flashcards(study_text, num_cards, difficulty, user_id),
+                lambda flashcards: save_flashcard_set(
+                    flashcards, study_text, set_name, difficulty,
+                    user_id, scope
+                ),
+                'Failed to generate flashcards'
+            )
+
+        result = create_flashcard_set(
+            study_text, num_cards, difficulty, set_name,
+            user_id, (user_id, session_key)
         )
-        db.session.add(session)
-        db.session.commit()
-
-        with open('/tmp/last_flashcards.json', 'w') as f:
-            json.dump(flashcards, f)
-
-        with open('/tmp/last_study_text.txt', 'w', encoding='utf-8') as f:
-            f.write(study_text)
-
-        return jsonify({
-            'success': True,
-            'flashcards': flashcards,
-            'count': len(flashcards)
-        })
+        return jsonify({'success': True, **result})
 
+    except JobError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         print(f"Generate error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/generate-exam', methods=['POST'])
+@query_budget(20)
 @login_required
 def generate_exam():
     try:
         num_questions = int(request.form.get('num_questions', 10))
         difficulty = request.form.get('difficulty', 'medium')
 
-        try:
-            with open('/tmp/last_study_text.txt', 'r', encoding='utf-8') as f:
-                study_text = f.read()
-        except FileNotFoundError:
-            return jsonify({
-                'success': False,
-                'error': 'Please upload a file first!'
-            }), 400
-
-        if not study_text or len(study_text) < 50:
-            return jsonify({
-                'success': False,
-                'error': 'Not enough study material'
-            }), 400
-
-        mcqs = generate_mcq_exam(study_text, num_questions, difficulty)
-
-        if not mcqs:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to generate exam'
-            }), 500
-
-        with open('/tmp/last_exam.json', 'w') as f:
-            json.dump(mcqs, f)
-
-        return jsonify({
-            'success': True,
-            'mcqs': mcqs,
-            'count': len(mcqs)
-        })
+        user_id, session_key = artifact_store.current_scope()
+        if wants_async():
+            job_id = job_queue.enqueue('exam', {
+                'num_questions': num_questions,
+                'difficulty': difficulty
+            }, user_id, session_key)
+            return job_accepted(job_id)
+
+        if wants_stream():
+            scope = (user_id, session_key)
+            study_text = exam_study_text(scope)
+            return stream_generation(
+                'mcq',
+                stream_mcq_exam(study_text, num_questions, difficulty, user_id),
+                lambda mcqs: save_exam(mcqs, scope),
+                'Failed to generate exam'
+            )
+
+        result = create_exam(
+            num_questions, difficulty, user_id, (user_id, session_key)
+        )
+        return jsonify({'success': True, **result})
 
+    except JobError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         print(f"Generate exam error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    status = job_queue.status(job_id, current_user.id)
+    if status is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, **status})
+
 @app.route('/submit-exam', methods=['POST'])
+@query_budget(20)
 @login_required
 def submit_exam():
     try:
@@ -891,8 +1510,12 @@ def submit_exam():
         user_answers = data.get('answers', {})
         time_taken = data.get('time_taken', '0:00')
 
-        with open('/tmp/last_exam.json', 'r') as f:
-            mcqs = json.load(f)
+        mcqs = artifact_store.get('exam')
+        if mcqs is None:
+            return jsonify({
+                'success': False,
+                'error': 'No exam in progress. Please generate an exam first.'
+            }), 400
 
         total = len(mcqs)
         correct_count = 0
@@ -921,6 +1544,7 @@ def submit_exam():
 
         exam_result = ExamResult(
             user_id=current_user.id,
+            flashcard_set_id=artifact_store.get('exam_set_id'),
             exam_name=f'Exam - {datetime.now().strftime("%Y-%m-%d %H:%M")}',
             score=correct_count,
             total_questions=total,
@@ -950,30 +1574,32 @@ def submit_exam():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/download/<format>')
+@query_budget(5)
 @login_required
 def download(format):
     try:
-        with open('/tmp/last_flashcards.json', 'r') as f:
-            flashcards = json.load(f)
+        flashcards = artifact_store.get('flashcards')
+        if flashcards is None:
+            return "No flashcards to download. Please generate flashcards first.", 404
 
         if format == 'txt':
-            filename = '/tmp/flashcards.txt'
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write("="*50 + "\n")
-                f.write("YOUR AI-GENERATED FLASHCARDS\n")
-                f.write("="*50 + "\n\n")
-                for i, card in enumerate(flashcards, 1):
-                    f.write(f"CARD {i}\n")
-                    f.write(f"Q: {card['question']}\n")
-                    f.write(f"A: {card['answer']}\n")
-                    f.write("-"*50 + "\n\n")
-            return send_file(filename, as_attachment=True, download_name='flashcards.txt')
+            f = io.StringIO()
+            f.write("="*50 + "\n")
+            f.write("YOUR AI-GENERATED FLASHCARDS\n")
+            f.write("="*50 + "\n\n")
+            for i, card in enumerate(flashcards, 1):
+                f.write(f"CARD {i}\n")
+                f.write(f"Q: {card['question']}\n")
+                f.write(f"A: {card['answer']}\n")
+                f.write("-"*50 + "\n\n")
+            data = io.BytesIO(f.getvalue().encode('utf-8'))
+            return send_file(data, as_attachment=True, download_name='flashcards.txt',
+                             mimetype='text/plain')
 
         elif format == 'json':
-            filename = '/tmp/flashcards.json'
-            with open(filename, 'w') as f:
-                json.dump(flashcards, f, indent=2)
-            return send_file(filename, as_attachment=True, download_name='flashcards.json')
+            data = io.BytesIO(json.dumps(flashcards, indent=2).encode('utf-8'))
+            return send_file(data, as_attachment=True, download_name='flashcards.json',
+                             mimetype='application/json')
 
         else:
             return "Invalid format", 400
@@ -995,63 +1621,73 @@ def chat():
     messages = list(reversed(messages))
     return render_template('chat.html', messages=messages)
 
-@app.route('/api/chat', methods=['POST'])
-@login_required
-def send_chat_message():
-    try:
-        data = request.get_json()
-        user_message = data.get('message', '').strip()
-        action = data.get('action', 'chat')
+def save_user_chat_message():
+    """Validate and store the student's message; returns (message, action)"""
+    data = request.get_json() or {}
+    user_message = data.get('message', '').strip()
+    action = data.get('action', 'chat')
+    if not user_message:
+        return None, action
+
+    user_chat = ChatMessage(
+        user_id=current_user.id,
+        role='user',
+        message=user_message
+    )
+    db.session.add(user_chat)
+    db.session.commit()
+    return user_message, action
 
-        if not user_message:
-            return jsonify({
-                'success': False,
-                'error': 'Message cannot be empty'
-            }), 400
+def summarize_chat_history(previous_summary, transcript):
+    """Fold older chat turns into the running summary"""
+    prompt = f"""Update the running summary of a tutoring chat.
+Keep the topics covered, what the student struggled with and any
+open questions. Use at most 120 words.
 
-        user_chat = ChatMessage(
-            user_id=current_user.id,
-            role='user',
-            message=user_message
-        )
-        db.session.add(user_chat)
-        db.session.commit()
+Current summary:
+{previous_summary or "(none)"}
 
-        study_context = ""
-        try:
-            with open('/tmp/last_study_text.txt', 'r', encoding='utf-8') as f:
-                study_context = f.read()[:2000]
-        except:
-            study_context = ""
+New turns:
+{transcript}
 
-        recent_messages = ChatMessage.query.filter_by(
-            user_id=current_user.id
-        ).order_by(ChatMessage.created_at.desc()).limit(10).all()
+Updated summary:"""
+    return llm.generate(prompt, MODEL_NAME)
 
-        chat_history = ""
-        for msg in reversed(recent_messages[1:]):
-            chat_history += f"{msg.role}: {msg.message}\n"
+chat_context.summarizer = summarize_chat_history
 
-        if action == 'explain':
-            system_prompt = f"""You are a helpful study buddy and tutor.
+def build_chat_prompt(user_id, user_message, action):
+    """Prompt for the study buddy from study material and recent history"""
+    study_context = ""
+    try:
+        study_context = chat_context.study_context(
+            artifact_store.get('study_text') or ""
+        )
+    except Exception:
+        db.session.rollback()
+        study_context = ""
+
+    chat_history = chat_context.history(user_id)
+
+    if action == 'explain':
+        system_prompt = f"""You are a helpful study buddy and tutor.
 Study Material Context: {study_context}
 Previous conversation: {chat_history}
 Explain this concept simply with examples and analogies."""
 
-        elif action == 'quiz':
-            system_prompt = f"""You are a quiz master.
+    elif action == 'quiz':
+        system_prompt = f"""You are a quiz master.
 Study Material: {study_context if study_context else "General knowledge"}
 Ask ONE challenging but fair question. After they answer, explain."""
 
-        elif action == 'flashcards':
-            system_prompt = f"""You are a flashcard creator.
+    elif action == 'flashcards':
+        system_prompt = f"""You are a flashcard creator.
 Suggest 5 key flashcard questions.
 Format:
 1. Q: [Question] | A: [Answer]
 Make questions test understanding."""
 
-        else:
-            system_prompt = f"""You are an AI study buddy.
+    else:
+        system_prompt = f"""You are an AI study buddy.
 Study Material Context: {study_context}
 Previous conversation: {chat_history}
 Guidelines:
@@ -1059,24 +1695,42 @@ Guidelines:
 - Explain concepts clearly
 - Keep responses concise (2-3 paragraphs max)"""
 
-        full_prompt = (
-            f"{system_prompt}\n\n"
-            f"Student: {user_message}\n\n"
-            f"AI Study Buddy:"
-        )
- 
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        response = model.generate_content(full_prompt)
+    full_prompt = (
+        f"{system_prompt}\n\n"
+        f"Student: {user_message}\n\n"
+        f"AI Study Buddy:"
+    )
+    return full_prompt
 
-        ai_response = response.text
+def save_assistant_chat_message(text):
+    ai_chat = ChatMessage(
+        user_id=current_user.id,
+        role='assistant',
+        message=text
+    )
+    db.session.add(ai_chat)
+    db.session.commit()
+    chat_context.schedule_update(current_user.id)
+    return ai_chat
 
-        ai_chat = ChatMessage(
-            user_id=current_user.id,
-            role='assistant',
-            message=ai_response
+@app.route('/api/chat', methods=['POST'])
+@query_budget(15)
+@login_required
+def send_chat_message():
+    try:
+        user_message, action = save_user_chat_message()
+        if not user_message:
+            return jsonify({
+                'success': False,
+                'error': 'Message cannot be empty'
+            }), 400
+
+        full_prompt = build_chat_prompt(current_user.id, user_message, action)
+ 
+        ai_response = llm.generate(
+            full_prompt, MODEL_NAME, user_id=current_user.id
         )
-        db.session.add(ai_chat)
-        db.session.commit()
+        ai_chat = save_assistant_chat_message(ai_response)
 
         return jsonify({
             'success': True,
@@ -1084,15 +1738,75 @@ Guidelines:
             'timestamp': ai_chat.created_at.strftime('%I:%M %p')
         })
 
+    except LLMError as e:
+        print(f"Chat error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         print(f"Chat error: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+@query_budget(15)
+@login_required
+def stream_chat_message():
+    """
+    Same as /api/chat, but relays the answer as server-sent events while
+    Gemini generates it: 'delta' events with text, then one 'done' event.
+    The assistant message is stored once the stream ends; if the client
+    goes away first, generation stops and the partial answer is stored.
+    """
+    try:
+        user_message, action = save_user_chat_message()
+        if not user_message:
+            return jsonify({
+                'success': False,
+                'error': 'Message cannot be empty'
+            }), 400
+        full_prompt = build_chat_prompt(current_user.id, user_message, action)
+    except Exception as e:
+        print(f"Chat error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    def generate():
+        parts = []
+        ai_chat = None
+        stream = llm.generate_stream(
+            full_prompt, MODEL_NAME, user_id=current_user.id
+        )
+        try:
+            for text in stream:
+                parts.append(text)
+                yield sse_event('delta', {'text': text})
+        except GeneratorExit:
+            # Client went away: stop reading from Gemini, keep what we have
+            print("Chat stream: client disconnected")
+            raise
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            # Frees the gateway slot even when the client disconnected
+            stream.close()
+            if parts:
+                try:
+                    ai_chat = save_assistant_chat_message(''.join(parts))
+                except Exception as e:
+                    print(f"Chat stream save error: {e}")
+                    db.session.rollback()
+
+        if ai_chat is not None:
+            yield sse_event('done', {
+                'timestamp': ai_chat.created_at.strftime('%I:%M %p')
+            })
+
+    return sse_response(generate())
+
 @app.route('/api/chat/clear', methods=['POST'])
 @login_required
 def clear_chat():
     try:
         ChatMessage.query.filter_by(user_id=current_user.id).delete()
+        chat_context.clear(current_user.id)
         db.session.commit()
         return jsonify({'success': True})
     except Exception as e:
@@ -1125,6 +1839,7 @@ def export_chat():
         return str(e), 500
 
 @app.route('/admin')
+@query_budget(60)
 @login_required
 def admin():
     """Enhanced admin page with visitor stats"""
@@ -1133,44 +1848,80 @@ def admin():
         flash('Access denied. Admin only.')
         return redirect(url_for('dashboard'))
     
-    from sqlalchemy import func, distinct
+    from sqlalchemy import func
     
-    all_users = User.query.order_by(User.created_at.desc()).all()
-    user_stats = []
-    for user in all_users:
-        stats = user.get_stats()
-        user_stats.append({
-            'user': user,
-            'stats': stats
-        })
+    # Make this worker's pending page views visible in the numbers below
+    page_view_buffer.flush()
     
-    total_users = len(all_users)
-    total_flashcards = sum(s['stats']['total_flashcards'] for s in user_stats)
-    total_exams = sum(s['stats']['total_exams'] for s in user_stats)
+    # Traffic numbers come from the daily rollups plus the uncompacted tail
+    maybe_compact(timedelta(seconds=app.config['ROLLUP_INTERVAL']))
     
-    today = datetime.utcnow().date()
+    # Users created before user_stats existed get backfilled first
+    missing = [uid for (uid,) in db.session.query(User.id).outerjoin(
+        UserStats, UserStats.user_id == User.id
+    ).filter(UserStats.user_id.is_(None))]
+    if missing:
+        rebuild_user_stats(missing)
+    
+    # User table: one paginated join against the materialized user_stats
+    sort_columns = {
+        'joined': User.created_at,
+        'username': User.username,
+        'cards': UserStats.total_flashcards,
+        'exams': UserStats.total_exams,
+        'avg_score': (UserStats.total_percentage /
+                      func.nullif(UserStats.total_exams, 0)),
+    }
+    sort = request.args.get('sort', 'joined')
+    if sort not in sort_columns:
+        sort = 'joined'
+    order = 'asc' if request.args.get('order') == 'asc' else 'desc'
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+    search = request.args.get('q', '').strip()
+    
+    users_query = db.session.query(User, UserStats).join(
+        UserStats, UserStats.user_id == User.id
+    )
+    if search:
+        pattern = f'%{search}%'
+        users_query = users_query.filter(
+            User.username.ilike(pattern) | User.email.ilike(pattern)
+        )
     
-    total_page_views = PageView.query.count()
+    sort_column = sort_columns[sort]
+    sort_column = sort_column.asc() if order == 'asc' else sort_column.desc()
+    matching_users = users_query.count()
+    rows = users_query.order_by(sort_column, User.id.desc()).offset(
+        (page - 1) * per_page
+    ).limit(per_page).all()
     
-    unique_visitors = db.session.query(
-        func.count(distinct(PageView.ip_address))
-    ).scalar() or 0
+    user_stats = []
+    for user, row in rows:
+        user_stats.append({
+            'user': user,
+            'stats': stats_dict(row)
+        })
     
-    today_views = PageView.query.filter(
-        func.date(PageView.created_at) == today
-    ).count()
+    total_pages = max((matching_users + per_page - 1) // per_page, 1)
+    pagination = {
+        'page': page,
+        'per_page': per_page,
+        'total': matching_users,
+        'pages': total_pages,
+        'sort': sort,
+        'order': order,
+        'q': search,
+    }
     
-    week_ago = today - timedelta(days=7)
-    week_views = PageView.query.filter(
-        PageView.created_at >= week_ago
-    ).count()
+    total_users = User.query.count()
+    total_flashcards, total_exams = db.session.query(
+        func.coalesce(func.sum(UserStats.total_flashcards), 0),
+        func.coalesce(func.sum(UserStats.total_exams), 0)
+    ).one()
     
-    popular_pages = db.session.query(
-        PageView.page,
-        func.count(PageView.id).label('count')
-    ).group_by(PageView.page).order_by(
-        func.count(PageView.id).desc()
-    ).limit(10).all()
+    traffic = traffic_summary()
+    live_traffic = traffic_counters.summary()
     
     recent_visitors = PageView.query.order_by(
         PageView.created_at.desc()
@@ -1178,17 +1929,31 @@ def admin():
     
     return render_template('admin.html',
                            user_stats=user_stats,
+                           pagination=pagination,
                            total_users=total_users,
                            total_flashcards=total_flashcards,
                            total_exams=total_exams,
-                           total_page_views=total_page_views,
-                           unique_visitors=unique_visitors,
-                           today_views=today_views,
-                           week_views=week_views,
-                           popular_pages=popular_pages,
+                           total_page_views=traffic['total_page_views'],
+                           unique_visitors=traffic['unique_visitors'],
+                           today_views=traffic['today_views'],
+                           week_views=traffic['week_views'],
+                           popular_pages=traffic['popular_pages'],
+                           unique_today=live_traffic['unique_today'],
+                           unique_week=live_traffic['unique_week'],
+                           trending_pages=live_traffic['trending_pages'],
+                           response_cache=response_cache.get_stats(),
                            recent_visitors=recent_visitors)
 
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and not (current_user.is_authenticated and current_user.id == 1):
+        return "Access denied", 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/stats')
+@query_budget(5)
 @login_required
 def get_stats():
     stats = current_user.get_stats()